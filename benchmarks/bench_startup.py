@@ -0,0 +1,83 @@
+"""
+Startup time benchmark for tau
+
+Times fresh Python processes that only import tau or print its --help text, which is the fixed overhead every call of
+tau from a script pays before doing any work. Also lists the modules that take the longest to import.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+TAU_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "import": [sys.executable, "-c", "import tau"],
+    "help": [sys.executable, os.path.join(TAU_DIR, "tau.py"), "--help"],
+}
+
+
+def time_command(command, repeat: int):
+    """
+    Run a command several times and time each run
+    :param command: The command and its arguments
+    :param repeat: The number of runs
+    :return: A list of the wall-clock time of each run in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=TAU_DIR, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def slowest_imports(count: int):
+    """
+    Find the modules that take the longest to import along with tau, using python -X importtime
+    :param count: How many modules to return
+    :return: A list of (module, cumulative import time in seconds) tuples, slowest first
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import tau"], cwd=TAU_DIR, check=True,
+                            stderr=subprocess.PIPE, text=True)
+
+    imports = []
+    for line in result.stderr.splitlines()[1:]:  # The first line is the header
+        _, cumulative, module = line.split("|")
+        imports.append((module.strip(), int(cumulative) / 1e6))
+
+    # Only count top-level modules, their submodules are already included in their cumulative time
+    imports = [(module, seconds) for module, seconds in imports if "." not in module and module != "tau"]
+    return sorted(imports, key=lambda i: i[1], reverse=True)[:count]
+
+
+@click.command()
+@click.option("--repeat", "-n", default=10, help="number of runs of each command")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="also save the results to a JSON file")
+def main(repeat: int, output: str):
+    """
+    Benchmark how long tau takes to start up
+    """
+    results = {}
+    for name, command in COMMANDS.items():
+        times = time_command(command, repeat)
+        results[name] = {"min": min(times), "median": statistics.median(times), "max": max(times)}
+        print(f"{name:>8}: min {1000 * min(times):7.1f} ms, median {1000 * statistics.median(times):7.1f} ms, "
+              f"max {1000 * max(times):7.1f} ms")
+
+    results["slowest_imports"] = slowest_imports(5)
+    print("Slowest imports:")
+    for module, seconds in results["slowest_imports"]:
+        print(f"  {module:<24} {1000 * seconds:7.1f} ms")
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Benchmark suite for tau
+
+Times the building blocks of a sweep (transform_orientations, get_max_thrust and calc_max_yaw_pitch_roll), wrench
+zonotope queries, control allocation and envelope table lookups one call at a time, and whole sweeps across a matrix of
+resolutions and thruster counts. The layouts are the ones in benchmarks/layouts, named after their thruster count, so
+results from different runs are comparable.
+
+Results are printed as a table and saved as JSON, along with enough about the machine and the code to tell runs apart.
+"""
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import click
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import tau  # noqa: E402 (tau lives in the directory above)
+
+LAYOUT_DIR = os.path.join(BENCHMARK_DIR, "layouts")
+DEFAULT_RESOLUTIONS = "25,50,100,200,400"
+DEFAULT_COUNTS = "4,6,8,12,32"
+
+
+def load_layouts(counts):
+    """
+    Load the canonical layouts with the given thruster counts
+    :param counts: The thruster counts to load
+    :return: A dict mapping each count to the name of its layout and its ThrusterSet
+    """
+    layouts = {}
+    for path in sorted(glob.glob(os.path.join(LAYOUT_DIR, "*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        count = int(name.split("_")[0])
+        if count in counts:
+            with open(path) as f:
+                layouts[count] = (name, tau.load_thrusters(json.load(f)))
+
+    missing = set(counts) - set(layouts)
+    if missing:
+        raise click.BadParameter(f"no layouts with {sorted(missing)} thrusters in {LAYOUT_DIR}",
+                                 param_hint="--counts")
+    return dict(sorted(layouts.items()))
+
+
+def latency_stats(times):
+    """
+    Summarize the times of a batch of calls
+    :param times: The time of each call in seconds
+    :return: A dict of the number of calls, calls per second and latency percentiles in microseconds
+    """
+    times = np.asarray(times)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99]) * 1e6
+    return {"calls": len(times), "calls_per_s": len(times) / times.sum(), "p50_us": p50, "p90_us": p90,
+            "p99_us": p99, "max_us": times.max() * 1e6}
+
+
+def time_calls(function, arguments):
+    """
+    Time a function on each of a list of arguments, one call at a time
+    :param function: The function to time
+    :param arguments: A list of argument tuples, one per call
+    :return: A list of the time of each call in seconds
+    """
+    function(*arguments[0])  # Warm up first, so lazy imports and caches don't end up in the timings
+
+    times = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def count_lps(function, arguments, memory=False):
+    """
+    Run a function on each of a list of arguments again, with tau's stats on to count the LPs it solves. The stats
+    cost a few microseconds per call, so this is kept apart from the timed runs.
+    :param memory: Whether to also measure the peak memory under tracemalloc, which slows everything down a lot
+    :return: The number of LPs solved, including by pool workers, and the peak of the Python heap during the calls in
+    bytes (or None). That's Python objects and numpy arrays, but not what HiGHS allocates, shared memory, memory
+    mapped files or the memory of pool workers.
+    """
+    tau.enable_stats()
+    if memory:
+        tracemalloc.start()
+    try:
+        for args in arguments:
+            function(*args)
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+        return tau.get_stats()["lp_solves"], peak
+    finally:
+        if memory:
+            tracemalloc.stop()
+        tau.enable_stats(False)
+
+
+def bench_functions(name, thrusters, calls: int):
+    """
+    Benchmark transform_orientations, get_max_thrust, calc_max_yaw_pitch_roll, WrenchZonotope.max_along,
+    ThrustAllocator.allocate and EnvelopeTable.query on random directions and wrenches
+    :return: A list of result dicts, one per function
+    """
+    directions = np.random.default_rng(0).normal(size=(calls, 3))
+    torque_constraints = thrusters.torques
+
+    transform_times = time_calls(tau.transform_orientations, [(thrusters, d) for d in directions])
+
+    transformed = [tau.transform_orientations(thrusters, d) for d in directions]
+    max_thrust_times = time_calls(tau.get_max_thrust,
+                                  [(o, torque_constraints, tau.DEFAULT_MAX_CURRENT) for o in transformed])
+
+    yaw_pitch_roll_times = time_calls(tau.calc_max_yaw_pitch_roll, [(thrusters,)] * max(1, calls // 10))
+
+    zonotope = tau.WrenchZonotope(thrusters)
+    wrench_directions = np.random.default_rng(1).normal(size=(calls, 6))
+    zonotope_times = time_calls(zonotope.max_along, [(w,) for w in wrench_directions])
+
+    # Large enough that a good part of the wrenches are out of reach and have to be scaled down
+    allocator = tau.ThrustAllocator(thrusters)
+    allocate_times = time_calls(allocator.allocate, [(5 * w,) for w in wrench_directions])
+
+    table_directions, table_triangles = tau.sphere_directions("latlong", 50)
+    rho, allocations = tau.sweep_directions(thrusters, table_directions.reshape(-1, 3), return_allocations=True)
+    table = tau.EnvelopeTable(table_directions, table_triangles, rho, allocations)
+    query_times = time_calls(table.query, [(d, True) for d in directions])
+
+    # Only the functions that solve LPs are run again to count them
+    max_thrust_lps, _ = count_lps(tau.get_max_thrust,
+                                  [(o, torque_constraints, tau.DEFAULT_MAX_CURRENT) for o in transformed])
+    yaw_pitch_roll_lps, _ = count_lps(tau.calc_max_yaw_pitch_roll, [(thrusters,)] * len(yaw_pitch_roll_times))
+
+    results = []
+    for function, times, lp_solves in (("transform_orientations", transform_times, 0),
+                                       ("get_max_thrust", max_thrust_times, max_thrust_lps),
+                                       ("calc_max_yaw_pitch_roll", yaw_pitch_roll_times, yaw_pitch_roll_lps),
+                                       ("WrenchZonotope.max_along", zonotope_times, 0),
+                                       ("ThrustAllocator.allocate", allocate_times, 0),
+                                       ("EnvelopeTable.query", query_times, 0)):
+        stats = latency_stats(times)
+        results.append({"benchmark": function, "layout": name, "thrusters": len(thrusters), **stats,
+                        "lps_per_s": lp_solves / sum(times) or None})
+    return results
+
+
+def bench_sweep(name, thrusters, resolution: int, sphere: str, jobs: int, solver: str, symmetry: bool, memory: bool):
+    """
+    Benchmark a full sweep of the sphere
+    :return: A result dict
+    """
+    directions, _ = tau.sphere_directions(sphere, resolution)
+    directions = directions.reshape(-1, 3)
+    tau.sweep_directions(thrusters, directions[:1], tau.DEFAULT_MAX_CURRENT, 1, solver)  # Warm up
+
+    start = time.perf_counter()
+    tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT, jobs, solver, symmetry)
+    seconds = time.perf_counter() - start
+
+    # How many LPs that took depends on the solver and the symmetries, so they're counted in a run of their own
+    lp_solves, peak = count_lps(tau.sweep_directions,
+                                [(thrusters, directions, tau.DEFAULT_MAX_CURRENT, jobs, solver, symmetry)], memory)
+
+    return {"benchmark": "sweep", "layout": name, "thrusters": len(thrusters), "resolution": resolution,
+            "sphere": sphere, "directions": len(directions), "seconds": seconds,
+            "directions_per_s": len(directions) / seconds, "lp_solves": lp_solves, "lps_per_s": lp_solves / seconds,
+            "python_heap_peak_bytes": peak}
+
+
+def environment():
+    """
+    Describe the machine and the code the benchmarks ran on
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"time": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "highspy": tau._import_highspy() is not None}
+
+
+@click.command()
+@click.option("--resolutions", "-r", default=DEFAULT_RESOLUTIONS, help="comma separated sweep resolutions")
+@click.option("--counts", "-n", default=DEFAULT_COUNTS, help="comma separated thruster counts")
+@click.option("--calls", default=200, help="number of calls to time for each function benchmark")
+@click.option("--sphere", type=click.Choice(["latlong", "fibonacci", "icosphere"]), default="latlong")
+@click.option("--jobs", "-j", default=1, help="number of processes for each sweep, 0 for all cores")
+@click.option("--solver", type=click.Choice(["auto", "highs", "linprog"]), default="auto")
+@click.option("--symmetry/--no-symmetry", default=False, help="let sweeps skip symmetric directions")
+@click.option("--memory/--no-memory", default=True,
+              help="measure the peak Python heap of each sweep with tracemalloc, which slows down counting its LPs")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), default="bench_results.json",
+              help="JSON file to save the results to")
+def main(resolutions: str, counts: str, calls: int, sphere: str, jobs: int, solver: str, symmetry: bool,
+         memory: bool, output: str):
+    """
+    Benchmark tau across a matrix of resolutions and thruster counts
+    """
+    resolutions = [int(resolution) for resolution in resolutions.split(",")]
+    layouts = load_layouts([int(count) for count in counts.split(",")])
+
+    results = []
+    for count, (name, thrusters) in layouts.items():
+        for result in bench_functions(name, thrusters, calls):
+            results.append(result)
+            print(f"{result['benchmark']:>24} {name:>14}: {result['calls_per_s']:10.1f} calls/s, "
+                  f"p50 {result['p50_us']:9.1f} us, p90 {result['p90_us']:9.1f} us, p99 {result['p99_us']:9.1f} us")
+
+    for count, (name, thrusters) in layouts.items():
+        for resolution in resolutions:
+            result = bench_sweep(name, thrusters, resolution, sphere, jobs, solver, symmetry, memory)
+            results.append(result)
+            peak = result["python_heap_peak_bytes"]
+            memory_text = "" if peak is None else f", Python heap peak {peak / 2 ** 20:7.1f} MiB"
+            print(f"{'sweep':>24} {name:>14}: resolution {resolution:4}, {result['seconds']:8.2f} s, "
+                  f"{result['lps_per_s']:9.1f} LPs/s{memory_text}")
+
+    with open(output, "w") as f:
+        json.dump({"environment": environment(),
+                   "settings": {"sphere": sphere, "jobs": jobs, "solver": solver, "symmetry": symmetry},
+                   "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
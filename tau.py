@@ -1,11 +1,21 @@
 import numpy as np
-from scipy.optimize import linprog
 import json
-import matplotlib
-from matplotlib import cm
-import matplotlib.pyplot as plt
 import typing as t
 import click
+import os
+import math
+import time
+import hashlib
+import struct
+import itertools
+import collections
+import multiprocessing
+import tempfile
+from multiprocessing import shared_memory
+
+# scipy, matplotlib and highspy take most of the startup time, so they're imported in the functions that use them
+# instead of up here. That way e.g. --help, or a run that only reads the cache, never loads them.
+highspy = None  # Set by _import_highspy
 
 DEFAULT_RESOLUTION = 100  # Runtime is O(n^2) with respect to resolution!
 DEFAULT_MAX_THRUSTS = [-2.9, 3.71]  # Lifted from the BlueRobotics public performance data (kgf)
@@ -14,323 +24,3297 @@ DEFAULT_MAX_THRUSTS = [-2.9, 3.71]  # Lifted from the BlueRobotics public perfor
 DEFAULT_FWD_CURRENT = [.741, 1.89, -.278]
 DEFAULT_REV_CURRENT = [1.36, 2.04, -.231]  # reverse direction
 DEFAULT_MAX_CURRENT = 22
+# How strongly the minimum current LP prefers the thrust direction with the lower current draw when there's a tie.
+# Ties that are left after it (e.g. between identical thrusters) are broken by _least_current_allocation.
+MIN_CURRENT_TIE_BREAK = 1e-4
+# The kinds of envelope that can be swept: the max thrust at zero torque, or the max torque at zero net force
+ENVELOPES = ("thrust", "torque")
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tau")
+DEFAULT_CACHE_SIZE = 512 * 2 ** 20  # bytes
+
+
+#####################################
+# Instrumentation code
+#####################################
+# The stats being collected, or None while collection is off (see enable_stats)
+_stats = None
+
+# linprog's status codes, named the same way as HiGHS' model statuses so both solvers' counts can be merged
+LINPROG_STATUSES = {0: "Optimal", 1: "Iteration limit reached", 2: "Infeasible", 3: "Unbounded",
+                    4: "Numerical difficulties"}
+
+
+def _new_stats():
+    return {"phases": {}, "lp_solves": 0, "simplex_iterations": 0, "lp_statuses": {}, "current_limit_checks": 0,
+            "current_limit_bound": 0}
+
+
+def enable_stats(enabled=True):
+    """
+    Start (or stop) collecting timings and counters of the hot paths, starting over from zero. Collection is off by
+    default, since it costs a few microseconds per call.
+    :param enabled: Whether to collect stats
+    """
+    global _stats
+    _stats = _new_stats() if enabled else None
+
+
+def _start_timer():
+    return time.perf_counter() if _stats is not None else None
+
+
+def _stop_timer(phase: str, started: float):
+    """
+    Add the time since _start_timer returned started to a phase
+    """
+    if started is None or _stats is None:
+        return
+    calls_and_seconds = _stats["phases"].setdefault(phase, [0, 0.])
+    calls_and_seconds[0] += 1
+    calls_and_seconds[1] += time.perf_counter() - started
+
+
+def _record_lp(status: str, iterations: int):
+    """
+    Count an LP solve, its final status and how many simplex iterations it took
+    """
+    if _stats is None:
+        return
+    _stats["lp_solves"] += 1
+    _stats["simplex_iterations"] += iterations
+    _stats["lp_statuses"][status] = _stats["lp_statuses"].get(status, 0) + 1
+
+
+def _take_stats():
+    """
+    Hand over the stats collected so far and start over, so a pool worker can send them to the parent process
+    :return: The raw stats, or None if collection is off
+    """
+    global _stats
+    if _stats is None:
+        return None
+    stats, _stats = _stats, _new_stats()
+    return stats
+
+
+def _merge_stats(stats: dict):
+    """
+    Add the raw stats of a pool worker (see _take_stats) to this process' stats
+    """
+    if stats is None or _stats is None:
+        return
+    for phase, (calls, seconds) in stats["phases"].items():
+        calls_and_seconds = _stats["phases"].setdefault(phase, [0, 0.])
+        calls_and_seconds[0] += calls
+        calls_and_seconds[1] += seconds
+    for status, count in stats["lp_statuses"].items():
+        _stats["lp_statuses"][status] = _stats["lp_statuses"].get(status, 0) + count
+    for counter in ("lp_solves", "simplex_iterations", "current_limit_checks", "current_limit_bound"):
+        _stats[counter] += stats[counter]
+
+
+def get_stats():
+    """
+    Get the stats collected since enable_stats, including those of sweep and batch pool workers. The phases are:
+    basis (building the change of basis into each direction's frame), lp_assembly (setting up the coefficients of the
+    LPs), lp_solve (HiGHS or linprog), tie_break (_least_current_allocation_batch, once per batch of directions),
+    current_fit (solving the current draw quadratic) and plot (matplotlib).
+    :return: A dict of the calls, total seconds and mean microseconds of each phase, the number of LP solves, their
+    total simplex iterations, how many of them ended in each status, and how often the current limit was checked and
+    how often it actually bound. None if collection is off.
+    """
+    if _stats is None:
+        return None
+    return {
+        "phases": {
+            phase: {"calls": calls, "total_s": seconds, "mean_us": 1e6 * seconds / calls}
+            for phase, (calls, seconds) in _stats["phases"].items()
+        },
+        "lp_solves": _stats["lp_solves"],
+        "simplex_iterations": _stats["simplex_iterations"],
+        "lp_statuses": dict(_stats["lp_statuses"]),
+        "current_limit": {"checks": _stats["current_limit_checks"], "bound": _stats["current_limit_bound"]},
+    }
+
+
+def format_stats(stats: dict):
+    """
+    Format the stats returned by get_stats as a human readable table
+    """
+    lines = [f"{'phase':<12} {'calls':>10} {'total s':>10} {'mean us':>10}"]
+    for phase, phase_stats in sorted(stats["phases"].items(), key=lambda item: -item[1]["total_s"]):
+        lines.append(f"{phase:<12} {phase_stats['calls']:>10} {phase_stats['total_s']:>10.3f} "
+                     f"{phase_stats['mean_us']:>10.1f}")
+
+    lp_solves = stats["lp_solves"]
+    lines.append(f"LP solves: {lp_solves}, simplex iterations: {stats['simplex_iterations']} "
+                 f"({stats['simplex_iterations'] / max(1, lp_solves):.1f} per solve)")
+    lines.append("LP statuses: " + ", ".join(f"{status}: {count}" for status, count in stats["lp_statuses"].items()))
+
+    checks, bound = stats["current_limit"]["checks"], stats["current_limit"]["bound"]
+    lines.append(f"Current limit bound in {bound} of {checks} allocations ({100 * bound / max(1, checks):.1f}%)")
+    return "\n".join(lines)
+
+
+def _orientations(theta, phi):
+    """
+    Calculate the unit vectors in the directions specified by theta and phi, in degrees
+    :return: An array of the vectors, with the same leading shape as theta and phi
+    """
+    theta = np.radians(theta)
+    phi = np.radians(phi)
+    return np.stack((
+        np.sin(phi) * np.cos(theta),
+        np.sin(phi) * np.sin(theta),
+        np.cos(phi)
+    ), axis=-1)
 
 
 class Thruster3D:
+    """
+    One thruster. Its values are views into a row of the arrays of a ThrusterSet: either the one it was indexed from,
+    or a set of its own when it is created on its own.
+    """
+
     def __init__(self, x, y, z, theta, phi, max_thrusts, fwd_current, rev_current):
-        self.pos = np.array([x, y, z])
-        self.max_thrusts = max_thrusts
-        self.fwd_current = fwd_current
-        self.rev_current = rev_current
-
-        # Calculate the unit vector in the direction specified by theta and phi
-        theta = np.radians(theta)
-        phi = np.radians(phi)
-        self.orientation = np.array([
-            np.sin(phi) * np.cos(theta),
-            np.sin(phi) * np.sin(theta),
-            np.cos(phi)
-        ])
+        self.thruster_set = ThrusterSet([[x, y, z]], [_orientations(theta, phi)], [max_thrusts], [fwd_current],
+                                        [rev_current])
+        self.index = 0
+
+    @classmethod
+    def _view(cls, thruster_set: "ThrusterSet", index: int):
+        thruster = cls.__new__(cls)
+        thruster.thruster_set = thruster_set
+        thruster.index = index
+        return thruster
+
+    @property
+    def pos(self):
+        return self.thruster_set.positions[self.index]
+
+    @property
+    def orientation(self):
+        return self.thruster_set.orientations[self.index]
+
+    @property
+    def max_thrusts(self):
+        return self.thruster_set.bounds[self.index]
+
+    @property
+    def fwd_current(self):
+        return self.thruster_set.fwd_current[self.index]
+
+    @property
+    def rev_current(self):
+        return self.thruster_set.rev_current[self.index]
 
     def torque(self):
-        return np.cross(self.pos, self.orientation)
+        return self.thruster_set.torques[self.index]
+
+
+class ThrusterSet:
+    """
+    A set of thrusters stored as one contiguous array per value, with a row per thruster, so the LPs and everything
+    else that works on all of the thrusters at once can use the arrays directly instead of gathering them from each
+    thruster. The torques and the 6xN wrench matrix are calculated once when the set is made, so the arrays are
+    read-only to keep them in sync.
+
+    It behaves like a list of Thruster3D objects: indexing or iterating it gives Thruster3D views into its rows, and
+    slicing it gives a ThrusterSet of the sliced thrusters.
+    """
+
+    def __init__(self, positions, orientations, max_thrusts=None, fwd_current=None, rev_current=None):
+        """
+        :param positions: An Nx3 array of the position of each thruster
+        :param orientations: An Nx3 array of the unit vector each thruster points in
+        :param max_thrusts: An Nx2 array of the reverse (negative) and forward thrust limits of each thruster in kgf,
+        DEFAULT_MAX_THRUSTS for every thruster if not given
+        :param fwd_current: An Nx3 array of the quadratic coefficients of each thruster's current draw in amps at a
+        forward thrust in kgf, DEFAULT_FWD_CURRENT if not given
+        :param rev_current: The same for reverse thrust, DEFAULT_REV_CURRENT if not given
+        """
+        self.positions = np.array(positions, dtype=float).reshape(-1, 3)
+        num_thrusters = len(self.positions)
+        self.orientations = np.array(orientations, dtype=float).reshape(num_thrusters, 3)
+
+        # Optional thruster parameters, the same for every thruster if not given
+        self.bounds = self._spec_array(max_thrusts, DEFAULT_MAX_THRUSTS, (num_thrusters, 2))
+        self.fwd_current = self._spec_array(fwd_current, DEFAULT_FWD_CURRENT, (num_thrusters, 3))
+        self.rev_current = self._spec_array(rev_current, DEFAULT_REV_CURRENT, (num_thrusters, 3))
+
+        self.torques = np.cross(self.positions, self.orientations).reshape(num_thrusters, 3)
+        # Rows are x, y, z force then x, y, z torque, which is what the LPs constrain
+        self.wrenches = np.concatenate((self.orientations, self.torques), axis=1).transpose().copy()  # 6xN
+        self.torque_wrenches = np.concatenate((self.wrenches[3:], self.wrenches[:3]))  # Torque rows first
+
+        for array in (self.positions, self.orientations, self.bounds, self.fwd_current, self.rev_current,
+                      self.torques, self.wrenches, self.torque_wrenches):
+            array.flags.writeable = False
+
+    @staticmethod
+    def _spec_array(values, default, shape):
+        return np.array(np.broadcast_to(default if values is None else values, shape), dtype=float)
+
+    @classmethod
+    def from_thrusters(cls, thrusters: t.Sequence[Thruster3D]):
+        """
+        Gather a list of Thruster3D objects into a ThrusterSet
+        :param thrusters: A list of Thruster3D objects, or a ThrusterSet which is returned as is
+        """
+        if isinstance(thrusters, cls):
+            return thrusters
+        return cls(
+            [thruster.pos for thruster in thrusters],
+            [thruster.orientation for thruster in thrusters],
+            [thruster.max_thrusts for thruster in thrusters],
+            [thruster.fwd_current for thruster in thrusters],
+            [thruster.rev_current for thruster in thrusters]
+        )
+
+    def envelope_wrenches(self, envelope: str = "thrust"):
+        """
+        Get the wrench matrix with the rows an envelope is swept over first, and the rows that are held at zero last
+        :param envelope: "thrust" for force rows first, or "torque" for torque rows first
+        :return: A 6xN array
+        """
+        if envelope not in ENVELOPES:
+            raise ValueError(f"unknown envelope {envelope!r}, must be one of {ENVELOPES}")
+        return self.torque_wrenches if envelope == "torque" else self.wrenches
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index: t.Union[int, slice]):
+        if isinstance(index, slice):
+            return ThrusterSet(self.positions[index], self.orientations[index], self.bounds[index],
+                               self.fwd_current[index], self.rev_current[index])
+        if not -len(self) <= index < len(self):
+            raise IndexError("thruster index out of range")
+        return Thruster3D._view(self, index % len(self))
+
+    def __iter__(self):
+        return (Thruster3D._view(self, index) for index in range(len(self)))
+
+    def half_thruster_wrenches(self, envelope: str = "thrust"):
+        """
+        Get the wrench matrix of the half-thrusters of half_thrusters, a reverse half-thruster pushing the other way
+        :param envelope: "thrust" or "torque", see envelope_wrenches
+        :return: A 6x2N array, with forward and reverse half-thrusters alternating
+        """
+        wrenches = self.envelope_wrenches(envelope)
+        half_wrenches = np.empty((6, 2 * len(self)))
+        half_wrenches[:, 0::2] = wrenches
+        half_wrenches[:, 1::2] = -wrenches
+        return half_wrenches
+
+    def half_thrusters(self):
+        """
+        Describe the thrusters split into a forward and a reverse half-thruster each, as the min current LPs use them
+        :return: A (2N,) array of the cost of each half-thruster: its thrust, plus a MIN_CURRENT_TIE_BREAK weighted
+        tie break towards the half-thruster that draws less current, and a (2N,) array of their upper bounds (their
+        lower bounds are 0). Forward and reverse half-thrusters alternate.
+        """
+        costs = np.empty(2 * len(self))
+        costs[0::2] = 1 + MIN_CURRENT_TIE_BREAK * self.fwd_current[:, 1]
+        costs[1::2] = 1 + MIN_CURRENT_TIE_BREAK * self.rev_current[:, 1]
+
+        upper = np.empty(2 * len(self))
+        upper[0::2] = self.bounds[:, 1]
+        upper[1::2] = -self.bounds[:, 0]
+        return costs, upper
+
+    def half_thruster_current(self):
+        """
+        Describe the current draw of the half-thrusters of half_thrusters
+        :return: A (2N,) array of the quadratic and a (2N,) array of the linear coefficient of each half-thruster's
+        current draw as a function of its thrust
+        """
+        quadratic = np.empty(2 * len(self))
+        quadratic[0::2] = self.fwd_current[:, 0]
+        quadratic[1::2] = self.rev_current[:, 0]
+
+        linear = np.empty(2 * len(self))
+        linear[0::2] = self.fwd_current[:, 1]
+        linear[1::2] = self.rev_current[:, 1]
+        return quadratic, linear
+
+    def max_current_draw(self):
+        """
+        Calculate the most current the thrusters can possibly draw, with every one of them at full thrust in
+        whichever direction draws more. If that's within the current limit, the limit can never bind.
+        :return: The current in amps
+        """
+        fwd_current = np.einsum("nk,nk->n", self.fwd_current, self.bounds[:, 1:] ** [2, 1, 0])
+        rev_current = np.einsum("nk,nk->n", self.rev_current, (-self.bounds[:, :1]) ** [2, 1, 0])
+        return float(np.sum(np.maximum(fwd_current, rev_current)))
+
+
+def load_thrusters(thrusters_raw: t.List[dict]):
+    """
+    Convert a thruster layout as stored in JSON into a ThrusterSet
+    :param thrusters_raw: A list of dicts with the x, y, z, theta and phi of each thruster, and optionally its
+    max_thrusts, fwd_current and rev_current
+    :return: A ThrusterSet, which behaves like a list of Thruster3D objects
+    """
+    return ThrusterSet(
+        [[thruster_raw['x'], thruster_raw['y'], thruster_raw['z']] for thruster_raw in thrusters_raw],
+        _orientations([thruster_raw['theta'] for thruster_raw in thrusters_raw],
+                      [thruster_raw['phi'] for thruster_raw in thrusters_raw]),
+        # Optional thruster parameters: dict.get is used to provide a default value if the key doesn't exist
+        [thruster_raw.get("max_thrusts", DEFAULT_MAX_THRUSTS) for thruster_raw in thrusters_raw],
+        [thruster_raw.get("fwd_current", DEFAULT_FWD_CURRENT) for thruster_raw in thrusters_raw],
+        [thruster_raw.get("rev_current", DEFAULT_REV_CURRENT) for thruster_raw in thrusters_raw]
+    )
 
 
 def transform_orientations(thrusters: t.List[Thruster3D], target_dir: np.ndarray):
     """
-    Calculate the maximum force achievable in (exclusively) the given direction by the given set of constraints
-    :param thrusters: A list of Thruster3D objects representing the available thrusters
+    Transform the thruster orientations into a frame where the given direction is the x axis, so get_max_thrust can
+    maximize the thrust along x
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
     :param target_dir: A 3d vector in the target direction
-    :return: The maximum thrust force in kgf
+    :return: An Nx3 array of the orientation of each thruster in the new frame
     """
-    target_dir = target_dir / np.linalg.norm(target_dir)  # Make target_dir a unit vector
+    return transform_orientations_batch(thrusters, np.asarray(target_dir, dtype=float)[np.newaxis])[0]
 
-    orientations = np.empty((3, len(thrusters)))  # Create an empty 2d array to hold the orientation of each thruster
-    for i in range(len(thrusters)):
-        thruster = thrusters[i]
-        orientations[..., i] = thruster.orientation
 
-    new_bases = np.empty((3, 3))  # Create an empty 3x3 change of basis matrix
-    new_bases[..., 0] = target_dir  # The first basis is our target direction
+def transform_orientations_batch(thrusters: t.List[Thruster3D], directions: np.ndarray, envelope: str = "thrust"):
+    """
+    Transform the thruster orientations into the frame of each of a batch of directions, like transform_orientations
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param directions: An (M, 3) array of vectors in the target directions
+    :param envelope: "thrust" to transform the orientations, or "torque" to transform the torques of the thrusters
+    instead, for sweeping the torque envelope
+    :return: An (M, N, 3) array of the orientation of each thruster in the frame of each direction
+    """
+    timer = _start_timer()
 
-    if not (target_dir[1] == 0 and target_dir[2] == 0):  # Make sure the cross product computed below isn't 0
-        second_basis = np.cross(target_dir, np.array([1, 0, 0]))  # Choose a second basis parallel the first
-    else:
-        second_basis = np.cross(target_dir, np.array([0, 1, 0]))
-    second_basis /= np.linalg.norm(second_basis)  # Make the second basis a unit vector
+    orientations = ThrusterSet.from_thrusters(thrusters).envelope_wrenches(envelope)[:3].transpose()  # Nx3
+    directions = np.asarray(directions, dtype=float)
+    directions = directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Make every direction a unit vector
 
-    new_bases[..., 1] = second_basis
-    third_basis = np.cross(target_dir, second_basis)  # Calculate a third basis perpendicular the first two
-    third_basis /= np.linalg.norm(third_basis)  # Make the third basis a unit vector
-    new_bases[..., 2] = third_basis
+    # Build every change of basis matrix at once, stacked into an Mx3x3 array. Each one has the target direction as
+    # its first basis and two unit vectors perpendicular to it as the others. The second basis is the cross product
+    # with (1, 0, 0), or with (0, 1, 0) for directions along the x axis where that would give 0. np.where picks
+    # between them for the whole batch, rather than branching per direction.
+    along_x = (directions[:, 1] == 0) & (directions[:, 2] == 0)
+    helpers = np.where(along_x[:, np.newaxis], [0., 1., 0.], [1., 0., 0.])
 
-    # Invert the matrix. The original matrix maps (1, 0, 0) onto the target direction. We want a matrix
-    # that maps the target direction onto (1, 0, 0).
-    inverse_transform = np.linalg.inv(new_bases)
+    second_bases = np.cross(directions, helpers)
+    second_bases /= np.linalg.norm(second_bases, axis=1)[:, np.newaxis]  # Make the second bases unit vectors
+    third_bases = np.cross(directions, second_bases)  # Already a unit vector, as the cross of two perpendicular ones
 
-    # Calculate the transformation with matrix_vector multiplication
-    transformed_orientations = inverse_transform.dot(orientations).transpose()
+    # The change of basis matrices map (1, 0, 0) onto the target direction, and we want the opposite. They're
+    # orthonormal, so their inverse is their transpose: the bases stacked as rows rather than columns.
+    inverse_transforms = np.stack((directions, second_bases, third_bases), axis=1)  # Mx3x3
 
+    # Transform every thruster orientation for every direction in one go
+    transformed_orientations = np.matmul(orientations, inverse_transforms.transpose((0, 2, 1)))  # MxNx3
+
+    _stop_timer("basis", timer)
     return transformed_orientations
 
 
-def get_max_thrust(transformed_orientations, t_constraints: np.ndarray, max_current: int):
-    # First Simplex run. Find the maximum thrust in the desired direction
-    objective = []
-    left_of_equality = []
+def _current_limit_multiplier(thrusts, max_current: int, fwd_current=DEFAULT_FWD_CURRENT,
+                              rev_current=DEFAULT_REV_CURRENT):
+    """
+    Calculate how much a set of thruster thrusts needs to be scaled down to keep the total current under the limit
+    :param thrusts: The thrust of each thruster in kgf
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param fwd_current: The forward current coefficients of the thrusters, as in ThrusterSet. Either one row for all
+    of them or one per thruster
+    :param rev_current: The same for reverse thrust
+    :return: The multiplier to apply to every thrust, at most 1.0
+    """
+    timer = _start_timer()
+
+    # A thruster that isn't thrusting draws no current at all. Charging it the constant term of either direction would
+    # make a reversed thruster with its specs swapped draw a different current from the original one.
+    thrusts = np.asarray(thrusts, dtype=float)
+    forward = (thrusts >= 0)[:, np.newaxis]
+    coefficients = np.where(forward, fwd_current, rev_current)  # Nx3, each thruster's coefficients for its direction
+    magnitudes = np.abs(thrusts)
+
+    current_quadratic = [
+        np.dot(coefficients[:, 0], magnitudes ** 2),  # a * t^2
+        np.dot(coefficients[:, 1], magnitudes),  # b * t
+        np.sum(coefficients[magnitudes > 0, 2]) - max_current  # c, ax^2 + bx + c = I -> ax^2 + bx + (c-I) = 0
+    ]
 
-    thrusts_y = []
-    thrusts_z = []
+    # The current only grows with the multiplier, so if the full thrusts are within the limit there's nothing to solve
+    if sum(current_quadratic) <= 0:
+        _stop_timer("current_fit", timer)
+        if _stats is not None:
+            _stats["current_limit_checks"] += 1
+        return 1.
+
+    # solve quadratic, take the proper point, and clamp it to a maximum of 1.0. With a positive b, as with any real
+    # thruster, the larger root is -2c / (b + sqrt(b^2 - 4ac)), which is much faster than np.roots and doesn't lose
+    # precision to cancellation like the textbook formula does.
+    a, b, c = current_quadratic
+    discriminant = b * b - 4 * a * c
+    if b > 0 and discriminant >= 0:
+        multiplier = min(1., -2 * c / (b + math.sqrt(discriminant)))
+    else:
+        roots = np.roots(current_quadratic)
+        multiplier = 1. if len(roots) == 0 else min(1., max(roots))  # No roots if none of the thrusters are thrusting
 
-    torques_x = []
-    torques_y = []
-    torques_z = []
+    _stop_timer("current_fit", timer)
+    if _stats is not None:
+        _stats["current_limit_checks"] += 1
+        _stats["current_limit_bound"] += int(multiplier < 1)
+    return multiplier
 
-    bounds = []
 
-    for i, orientation in enumerate(transformed_orientations):
-        objective.append(-orientation[0])  # Algorithm minimizes only, so the objective function needs to be negated.
+def _least_current_allocation(half_thrusts: np.ndarray, half_wrenches: np.ndarray, costs: np.ndarray,
+                              upper: np.ndarray, quadratic: np.ndarray, linear: np.ndarray,
+                              reduced_costs: np.ndarray = None):
+    """
+    Break the ties of the min current LP for one direction, see _least_current_allocation_batch
+    :param half_thrusts: A (2N,) optimal basic solution of the min current LP
+    :param reduced_costs: Its (2N,) reduced costs, if the solver gave them
+    :return: The (2N,) least current allocation
+    """
+    return _least_current_allocation_batch(
+        np.asarray(half_thrusts, dtype=float)[np.newaxis], half_wrenches, costs, upper, quadratic, linear,
+        None if reduced_costs is None else np.asarray(reduced_costs)[np.newaxis]
+    )[0]
 
-        thrusts_y.append(orientation[1])
-        thrusts_z.append(orientation[2])
 
-        torques_x.append(t_constraints[i][0])
-        torques_y.append(t_constraints[i][1])
-        torques_z.append(t_constraints[i][2])
+def _least_current_allocation_batch(half_thrusts: np.ndarray, half_wrenches: np.ndarray, costs: np.ndarray,
+                                    upper: np.ndarray, quadratic: np.ndarray, linear: np.ndarray,
+                                    reduced_costs: np.ndarray = None):
+    """
+    Break the ties of the min current LP: out of every half-thruster allocation with the same wrench and the same
+    cost as an optimal one, find the one with the least sum of quadratic * h^2 + linear * h, i.e. the least current.
+
+    Several allocations are often equally good for the LP, e.g. when identical thrusters can take over each other's
+    thrust, and which one the solver lands on depends on where it started. That changes the current draw, and with
+    it how far _current_limit_multiplier scales the thrust down. The current is strictly convex in the half-thrusts,
+    so its minimum over the LP's optimal face is unique, and the same whichever optimal allocation it starts from.
+    Half-thrusters whose current isn't strictly convex (a quadratic coefficient of 0 or less) get a slight curvature
+    anyway, so the minimum stays unique.
+
+    With the reduced costs of the LP solutions, only the half-thrusters with a reduced cost of 0 can move, since moving
+    any other one off its bound makes the cost worse. When none of those are at a bound, the optimal face is just the
+    LP solution, which is returned as is. That's most directions, except on layouts with identical thrusters.
+
+    It's solved with a primal active set method, starting from the given allocation: move the half-thrusters that
+    aren't at a bound to the best allocation that keeps the wrench and the cost, stopping at the first bound in the
+    way, and when nothing can move any more, release the half-thruster whose bound holds the current up the most. Each
+    step is taken for every direction of the batch at once, so the linear algebra can be stacked.
+    :param half_thrusts: An (M, 2N) array of an optimal basic solution (a vertex, as the simplex method finds) of the
+    min current LP of each direction
+    :param half_wrenches: The 6x2N wrench of each half-thruster
+    :param costs: The (2N,) LP costs, see ThrusterSet.half_thrusters
+    :param upper: The (2N,) upper bounds, the lower ones are 0
+    :param quadratic: The (2N,) quadratic coefficients of the current, see ThrusterSet.half_thruster_current
+    :param linear: The (2N,) linear coefficients of the current
+    :param reduced_costs: The (M, 2N) reduced costs of half_thrusts in the LPs, if the solver gave them
+    :return: The (M, 2N) least current allocations
+    """
+    timer = _start_timer()
+
+    half_thrusts = np.clip(half_thrusts, 0, upper)
+    step_tolerance = 1e-12 * max(1., np.max(upper, initial=0))
+    at_lower = half_thrusts <= step_tolerance
+    at_upper = ~at_lower & (half_thrusts >= upper - step_tolerance)
+    half_thrusts = np.where(at_lower, 0, np.where(at_upper, upper, half_thrusts))
+
+    if reduced_costs is None:
+        movable = np.ones(half_thrusts.shape, dtype=bool)
+        constraints = np.vstack((half_wrenches, costs))  # Everything that has to stay the same, 7x2N
+        unsolved = np.arange(len(half_thrusts))
+    else:
+        movable = ~(at_lower | at_upper) | (np.abs(reduced_costs) <= 1e-9)
+        constraints = half_wrenches  # The cost can't change while only the movable half-thrusters move
+        unsolved = np.flatnonzero(np.any(movable & (at_lower | at_upper), axis=1))
+
+    hessian = 2 * np.asarray(quadratic, dtype=float)
+    hessian = np.maximum(hessian, 1e-4 * max(1., np.max(hessian, initial=0)))  # The slight curvature, see above
+    scale = 1 / np.sqrt(hessian)  # Scales the half-thrusts so the hessian is the identity
+
+    for _ in range(10 * half_thrusts.shape[1] + 10):  # Plenty for the active set to settle, even with some cycling
+        if len(unsolved) == 0:
+            break
+        values, lower_pinned, upper_pinned = half_thrusts[unsolved], at_lower[unsolved], at_upper[unsolved]
+        gradient = hessian * values + linear
+        # Zeroing the scale of the pinned half-thrusters leaves them out of the constraints and the step
+        free_scale = np.where(lower_pinned | upper_pinned, 0, scale)
+
+        # The best step of the free half-thrusters is the scaled gradient projected onto the null space of the
+        # (scaled) constraints
+        left, singular_values, row_space = np.linalg.svd(constraints * free_scale[:, np.newaxis, :],
+                                                         full_matrices=False)
+        independent = singular_values > 1e-10 * np.max(singular_values, axis=1, initial=0)[:, np.newaxis]
+        scaled_gradient = gradient * free_scale
+        components = np.where(independent, np.einsum("krc,kc->kr", row_space, scaled_gradient), 0)
+        step = -(scaled_gradient - np.einsum("krc,kr->kc", row_space, components)) * free_scale
+        # The projection leaves rounding error in proportion to the scaled gradient, which is large where the curvature
+        # is slight, so a step has to be larger than that to count
+        noise = 1e-14 * np.max(np.abs(scaled_gradient), axis=1) * np.max(free_scale, axis=1)
+        moving = np.max(np.abs(step), axis=1) > step_tolerance + noise
+
+        # Take as much of the step as the bounds allow, and pin the half-thruster that stops it to its bound
+        with np.errstate(divide="ignore", invalid="ignore"):
+            limits = np.where(step < -step_tolerance, -values / step,
+                              np.where(step > step_tolerance, (upper - values) / step, np.inf))
+        blocking = np.argmin(limits, axis=1)
+        lengths = np.clip(np.take_along_axis(limits, blocking[:, np.newaxis], 1)[:, 0], 0, 1)
+        values = np.where(moving[:, np.newaxis], np.clip(values + lengths[:, np.newaxis] * step, 0, upper), values)
+        blocked = np.flatnonzero(moving & (lengths < 1))
+        blocked_lower = step[blocked, blocking[blocked]] < 0
+        lower_pinned[blocked, blocking[blocked]] = blocked_lower
+        upper_pinned[blocked, blocking[blocked]] = ~blocked_lower
+        values[blocked, blocking[blocked]] = np.where(blocked_lower, 0, upper[blocking[blocked]])
+
+        # Where nothing free can move, check whether the bound of any pinned half-thruster is in the way. The
+        # multipliers of the constraints are the ones that make up the gradient of the free half-thrusters.
+        multipliers = -np.einsum("kri,ki->kr", left,
+                                 np.where(independent, components / np.where(independent, singular_values, 1), 0))
+        reduced_gradient = gradient + multipliers.dot(constraints)
+        held_back = np.where(lower_pinned, -reduced_gradient, np.where(upper_pinned, reduced_gradient, 0))
+        held_back = np.where(movable[unsolved] & ~moving[:, np.newaxis], held_back, 0)
+        release = np.argmax(held_back, axis=1)
+        released = np.flatnonzero(np.take_along_axis(held_back, release[:, np.newaxis], 1)[:, 0] > 1e-9)
+        lower_pinned[released, release[released]] = upper_pinned[released, release[released]] = False
+
+        half_thrusts[unsolved], at_lower[unsolved], at_upper[unsolved] = values, lower_pinned, upper_pinned
+        moving[released] = True  # The rest are solved
+        unsolved = unsolved[moving]
+
+    # Snap half-thrusts that only miss a bound by rounding error onto it, since e.g. a thrust of -1e-16 instead of 0
+    # would count as reverse thrust in _current_limit_multiplier. Same tolerance as _basis_status.
+    half_thrusts = np.where(half_thrusts <= 1e-9, 0, np.where(half_thrusts >= upper - 1e-9, upper, half_thrusts))
+
+    _stop_timer("tie_break", timer)
+    return half_thrusts
+
+
+class ThrustLPTemplates:
+    """
+    The constraint arrays of the two LPs get_max_thrust solves, preallocated once per thruster layout. The torque rows
+    and the bounds are the same in every direction, so only the objective and the force rows get rewritten (in place)
+    for each direction instead of rebuilding everything from Python lists.
+    """
+
+    def __init__(self, t_constraints: np.ndarray, thrusters: "ThrusterSet" = None):
+        """
+        :param t_constraints: An Nx3 array of the torque of each thruster
+        :param thrusters: The ThrusterSet the torques belong to, for its thrust limits and current coefficients. Every
+        thruster has the default specs if not given.
+        """
+        t_constraints = np.asarray(t_constraints, dtype=float)
+        num_thrusters = len(t_constraints)
+        if thrusters is None:
+            thrusters = ThrusterSet(np.zeros((num_thrusters, 3)), np.zeros((num_thrusters, 3)))
+        half_thrust_costs, half_thrust_upper = thrusters.half_thrusters()
+
+        # First LP: maximize the thrust along x with no thrust along y and z and no torque
+        self.objective = np.empty(num_thrusters)  # Minus the x thrust of each thruster, filled in by update
+        self.left_of_equality = np.empty((5, num_thrusters))
+        self.left_of_equality[2:] = t_constraints.transpose()  # x, y and z torque, rows 0 and 1 are y and z thrust
+        self.right_of_equality = np.zeros(5)
+        self.bounds = thrusters.bounds
+
+        # Second LP: minimize the thrust of each thruster duplicated into a forward and a reverse half-thruster.
+        # Minimize the thrust of all thrusters weighted equally, breaking ties towards the half-thruster that draws less
+        # current so the answer doesn't depend on which of several equally good allocations the solver lands on
+        self.objective_mincurrent = half_thrust_costs
+        self.left_of_equality_mincurrent = np.empty((6, 2 * num_thrusters))
+        self.left_of_equality_mincurrent[3:, 0::2] = t_constraints.transpose()
+        self.left_of_equality_mincurrent[3:, 1::2] = -t_constraints.transpose()  # duplicate, reversed thruster
+        self.right_of_equality_mincurrent = np.zeros(6)  # The x thrust is filled in with the first LP's maximum
+        self.bounds_mincurrent = np.stack((np.zeros(2 * num_thrusters), half_thrust_upper), axis=1)
+
+        self.half_thrust_current = thrusters.half_thruster_current()
+        self.fwd_current = thrusters.fwd_current
+        self.rev_current = thrusters.rev_current
+        self.max_current_draw = thrusters.max_current_draw()
+
+    def update(self, transformed_orientations: np.ndarray):
+        """
+        Fill in the parts of both LPs that depend on the direction
+        :param transformed_orientations: An Nx3 array of the thruster orientations in the frame of the direction
+        """
+        transformed_orientations = np.asarray(transformed_orientations)
+        np.negative(transformed_orientations[:, 0], out=self.objective)  # linprog minimizes only, so negate
+        self.left_of_equality[:2] = transformed_orientations[:, 1:].transpose()  # y and z thrust
+
+        self.left_of_equality_mincurrent[:3, 0::2] = transformed_orientations.transpose()
+        np.negative(transformed_orientations.transpose(), out=self.left_of_equality_mincurrent[:3, 1::2])
+
+
+def get_max_thrust(transformed_orientations, t_constraints: np.ndarray, max_current: int, return_allocation=False,
+                   return_basis=False, templates: ThrustLPTemplates = None):
+    """
+    Calculate the maximum zero-torque thrust along x of a set of thrusters, already rotated into the frame of the
+    target direction by transform_orientations
+    :param transformed_orientations: An Nx3 array of the orientation of each thruster in the target direction's frame
+    :param t_constraints: An Nx3 array of the torque of each thruster
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param return_allocation: Whether to also return the thrust of each thruster
+    :param return_basis: Whether to also return the optimal basis of both LPs, see sweep_directions
+    :param templates: The ThrustLPTemplates of the thrusters, to reuse between directions. Made on the spot if not given
+    :return: The maximum thrust force in kgf, plus the allocation and the basis if requested
+    """
+    if templates is None:
+        templates = ThrustLPTemplates(t_constraints)
+    max_thrust_result, min_current_result = _solve_thrust_lps(transformed_orientations, templates)
+
+    half_thrusts = _least_current_allocation(min_current_result.x, templates.left_of_equality_mincurrent,
+                                             templates.objective_mincurrent, templates.bounds_mincurrent[:, 1],
+                                             *templates.half_thrust_current,
+                                             min_current_result.lower.marginals + min_current_result.upper.marginals)
+    thrusts = half_thrusts[0::2] - half_thrusts[1::2]  # combine half-thrusters into full thrusters
+
+    if templates.max_current_draw <= max_current:  # The current limit can't bind with these thrusters at all
+        thrust_multiplier = 1.
+    else:
+        thrust_multiplier = _current_limit_multiplier(thrusts, max_current, templates.fwd_current,
+                                                      templates.rev_current)
 
-        bounds.append(DEFAULT_MAX_THRUSTS)  # TODO: Use the custom thruster specs
+    thrust_value = thrusts.dot(np.asarray(transformed_orientations)[:, 0])  # get total thrust in target direction
 
-    left_of_equality.append(thrusts_y)
-    left_of_equality.append(thrusts_z)
+    results = [thrust_value * thrust_multiplier]
+    if return_allocation:  # Also return the thrust of each individual thruster, scaled down by the current limit
+        results.append(thrusts * thrust_multiplier)
+    if return_basis:  # And which bounds each thruster was at in the optimal solutions of the two LPs
+        results.append(_linprog_bases(templates, max_thrust_result, min_current_result))
 
-    left_of_equality.append(torques_x)
-    left_of_equality.append(torques_y)
-    left_of_equality.append(torques_z)
+    return results[0] if len(results) == 1 else tuple(results)
 
-    right_of_equality = [
-        0,  # y thrust
-        0,  # z thrust
-        0,  # x torque
-        0,  # y torque
-        0,  # z torque
-    ]
 
-    max_thrust_result = linprog(c=objective, A_ub=None, b_ub=None, A_eq=left_of_equality, b_eq=right_of_equality,
-                                bounds=bounds, method="highs")
+def _solve_thrust_lps(transformed_orientations, templates: ThrustLPTemplates):
+    """
+    Solve both LPs of get_max_thrust with linprog, leaving the ties of the min current LP and the current limit to the
+    caller
+    :return: linprog's results of the max thrust LP and the min current LP
+    """
+    from scipy.optimize import linprog
+
+    timer = _start_timer()
+    templates.update(transformed_orientations)
+    _stop_timer("lp_assembly", timer)
+
+    # First Simplex run. Find the maximum thrust in the desired direction
+    timer = _start_timer()
+    max_thrust_result = linprog(c=templates.objective, A_ub=None, b_ub=None, A_eq=templates.left_of_equality,
+                                b_eq=templates.right_of_equality, bounds=templates.bounds, method="highs")
+    _stop_timer("lp_solve", timer)
+    _record_lp(LINPROG_STATUSES.get(max_thrust_result.status, "Unknown"), max_thrust_result.nit)
 
     max_thrust = -.999 * max_thrust_result.fun  # some sort of precision/numerical error makes this bullshit necessary
 
     # Second Simplex run. Find the minimum current that produces the same thrust as the first result
-    objective_mincurrent = []
-    left_of_equality_mincurrent = []
+    templates.right_of_equality_mincurrent[0] = max_thrust  # x thrust constrained to previous maximum
+
+    timer = _start_timer()
+    min_current_result = linprog(c=templates.objective_mincurrent, A_ub=None, b_ub=None,
+                                 A_eq=templates.left_of_equality_mincurrent,
+                                 b_eq=templates.right_of_equality_mincurrent, bounds=templates.bounds_mincurrent,
+                                 method="highs")
+    _stop_timer("lp_solve", timer)
+    _record_lp(LINPROG_STATUSES.get(min_current_result.status, "Unknown"), min_current_result.nit)
+    return max_thrust_result, min_current_result
+
+
+def _linprog_bases(templates: ThrustLPTemplates, max_thrust_result, min_current_result):
+    """
+    Work out which bounds each thruster was at in the optimal solutions of the two LPs linprog solved
+    :return: The (N, 3) basis, see sweep_directions
+    """
+    max_thrust_status = _linprog_basis(max_thrust_result, templates.left_of_equality, *templates.bounds.transpose())
+    min_current_status = _linprog_basis(min_current_result, templates.left_of_equality_mincurrent,
+                                        *templates.bounds_mincurrent.transpose())
+    return np.stack((max_thrust_status, min_current_status[0::2], min_current_status[1::2]), axis=-1)
+
+
+def _basis_status(values: np.ndarray, lower: np.ndarray, upper: np.ndarray, tolerance: float = 1e-9):
+    """
+    Work out which variables of an LP solution are at their lower (-1) or upper (1) bound, or between them (0)
+    """
+    return np.where(values <= lower + tolerance, -1, np.where(values >= upper - tolerance, 1, 0)).astype(np.int8)
 
-    thrusts_x_mincurrent = []
-    thrusts_y_mincurrent = []
-    thrusts_z_mincurrent = []
 
-    torques_x_mincurrent = []
-    torques_y_mincurrent = []
-    torques_z_mincurrent = []
+def _linprog_basis(result, matrix: np.ndarray, lower: np.ndarray, upper: np.ndarray, tolerance: float = 1e-9):
+    """
+    Work out the optimal basis of an LP that linprog solved, which it doesn't return. The variables between their
+    bounds are basic, but in a degenerate solution some of the ones at a bound are too. Any that could be (their
+    reduced cost is 0) and are independent of the others are counted as basic, up to the rank of the constraints.
+    :return: The status of each variable, see _basis_status
+    """
+    status = _basis_status(result.x, lower, upper, tolerance)
+    basic = status == 0
+    rank = np.linalg.matrix_rank(matrix)
+    reduced_costs = result.lower.marginals + result.upper.marginals
+    for column in np.flatnonzero(~basic & (np.abs(reduced_costs) <= tolerance)):
+        if np.count_nonzero(basic) >= rank:
+            break
+        basic[column] = True
+        if np.linalg.matrix_rank(matrix[:, basic]) < np.count_nonzero(basic):
+            basic[column] = False
+    status[basic] = 0
+    return status
+
+
+def _complete_rows(matrix: np.ndarray, status: np.ndarray):
+    """
+    Work out which rows of an LP with equality constraints are basic, given which of its variables are. A basis has
+    one basic variable or row per row, so every row the basic variables don't cover has a basic slack instead, which
+    happens when the solution is degenerate or the rows aren't independent.
+    :param matrix: The (R, C) constraint matrix
+    :param status: The (C,) status of each variable, 0 for the basic ones
+    :return: The (R,) status of each row, 0 for the basic ones and -1 for the others
+    """
+    from scipy.linalg import qr
+
+    row_status = np.zeros(len(matrix), dtype=np.int8)
+    basic_columns = matrix[:, status == 0]
+    if basic_columns.shape[1]:
+        # The rows that pivoted QR of the basic columns' transpose picks first are independent in those columns
+        rank = np.linalg.matrix_rank(basic_columns)
+        row_status[qr(basic_columns.transpose(), mode="r", pivoting=True)[1][:rank]] = -1
+    return row_status
+
+
+def _max_thrust_matrix(wrenches: np.ndarray, directions: np.ndarray):
+    """
+    Set up the constraint matrix of the max thrust LP the way HighsThrustSolver does, for one or more directions
+    :param wrenches: The 6xN envelope_wrenches of the thrusters
+    :param directions: A (3,) or (M, 3) array of unit vectors
+    :return: A 6x(N + 1) or Mx6x(N + 1) array, with a column for each thruster and then t
+    """
+    directions = np.asarray(directions)
+    matrices = np.zeros(directions.shape[:-1] + (6, wrenches.shape[1] + 1))
+    matrices[..., :wrenches.shape[1]] = wrenches
+    matrices[..., :3, -1] = -directions
+    return matrices
+
+
+def _import_highspy():
+    """
+    Import highspy the first time it's needed
+    :return: The highspy module, or None if it isn't installed
+    """
+    global highspy
+    if highspy is None:
+        try:
+            import highspy
+        except ImportError:  # highspy is optional, without it every LP goes through scipy's linprog instead
+            return None
+    return highspy
+
+
+class HighsThrustSolver:
+    """
+    Solves the same two LPs as get_max_thrust, but keeps both of them as persistent HiGHS models for one set of
+    thrusters. Each direction only updates the coefficients that depend on it and warm-starts from the previous
+    optimal basis, which is nearly optimal already when neighbouring directions are solved one after another.
+
+    Instead of rotating the thrusters into the frame of the target direction, both LPs are set up in the vehicle frame:
+    the net force has to equal t * target_dir with zero torque, and t is maximized. Only the three coefficients of the
+    t column of the first LP and the force right hand sides of the second LP change between directions.
+
+    With envelope="torque", the force and torque rows swap places: the net torque has to equal t * target_dir with
+    zero net force, so it solves the max torque instead.
+    """
+
+    def __init__(self, thrusters: t.List[Thruster3D], max_current: int, envelope: str = "thrust"):
+        if _import_highspy() is None:
+            raise RuntimeError("the HiGHS solver needs the highspy package to be installed")
+
+        thrusters = ThrusterSet.from_thrusters(thrusters)
+        self.thrusters = thrusters
+        self.max_current = max_current
+        self.num_thrusters = len(thrusters)
+        self.current_limit_can_bind = thrusters.max_current_draw() > max_current
+
+        wrenches = thrusters.envelope_wrenches(envelope)  # 6xN, rows are x, y, z force then x, y, z torque
+
+        half_wrenches = thrusters.half_thruster_wrenches(envelope)
+        half_thrust_costs, half_thrust_upper = thrusters.half_thrusters()  # Same objective as get_max_thrust
+        # What _least_current_allocation needs to break the ties of the min current LP
+        self.tie_break = (half_wrenches, half_thrust_costs, half_thrust_upper) + thrusters.half_thruster_current()
+
+        # First LP: maximize t, subject to (force, torque) = (t * target_dir, 0). Columns are each thruster, then t
+        self.max_thrust_model = self._make_model(
+            np.concatenate((wrenches, np.zeros((6, 1))), axis=1),  # The t column is filled in for each direction
+            cost=[0] * self.num_thrusters + [-1],  # Minimizing only, so maximize t by minimizing -t
+            lower=np.append(thrusters.bounds[:, 0], -highspy.kHighsInf),
+            upper=np.append(thrusters.bounds[:, 1], highspy.kHighsInf)
+        )
+
+        # Second LP: minimize the total thrust that produces the maximum found by the first one, with each thruster
+        # duplicated into a forward and a reverse half-thruster
+        self.min_current_model = self._make_model(
+            half_wrenches,
+            cost=half_thrust_costs,
+            lower=[0] * (2 * self.num_thrusters),
+            upper=half_thrust_upper
+        )
+
+    @staticmethod
+    def _make_model(matrix: np.ndarray, cost, lower, upper):
+        lp = highspy.HighsLp()
+        lp.num_col_ = matrix.shape[1]
+        lp.num_row_ = matrix.shape[0]
+        lp.col_cost_ = np.array(cost, dtype=float)
+        lp.col_lower_ = np.array(lower, dtype=float)
+        lp.col_upper_ = np.array(upper, dtype=float)
+        lp.row_lower_ = np.zeros(matrix.shape[0])  # Every row is an equality, all of them 0 until changed
+        lp.row_upper_ = np.zeros(matrix.shape[0])
+
+        # Store the matrix densely so every coefficient that gets changed later already has a slot
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = np.arange(0, matrix.size + 1, matrix.shape[0], dtype=np.int32)
+        lp.a_matrix_.index_ = np.tile(np.arange(matrix.shape[0], dtype=np.int32), matrix.shape[1])
+        lp.a_matrix_.value_ = matrix.flatten(order="F")
+
+        model = highspy.Highs()
+        model.setOptionValue("output_flag", False)
+        model.setOptionValue("solver", "simplex")  # The simplex method is the one that can warm-start from a basis
+        model.setOptionValue("presolve", "off")  # Presolving a model this small costs more than it saves
+        model.passModel(lp)
+        return model
+
+    def solve(self, target_dir: np.ndarray, return_basis=False, start_basis: t.Tuple[np.ndarray, np.ndarray] = None):
+        """
+        Calculate the maximum zero-torque thrust in the given direction
+        :param target_dir: A 3d unit vector in the target direction
+        :param return_basis: Whether to also return the optimal basis of both LPs, see sweep_directions
+        :param start_basis: A basis and its row statuses to start from instead of the optimal one of the previous
+        direction, like the ones sweep_directions returned for the same direction with slightly different thrusters
+        :return: The maximum thrust force in kgf, and the thrust of each thruster in kgf, plus the basis and its row
+        statuses if requested
+        """
+        max_thrust, half_thrusts, reduced_costs = self._solve_lps(target_dir, start_basis)
+        half_thrusts = _least_current_allocation(half_thrusts, *self.tie_break, reduced_costs)
+        thrusts = half_thrusts[0::2] - half_thrusts[1::2]  # combine half-thrusters into full thrusters
+
+        thrust_multiplier = self._current_limit_multiplier(thrusts)
+
+        if return_basis:
+            return (max_thrust * thrust_multiplier, thrusts * thrust_multiplier) + self._basis()
+        return max_thrust * thrust_multiplier, thrusts * thrust_multiplier
+
+    def solve_batch(self, directions: np.ndarray, start_bases: t.Tuple[np.ndarray, np.ndarray] = None):
+        """
+        Calculate the same as solve for each of a batch of directions, one after another. The ties of the min current
+        LP are broken for every direction at once, which is a lot quicker than one at a time.
+        :param directions: An (M, 3) array of unit vectors in the target directions
+        :param start_bases: The (M, N, 3) bases and (M, 2, 6) row statuses to start each direction from, see solve
+        :return: An (M,) array of the maximum thrust in each direction, an (M, N) array of the thrust of each
+        thruster, and the (M, N, 3) bases and (M, 2, 6) row statuses, the same as sweep_directions returns
+        """
+        max_thrust = np.empty(len(directions))
+        half_thrusts = np.empty((len(directions), 2 * self.num_thrusters))
+        reduced_costs = np.empty((len(directions), 2 * self.num_thrusters))
+        bases = np.empty((len(directions), self.num_thrusters, 3), dtype=np.int8)
+        row_bases = np.empty((len(directions), 2, 6), dtype=np.int8)
+        for i, direction in enumerate(directions):
+            start_basis = None if start_bases is None else (start_bases[0][i], start_bases[1][i])
+            max_thrust[i], half_thrusts[i], reduced_costs[i] = self._solve_lps(direction, start_basis)
+            bases[i], row_bases[i] = self._basis()
+
+        half_thrusts = _least_current_allocation_batch(half_thrusts, *self.tie_break, reduced_costs)
+        thrusts = half_thrusts[:, 0::2] - half_thrusts[:, 1::2]
+
+        thrust_multipliers = np.array([self._current_limit_multiplier(direction_thrusts)
+                                       for direction_thrusts in thrusts]).reshape(-1)
+        return max_thrust * thrust_multipliers, thrusts * thrust_multipliers[:, np.newaxis], bases, row_bases
+
+    def _solve_lps(self, target_dir: np.ndarray, start_basis: t.Tuple[np.ndarray, np.ndarray] = None):
+        """
+        Solve both LPs for a direction, leaving the ties of the min current LP and the current limit to the caller
+        :return: The maximum thrust in kgf, and the (2N,) half-thrusts and their reduced costs in the min current LP
+        """
+        # First Simplex run. Find the maximum thrust in the desired direction
+        timer = _start_timer()
+        t_column = self.num_thrusters
+        for row in range(3):
+            self.max_thrust_model.changeCoeff(row, t_column, -target_dir[row])  # force - t * target_dir = 0
+        if start_basis is not None:
+            basis, row_basis = start_basis
+            self._set_basis(self.max_thrust_model, np.append(basis[:, 0], 0), row_basis[0])  # t is always basic
+            self._set_basis(self.min_current_model, basis[:, 1:].reshape(-1), row_basis[1])
+        _stop_timer("lp_assembly", timer)
+        self._run(self.max_thrust_model)
+
+        max_thrust = .999 * self.max_thrust_model.getSolution().col_value[t_column]  # Same margin as get_max_thrust
+
+        # Second Simplex run. Find the minimum current that produces the same thrust as the first result
+        timer = _start_timer()
+        for row in range(3):
+            self.min_current_model.changeRowBounds(row, max_thrust * target_dir[row], max_thrust * target_dir[row])
+        _stop_timer("lp_assembly", timer)
+        self._run(self.min_current_model)
+
+        solution = self.min_current_model.getSolution()
+        return max_thrust, np.array(solution.col_value), np.array(solution.col_dual)
+
+    def _basis(self):
+        """
+        :return: The optimal basis of both LPs and its row statuses, see sweep_directions
+        """
+        max_thrust_status, max_thrust_rows = self._basis_status(self.max_thrust_model)
+        min_current_status, min_current_rows = self._basis_status(self.min_current_model)
+        basis = np.stack((max_thrust_status[:self.num_thrusters], min_current_status[0::2], min_current_status[1::2]),
+                         axis=-1)
+        return basis, np.stack((max_thrust_rows, min_current_rows))
+
+    def _current_limit_multiplier(self, thrusts: np.ndarray):
+        if not self.current_limit_can_bind:
+            return 1.
+        return _current_limit_multiplier(thrusts, self.max_current, self.thrusters.fwd_current,
+                                         self.thrusters.rev_current)
+
+    @staticmethod
+    def _run(model):
+        timer = _start_timer()
+        model.run()
+        _stop_timer("lp_solve", timer)
+        if _stats is not None:
+            _record_lp(model.modelStatusToString(model.getModelStatus()), model.getInfo().simplex_iteration_count)
+
+    @staticmethod
+    def _basis_status(model):
+        """
+        :return: The status of each column and each row in the model's basis: 0 if basic, 1 at the upper bound and -1
+        at the lower one
+        """
+        statuses = {highspy.HighsBasisStatus.kBasic: 0, highspy.HighsBasisStatus.kUpper: 1}
+        basis = model.getBasis()
+        return (np.array([statuses.get(status, -1) for status in basis.col_status], dtype=np.int8),
+                np.array([statuses.get(status, -1) for status in basis.row_status], dtype=np.int8))
+
+    @staticmethod
+    def _set_basis(model, status: np.ndarray, row_status: np.ndarray):
+        # The other way around from _basis_status. HiGHS repairs a basis that turns out to be singular by itself.
+        statuses = (highspy.HighsBasisStatus.kLower, highspy.HighsBasisStatus.kBasic, highspy.HighsBasisStatus.kUpper)
+        basis = highspy.HighsBasis()
+        basis.col_status = [statuses[value + 1] for value in status]
+        basis.row_status = [statuses[value + 1] for value in row_status]
+        basis.valid = True
+        model.setBasis(basis)
+
+
+def _sweep_range(thrusters: t.List[Thruster3D], directions: np.ndarray, max_current: int, solver: str,
+                 envelope: str = "thrust", start_bases: t.Tuple[np.ndarray, np.ndarray] = None):
+    """
+    Solve a batch of directions one after another
+    :param start_bases: The bases and row statuses to start the HiGHS solvers from, see sweep_directions
+    :return: The rho, allocations, bases and row statuses of the bases of the directions, the same as
+    sweep_directions returns
+    """
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    if solver == "highs":
+        return HighsThrustSolver(thrusters, max_current, envelope=envelope).solve_batch(directions, start_bases)
+
+    bases = np.empty((len(directions), len(thrusters), 3), dtype=np.int8)
+    row_bases = np.empty((len(directions), 2, 6), dtype=np.int8)
+
+    # The templates carry the torques and the thruster specs, which don't depend on the direction
+    torque_constraints = thrusters.envelope_wrenches(envelope)[3:].transpose()  # Nx3, the forces for a torque sweep
+
+    transformed_orientations = transform_orientations_batch(thrusters, directions, envelope)
+    templates = ThrustLPTemplates(torque_constraints, thrusters)
+
+    # linprog doesn't say which rows are basic either, so they're worked out in the vehicle frame HiGHS uses
+    wrenches = thrusters.envelope_wrenches(envelope)
+    half_wrenches = thrusters.half_thruster_wrenches(envelope)
+
+    half_thrusts = np.empty((len(directions), 2 * len(thrusters)))
+    reduced_costs = np.empty((len(directions), 2 * len(thrusters)))
+    for i in range(len(directions)):
+        max_thrust_result, min_current_result = _solve_thrust_lps(transformed_orientations[i], templates)
+        half_thrusts[i] = min_current_result.x
+        reduced_costs[i] = min_current_result.lower.marginals + min_current_result.upper.marginals
+        bases[i] = _linprog_bases(templates, max_thrust_result, min_current_result)
+        row_bases[i, 0] = _complete_rows(_max_thrust_matrix(wrenches, directions[i]), np.append(bases[i, :, 0], 0))
+        row_bases[i, 1] = _complete_rows(half_wrenches, bases[i, :, 1:].reshape(-1))
+
+    # Break the ties of every direction at once, like HighsThrustSolver.solve_batch. That's done in the vehicle frame,
+    # where the min current LPs have the same optimal allocations as in the frame of each direction.
+    half_thrusts = _least_current_allocation_batch(half_thrusts, half_wrenches, templates.objective_mincurrent,
+                                                   templates.bounds_mincurrent[:, 1], *templates.half_thrust_current,
+                                                   reduced_costs)
+    allocations = half_thrusts[:, 0::2] - half_thrusts[:, 1::2]
+    rho = np.einsum("mn,mn->m", allocations, transformed_orientations[:, :, 0])  # The thrust in each direction
+    if templates.max_current_draw > max_current:  # See get_max_thrust
+        thrust_multipliers = np.array([
+            _current_limit_multiplier(thrusts, max_current, templates.fwd_current, templates.rev_current)
+            for thrusts in allocations
+        ]).reshape(-1)
+        rho *= thrust_multipliers
+        allocations *= thrust_multipliers[:, np.newaxis]
+    return rho, allocations, bases, row_bases
+
+
+# State of each process pool worker, set up once by _init_sweep_worker so it doesn't get pickled with every chunk
+_worker_state = {}
+
+
+def _init_sweep_worker(thrusters, directions, max_current, solver, envelope, start_bases, rho_name, allocations_name,
+                       bases_name, row_bases_name, collect_stats):
+    enable_stats(collect_stats)  # Forked workers start with a copy of the parent's stats, which it already has
+    # Attach to the result arrays the parent process created, so results are written straight into them
+    rho_shm = shared_memory.SharedMemory(name=rho_name)
+    allocations_shm = shared_memory.SharedMemory(name=allocations_name)
+    bases_shm = shared_memory.SharedMemory(name=bases_name)
+    row_bases_shm = shared_memory.SharedMemory(name=row_bases_name)
+
+    _worker_state.update(
+        thrusters=thrusters,
+        directions=directions,
+        max_current=max_current,
+        solver=solver,
+        envelope=envelope,
+        start_bases=start_bases,
+        # Keep the blocks open for as long as the worker lives
+        shms=(rho_shm, allocations_shm, bases_shm, row_bases_shm),
+        rho=np.ndarray((len(directions),), dtype=float, buffer=rho_shm.buf),
+        allocations=np.ndarray((len(directions), len(thrusters)), dtype=float, buffer=allocations_shm.buf),
+        bases=np.ndarray((len(directions), len(thrusters), 3), dtype=np.int8, buffer=bases_shm.buf),
+        row_bases=np.ndarray((len(directions), 2, 6), dtype=np.int8, buffer=row_bases_shm.buf),
+    )
+
+
+def _sweep_chunk(chunk: t.Tuple[int, int]):
+    start, stop = chunk
+    start_bases = _worker_state["start_bases"]
+    (_worker_state["rho"][start:stop], _worker_state["allocations"][start:stop],
+     _worker_state["bases"][start:stop], _worker_state["row_bases"][start:stop]) = _sweep_range(
+        _worker_state["thrusters"], _worker_state["directions"][start:stop], _worker_state["max_current"],
+        _worker_state["solver"], _worker_state["envelope"],
+        None if start_bases is None else (start_bases[0][start:stop], start_bases[1][start:stop])
+    )
+    return chunk, _take_stats()
+
+
+def _init_store_worker(thrusters, directions, rows, max_current, solver, envelope, store_path, collect_stats):
+    enable_stats(collect_stats)  # See _init_sweep_worker
+    _worker_state.update(
+        thrusters=thrusters,
+        directions=directions,
+        rows=rows,
+        max_current=max_current,
+        solver=solver,
+        envelope=envelope,
+        store=SweepStore(store_path, writable=True),  # Results are written straight into the file
+    )
+
+
+def _store_chunk(chunk: t.Tuple[int, int]):
+    start, stop = chunk
+    directions = _worker_state["directions"]
+    _sweep_range_to_store(_worker_state["store"], _worker_state["rows"][start:stop], _worker_state["thrusters"],
+                          None if directions is None else directions[start:stop], _worker_state["max_current"],
+                          _worker_state["solver"], _worker_state["envelope"])
+    return chunk, _take_stats()
+
+
+def _sweep_range_to_store(store: "SweepStore", rows: np.ndarray, thrusters: t.List[Thruster3D], directions: np.ndarray,
+                          max_current: int, solver: str, envelope: str):
+    """
+    Solve a batch of directions with _sweep_range, and write their results into the given rows of a store
+    :param directions: The directions to solve, or None for the ones in those rows of the store
+    """
+    if directions is None:
+        directions = store.directions[rows].astype(float)
+        directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    rho, allocations, bases, row_bases = _sweep_range(thrusters, directions, max_current, solver, envelope)
+    store.rho[rows] = rho
+    store.allocations[rows] = allocations
+    store.bases[rows] = bases
+    store.row_bases[rows] = row_bases
+    store.flush()  # So they're on disk by the time the parent flags their chunks as complete
+
+
+class Symmetry(t.NamedTuple):
+    """
+    A reflection or rotation that maps a set of thrusters onto itself. Thruster i lands on thruster permutation[i],
+    pointing the same way if signs[i] is 1 or the opposite way (with its forward and reverse specs swapped) if it's -1.
+    The envelope has the same symmetry: the thrust towards matrix . d is the same as towards d.
+    """
+    matrix: np.ndarray  # 3x3
+    permutation: np.ndarray  # N
+    signs: np.ndarray  # N
+
+
+def _canonical_rows(positions: np.ndarray, orientations: np.ndarray, thrusters: ThrusterSet, decimals: int):
+    """
+    Describe each thruster as one rounded row of numbers, with reversed thrusters normalized to point the same way
+    :return: The rows sorted into a canonical order, the index of the thruster each row came from, and whether each
+    thruster had to be reversed (-1) or not (1)
+    """
+    orientations = np.round(orientations, decimals)
+
+    # A thruster pointing the other way with its forward and reverse specs swapped is the same thruster, so reverse
+    # every thruster whose first nonzero orientation component is negative
+    first_nonzero = orientations[np.arange(len(thrusters)), np.argmax(orientations != 0, axis=1)]
+    signs = np.where(first_nonzero < 0, -1, 1)
+    reversed_thrusters = (signs < 0)[:, np.newaxis]
+
+    specs = np.where(
+        reversed_thrusters,
+        np.concatenate((-thrusters.bounds[:, ::-1], thrusters.rev_current, thrusters.fwd_current), axis=1),
+        np.concatenate((thrusters.bounds, thrusters.fwd_current, thrusters.rev_current), axis=1)
+    )
+
+    rows = np.concatenate((np.round(positions, decimals), signs[:, np.newaxis] * orientations,
+                           np.round(specs, decimals)), axis=1) + 0.  # Adding 0 turns -0.0 into 0.0
+    order = np.lexsort(rows.transpose()[::-1])  # Sort by the first column, then the second, and so on
+    return rows[order], order, signs
+
+
+def canonical_layout(thrusters: t.List[Thruster3D], decimals: int = 6):
+    """
+    Describe a set of thrusters in a way that doesn't depend on the order they're listed in, or on which way round
+    otherwise identical reversible thrusters are specified. Equivalent layouts give equal arrays.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param decimals: How many decimal places to round every value to
+    :return: An (N, 14) array with a row of position, orientation, max thrusts and current coefficients per thruster
+    """
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    return _canonical_rows(thrusters.positions, thrusters.orientations, thrusters, decimals)[0]
+
+
+def find_symmetries(thrusters: t.List[Thruster3D], decimals: int = 6):
+    """
+    Find the mirror and rotational symmetries of a set of thrusters. Only reflections in the coordinate planes, and
+    rotations swapping the coordinate axes are considered, since those are the symmetries vehicles are designed with.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param decimals: How many decimal places positions and orientations have to match to
+    :return: A list of Symmetry objects forming a group, always including the identity
+    """
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    positions, orientations = thrusters.positions, thrusters.orientations
+    rows, order, signs = _canonical_rows(positions, orientations, thrusters, decimals)
+
+    symmetries = []
+    # Every signed permutation matrix: the 48 symmetries of a cube
+    for axes in itertools.permutations(range(3)):
+        for flips in itertools.product((1, -1), repeat=3):
+            matrix = np.zeros((3, 3))
+            matrix[range(3), axes] = flips
+
+            # Move the whole layout and check whether the result describes the same thrusters
+            moved_rows, moved_order, moved_signs = _canonical_rows(
+                positions.dot(matrix.transpose()), orientations.dot(matrix.transpose()), thrusters, decimals
+            )
+            if not np.array_equal(rows, moved_rows):
+                continue
+
+            # Rows that match up are the same thruster before and after moving
+            permutation = np.empty(len(thrusters), dtype=int)
+            permutation[moved_order] = order
+            symmetries.append(Symmetry(matrix, permutation, moved_signs * signs[permutation]))
+
+    return symmetries
+
+
+def _fundamental_directions(directions: np.ndarray, symmetries: t.List[Symmetry], decimals: int = 9):
+    """
+    Map every direction onto one representative of the directions the symmetries make equivalent to it
+    :return: An array of the distinct representatives, the index of the representative of each direction, and the
+    index of the symmetry that maps each direction onto its representative
+    """
+    best = None
+    best_symmetry = np.zeros(len(directions), dtype=int)
+    for index, symmetry in enumerate(symmetries):
+        image = np.round(directions.dot(symmetry.matrix.transpose()), decimals) + 0.
+
+        if best is None:
+            best = image
+            continue
 
-    bounds_mincurrent = []
+        # Keep whichever of the images is lexicographically largest, so every equivalent direction picks the same one
+        larger = np.zeros(len(directions), dtype=bool)
+        equal = np.ones(len(directions), dtype=bool)
+        for axis in range(3):
+            larger |= equal & (image[:, axis] > best[:, axis])
+            equal &= image[:, axis] == best[:, axis]
+        best[larger] = image[larger]
+        best_symmetry[larger] = index
 
-    for i, orientation in enumerate(transformed_orientations, start=0):
-        # duplicate each thruster into a forward and a reverse half-thruster
-        objective_mincurrent.append(1)  # minimize the thrust of all thrusters weighted equally
-        objective_mincurrent.append(1)
+    representatives, first, inverse = np.unique(best, axis=0, return_index=True, return_inverse=True)
 
-        thrusts_x_mincurrent.append(orientation[0])
-        thrusts_x_mincurrent.append(-orientation[0])  # duplicate, reversed thruster
+    # Use the unrounded image of the first direction that landed on each representative
+    first_symmetries = [symmetries[index].matrix for index in best_symmetry[first]]
+    representatives = np.array([matrix.dot(directions[i]) for matrix, i in zip(first_symmetries, first)])
 
-        thrusts_y_mincurrent.append(orientation[1])
-        thrusts_y_mincurrent.append(-orientation[1])
+    return representatives.reshape(-1, 3), inverse.reshape(-1), best_symmetry
 
-        thrusts_z_mincurrent.append(orientation[2])
-        thrusts_z_mincurrent.append(-orientation[2])
 
-        torques_x_mincurrent.append(t_constraints[i][0])
-        torques_x_mincurrent.append(-t_constraints[i][0])
+def _permute_thrusters(permutation: np.ndarray, signs: np.ndarray, allocations: np.ndarray = None,
+                       bases: np.ndarray = None):
+    """
+    Renumber the thrusters of per-thruster results so thruster i takes the result of thruster permutation[i], reversed
+    if signs[i] is -1. Both arrays can have any number of leading axes, and permutation and signs broadcast over them.
+    :return: The renumbered allocations and bases, whichever were given
+    """
+    results = []
+    if allocations is not None:
+        results.append(signs * np.take_along_axis(allocations, np.broadcast_to(permutation, allocations.shape), -1))
+    if bases is not None:
+        bases = np.take_along_axis(bases, np.broadcast_to(permutation[..., np.newaxis], bases.shape), -2)
+        # A reversed thruster is at the opposite bound, and its forward and reverse half-thrusters swap places
+        reversed_bases = np.stack((-bases[..., 0], bases[..., 2], bases[..., 1]), axis=-1)
+        results.append(np.where((signs < 0)[..., np.newaxis], reversed_bases, bases).astype(np.int8))
+    return results[0] if len(results) == 1 else tuple(results)
+
+
+def _permute_rows(matrices: np.ndarray, row_bases: np.ndarray):
+    """
+    Renumber the row statuses of bases (see sweep_directions) for directions that the given symmetry matrices map onto
+    the directions the bases are from. Those are signed permutations, so each force and torque row of the LPs becomes
+    one row of the other direction's LPs, maybe negated, which doesn't change whether it's basic.
+    :param matrices: An (..., 3, 3) array of the symmetry that maps each direction onto the one its bases are from
+    :param row_bases: An (..., 2, 6) array of the row statuses of those bases
+    :return: The (..., 2, 6) row statuses for the directions themselves
+    """
+    axes = np.argmax(np.abs(matrices), axis=-2)  # Row j of a direction's LPs is row axes[j] of the other one's
+    rows = np.concatenate((axes, axes + 3), axis=-1)[..., np.newaxis, :]  # The torque rows follow the force ones
+    return np.take_along_axis(row_bases, np.broadcast_to(rows, row_bases.shape), -1)
 
-        torques_y_mincurrent.append(t_constraints[i][1])
-        torques_y_mincurrent.append(-t_constraints[i][1])
 
-        torques_z_mincurrent.append(t_constraints[i][2])
-        torques_z_mincurrent.append(-t_constraints[i][2])
+def _envelope_symmetries(thrusters: t.List[Thruster3D], envelope: str):
+    """
+    Find the symmetries of a set of thrusters (see find_symmetries) as they act on the directions of an envelope
+    """
+    symmetries = find_symmetries(thrusters)
+    if envelope == "torque":
+        # Torques are cross products, so a reflection of the thrusters reflects their torques and reverses them
+        symmetries = [symmetry._replace(matrix=np.round(np.linalg.det(symmetry.matrix)) * symmetry.matrix)
+                      for symmetry in symmetries]
+    return symmetries
 
-        bounds_mincurrent.append((0, 3.71))
-        bounds_mincurrent.append((0, 2.90))
 
-    left_of_equality_mincurrent.append(thrusts_x_mincurrent)
-    left_of_equality_mincurrent.append(thrusts_y_mincurrent)
-    left_of_equality_mincurrent.append(thrusts_z_mincurrent)
+def _apply_symmetries(symmetries: t.List[Symmetry], symmetry_index: np.ndarray, allocations: np.ndarray,
+                      bases: np.ndarray, row_bases: np.ndarray):
+    """
+    Turn the results of the representatives of some directions (see _fundamental_directions) into their own results
+    :param symmetry_index: The (M,) index of the symmetry that maps each direction onto its representative
+    :param allocations: The (M, N) allocations of the representative of each direction
+    :param bases: Its (M, N, 3) bases
+    :param row_bases: Its (M, 2, 6) row statuses
+    :return: The allocations, bases and row statuses of the directions
+    """
+    # Each direction was mapped onto its representative by a symmetry, which also moves thruster i onto thruster
+    # permutation[i] (maybe reversed), so thruster i does what that one did in the representative
+    allocations, bases = _permute_thrusters(
+        np.array([symmetry.permutation for symmetry in symmetries])[symmetry_index],
+        np.array([symmetry.signs for symmetry in symmetries])[symmetry_index],
+        allocations, bases
+    )
+    row_bases = _permute_rows(np.array([symmetry.matrix for symmetry in symmetries])[symmetry_index], row_bases)
+    return allocations, bases, row_bases
 
-    left_of_equality_mincurrent.append(torques_x_mincurrent)
-    left_of_equality_mincurrent.append(torques_y_mincurrent)
-    left_of_equality_mincurrent.append(torques_z_mincurrent)
 
-    right_of_equality_mincurrent = [
-        max_thrust,  # x thrust constrained to previous maximum
-        0,  # y thrust
-        0,  # z thrust
-        0,  # x torque
-        0,  # y torque
-        0,  # z torque
+def sweep_directions(thrusters: t.List[Thruster3D], directions: np.ndarray, max_current: int = DEFAULT_MAX_CURRENT,
+                     jobs: int = 1, solver: str = "auto", use_symmetry=False, return_allocations=False,
+                     return_bases=False, envelope: str = "thrust", start_bases: t.Tuple[np.ndarray, np.ndarray] = None):
+    """
+    Calculate the maximum zero-torque thrust in each of a batch of directions, or with envelope="torque" the maximum
+    torque at zero net force around each of them
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param directions: An (M, 3) array of vectors in the target directions
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param jobs: The number of processes to split the directions between, or 0 to use every CPU core
+    :param solver: "highs" for persistent HiGHS models (see HighsThrustSolver), "linprog" for get_max_thrust, or
+    "auto" to use HiGHS when highspy is installed
+    :param use_symmetry: Whether to only solve one of each set of directions that the symmetries of the thrusters make
+    equivalent, and fill in the rest from it
+    :param return_allocations: Whether to also return the thrust of each thruster in each direction
+    :param return_bases: Whether to also return the optimal basis of the LPs solved for each direction
+    :return: An (M,) array of the maximum thrust force in each direction in kgf, plus an (M, N) array of the thrust of
+    each thruster if return_allocations is set, plus an (M, N, 3) array of the optimal bases and an (M, 2, 6) array of
+    their row statuses if return_bases is set. For each thruster the bases hold whether it was at its reverse bound
+    (-1), forward bound (1) or basic (0) in the max thrust LP, and the same for its forward and reverse half-thrusters
+    in the min current LP (where -1 is unused). The row statuses are those of the force and torque rows of the max
+    thrust LP and then the min current LP, set up in the vehicle frame like HighsThrustSolver does: 0 where the row's
+    slack is basic in place of a variable, which happens when a solution is degenerate, and 1 or -1 where it isn't.
+    :param envelope: "thrust" or "torque", see ENVELOPES. The torque is in kgf times the unit of the thruster positions.
+    :param start_bases: The (M, N, 3) bases and (M, 2, 6) row statuses of an earlier sweep of the same directions for
+    the HiGHS solvers to start from, instead of the previous direction's optimal basis. Those are usually only a few
+    pivots away from optimal when the thrusters changed only a little. linprog ignores them.
+    """
+    directions = np.asarray(directions, dtype=float)
+    directions = directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Make every direction a unit vector
+
+    if use_symmetry and start_bases is not None:
+        raise ValueError("start_bases are per direction, so they can't be combined with use_symmetry")
+
+    if use_symmetry:
+        symmetries = _envelope_symmetries(thrusters, envelope)
+        if len(symmetries) > 1:
+            representatives, inverse, symmetry_index = _fundamental_directions(directions, symmetries)
+            rho, allocations, bases, row_bases = sweep_directions(thrusters, representatives, max_current, jobs,
+                                                                  solver, return_allocations=True, return_bases=True,
+                                                                  envelope=envelope)
+            allocations, bases, row_bases = _apply_symmetries(symmetries, symmetry_index, allocations[inverse],
+                                                              bases[inverse], row_bases[inverse])
+            return _sweep_results(rho[inverse], allocations, bases, row_bases, return_allocations, return_bases)
+
+    if solver == "auto":
+        solver = "highs" if _import_highspy() is not None else "linprog"
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(directions))
+
+    rho_shape = (len(directions),)
+    allocations_shape = (len(directions), len(thrusters))
+    bases_shape = (len(directions), len(thrusters), 3)
+    row_bases_shape = (len(directions), 2, 6)
+
+    if jobs <= 1:
+        rho, allocations, bases, row_bases = _sweep_range(thrusters, directions, max_current, solver, envelope,
+                                                          start_bases)
+    else:
+        # Every worker writes into the same shared memory blocks, so the results never have to be pickled back
+        rho_shm = shared_memory.SharedMemory(create=True, size=max(1, math.prod(rho_shape) * 8))
+        allocations_shm = shared_memory.SharedMemory(create=True, size=max(1, math.prod(allocations_shape) * 8))
+        bases_shm = shared_memory.SharedMemory(create=True, size=max(1, math.prod(bases_shape)))
+        row_bases_shm = shared_memory.SharedMemory(create=True, size=max(1, math.prod(row_bases_shape)))
+        try:
+            # Several chunks per worker so one slow region of the sphere doesn't leave the other workers idle
+            chunk_size = max(1, len(directions) // (jobs * 8))
+            chunks = [(start, min(start + chunk_size, len(directions)))
+                      for start in range(0, len(directions), chunk_size)]
+
+            with multiprocessing.Pool(
+                    jobs,
+                    initializer=_init_sweep_worker,
+                    initargs=(thrusters, directions, max_current, solver, envelope, start_bases, rho_shm.name,
+                              allocations_shm.name, bases_shm.name, row_bases_shm.name, _stats is not None)
+            ) as pool:
+                for _, worker_stats in pool.imap_unordered(_sweep_chunk, chunks):
+                    _merge_stats(worker_stats)
+
+            # Copy the results out before the shared blocks are released
+            rho = np.ndarray(rho_shape, dtype=float, buffer=rho_shm.buf).copy()
+            allocations = np.ndarray(allocations_shape, dtype=float, buffer=allocations_shm.buf).copy()
+            bases = np.ndarray(bases_shape, dtype=np.int8, buffer=bases_shm.buf).copy()
+            row_bases = np.ndarray(row_bases_shape, dtype=np.int8, buffer=row_bases_shm.buf).copy()
+        finally:
+            for shm in (rho_shm, allocations_shm, bases_shm, row_bases_shm):
+                shm.close()
+                shm.unlink()
+
+    return _sweep_results(rho, allocations, bases, row_bases, return_allocations, return_bases)
+
+
+def _sweep_results(rho, allocations, bases, row_bases, return_allocations, return_bases):
+    results = [rho]
+    if return_allocations:
+        results.append(allocations)
+    if return_bases:
+        results += [bases, row_bases]
+    return results[0] if len(results) == 1 else tuple(results)
+
+
+class SweepChunk(t.NamedTuple):
+    """
+    A batch of the results of iter_sweep, for the directions at indices of the whole sweep
+    """
+    indices: np.ndarray  # K
+    directions: np.ndarray  # Kx3
+    rho: np.ndarray  # K
+    allocations: np.ndarray  # KxN
+    bases: np.ndarray  # KxNx3
+    row_bases: np.ndarray  # Kx2x6
+
+
+def iter_sweep(thrusters: t.List[Thruster3D], directions: np.ndarray, max_current: int = DEFAULT_MAX_CURRENT,
+               jobs: int = 1, solver: str = "auto", use_symmetry=False, envelope: str = "thrust",
+               coarse_to_fine=True, first_chunk: int = 32):
+    """
+    Calculate the same as sweep_directions, but yield the results in chunks as soon as each one is solved, for showing
+    progress or stopping early.
+
+    By default the directions are solved in coarse_to_fine_order, so the first chunks are already spread over the whole
+    sphere, and the chunks start small and double in size so the first results come quickly. Stopping the iteration
+    (or closing the generator) stops the sweep, along with any worker processes. The results go into a temporary
+    SweepStore as they're solved, so only the chunk being yielded is ever held in memory. Use sweep_to_store to keep
+    them in a store of your own instead.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param directions: An (M, 3) array of vectors in the target directions
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param jobs: The number of processes to split the directions between, or 0 to use every CPU core
+    :param solver: The LP solver to use, see sweep_directions
+    :param use_symmetry: Whether to only solve one of each set of directions that the symmetries of the thrusters make
+    equivalent. The others are yielded along with it.
+    :param envelope: "thrust" or "torque", see sweep_directions
+    :param coarse_to_fine: Whether to solve the directions in coarse_to_fine_order instead of the order given
+    :param first_chunk: The number of directions solved for the first chunk
+    :return: A generator of SweepChunk tuples, which between them cover every direction once. Their rho, allocations
+    bases and row_bases are the same as those sweep_directions returns.
+    """
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    directions = np.asarray(directions, dtype=float)
+    directions = directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Make every direction a unit vector
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        store = SweepStore.create(os.path.join(directory, "sweep.taustore"), directions, len(thrusters),
+                                  dtype=np.float64)
+        del directions  # They're in the store now
+        try:
+            yield from _sweep_into_store(store, np.arange(store.count), thrusters, max_current, jobs, solver,
+                                         use_symmetry, envelope, coarse_to_fine, first_chunk)
+        finally:
+            store.close()
+
+
+def _sweep_into_store(store: "SweepStore", rows: np.ndarray, thrusters: ThrusterSet, max_current: int, jobs: int,
+                      solver: str, use_symmetry: bool, envelope: str, coarse_to_fine: bool, first_chunk: int):
+    """
+    Solve the directions in some rows of a store, writing the results into it as they're solved. Pool workers open the
+    store themselves and write into it directly, so the results never pass through this process.
+    :return: A generator of SweepChunk tuples like iter_sweep, with indices into the rows of the store. Each chunk is
+    flagged as written in the store before it's yielded.
+    """
+    if len(rows) == 0:
+        return
+
+    symmetries = _envelope_symmetries(thrusters, envelope) if use_symmetry else []
+
+    if len(symmetries) > 1:
+        directions = store.directions[rows].astype(float)
+        representatives, inverse, symmetry_index = _fundamental_directions(directions, symmetries)
+        del directions
+
+        # Put the representatives in the order they're solved in, and group the directions by their representative
+        order = coarse_to_fine_order(representatives) if coarse_to_fine else np.arange(len(representatives))
+        representatives = representatives[order]
+        inverse = np.argsort(order)[inverse]
+        members = np.argsort(inverse, kind="stable")
+        member_starts = np.searchsorted(inverse[members], np.arange(len(representatives) + 1))
+        # Each representative is solved into the row of the first direction it stands for, and copied from there to
+        # the rest of them (see results)
+        first_rows = rows[members[member_starts[:-1]]]
+        num_solved = len(representatives)
+    else:
+        # Every direction stands for itself, and is read from the store when it's solved, so nothing the size of the
+        # whole sweep has to be kept besides the order
+        representatives = None
+        first_rows = rows[coarse_to_fine_order(store.directions[rows])] if coarse_to_fine else rows
+        num_solved = len(rows)
+
+    def results(start, stop):
+        if representatives is None:
+            indices = first_rows[start:stop]  # Already written into the store by whoever solved them
+            store.mark_written(indices)
+        else:
+            # Expand the representatives in [start, stop) to every direction they stand for
+            indices = members[member_starts[start]:member_starts[stop]]
+            solved = first_rows[inverse[indices]]
+            allocations, bases, row_bases = _apply_symmetries(symmetries, symmetry_index[indices],
+                                                              store.allocations[solved], store.bases[solved],
+                                                              store.row_bases[solved])
+            indices = rows[indices]
+            store.write(indices, store.rho[solved], allocations, bases, row_bases)
+
+        return SweepChunk(indices, store.directions[indices].astype(float), store.rho[indices].astype(float),
+                          store.allocations[indices].astype(float), np.array(store.bases[indices]),
+                          np.array(store.row_bases[indices]))
+
+    if solver == "auto":
+        solver = "highs" if _import_highspy() is not None else "linprog"
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, num_solved))
+
+    # Chunks double in size up to several per worker, so one slow region of the sphere doesn't leave the others idle,
+    # but no bigger than a chunk of the store, since a whole chunk of results is in memory at once
+    chunks = []
+    chunk_size = max(1, first_chunk)
+    largest_chunk = max(chunk_size, min(num_solved // (jobs * 8), store.chunk_size))
+    start = 0
+    while start < num_solved:
+        chunks.append((start, min(start + chunk_size, num_solved)))
+        start += chunk_size
+        chunk_size = min(2 * chunk_size, largest_chunk)
+
+    if jobs <= 1:
+        for start, stop in chunks:
+            _sweep_range_to_store(store, first_rows[start:stop], thrusters,
+                                  None if representatives is None else representatives[start:stop], max_current,
+                                  solver, envelope)
+            yield results(start, stop)
+        return
+
+    # Leaving the with block early, like when the generator is closed, terminates the workers
+    with multiprocessing.Pool(
+            jobs,
+            initializer=_init_store_worker,
+            initargs=(thrusters, representatives, first_rows, max_current, solver, envelope, store.path,
+                      _stats is not None)
+    ) as pool:
+        for (start, stop), worker_stats in pool.imap_unordered(_store_chunk, chunks):
+            _merge_stats(worker_stats)
+            yield results(start, stop)
+
+
+def _reuse_bases(matrices: np.ndarray, rhs: np.ndarray, cost: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                 status: np.ndarray, row_status: np.ndarray, tolerance: float = 1e-7):
+    """
+    Check whether the optimal bases of a batch of LPs of the form: minimize cost . x subject to matrix . x = rhs and
+    lower <= x <= upper, are still optimal after the coefficients of the LPs have changed. If a basis still is, the
+    solution it gives is optimal without having to solve the LP again.
+    :param matrices: An (M, R, C) array of constraint matrices, or an (R, C) one shared by every LP
+    :param rhs: An (M, R) array of right hand sides
+    :param cost: A (C,) array of objective coefficients
+    :param lower: A (C,) array of lower bounds
+    :param upper: A (C,) array of upper bounds
+    :param status: An (M, C) array of the previous optimal bases: -1 at the lower bound, 1 at the upper, 0 basic
+    :param row_status: An (M, R) array of the statuses of their rows, 0 where the row's slack is basic
+    :param tolerance: How far a solution may be outside its bounds, or a reduced cost on the wrong side of 0
+    :return: An (M, C) array of the solution each basis gives now, an (M, C) array of its reduced costs, and an (M,)
+    array of whether it is still optimal
+    """
+    num_lps, num_columns = status.shape
+    num_rows = np.shape(matrices)[-2]
+    matrices = np.broadcast_to(matrices, (num_lps, num_rows, num_columns))
+
+    # The nonbasic variables stay at their bounds, and the basic ones have to make up whatever is left of the rhs
+    solutions = np.where(status < 0, lower, np.where(status > 0, upper, 0.)).astype(float)
+    remaining = rhs - np.einsum("mrc,mc->mr", matrices, solutions)
+    all_reduced_costs = np.full((num_lps, num_columns), np.nan)
+    optimal = np.zeros(num_lps, dtype=bool)
+
+    # A basis has a basic variable or a basic row slack for every row, and its basis matrix is made of their columns.
+    # The slacks of equality rows have to stay at 0. The bases are solved in batches with the same number of basic
+    # variables so the linear algebra can be stacked.
+    basic_counts = np.sum(status == 0, axis=1)
+    complete = basic_counts + np.sum(row_status == 0, axis=1) == num_rows
+    for count in np.unique(basic_counts[complete]):
+        batch = np.flatnonzero(complete & (basic_counts == count))
+
+        basic = np.argsort(status[batch] != 0, axis=1, kind="stable")[:, :count]  # Indices of the basic variables
+        basic_rows = np.argsort(row_status[batch] != 0, axis=1, kind="stable")[:, :num_rows - count]
+        basis_matrices = np.concatenate((
+            np.take_along_axis(matrices[batch], basic[:, np.newaxis, :], axis=2),  # B x R x count
+            np.eye(num_rows)[:, basic_rows].transpose(1, 0, 2)  # The slack columns of the basic rows
+        ), axis=2)
+        # A basis that has become singular can't be solved, stand in the identity so the rest of the batch still can
+        nonsingular = np.linalg.cond(basis_matrices) < 1e10
+        basis_matrices[~nonsingular] = np.eye(num_rows)
+
+        values = np.linalg.solve(basis_matrices, remaining[batch][..., np.newaxis])[..., 0]
+        # Snap values that only miss a bound by rounding error onto it, since e.g. a thrust of -1e-16 instead of 0
+        # would count as reverse thrust in _current_limit_multiplier
+        basic_values = values[:, :count]
+        basic_values = np.where(np.abs(basic_values - lower[basic]) <= 1e-12, lower[basic], basic_values)
+        basic_values = np.where(np.abs(basic_values - upper[basic]) <= 1e-12, upper[basic], basic_values)
+        batch_solutions = solutions[batch]
+        np.put_along_axis(batch_solutions, basic, basic_values, axis=1)
+        solutions[batch] = batch_solutions
+
+        # Primal feasibility: the basic slacks are still 0, and the basic variables stay within bounds
+        feasible = (
+            nonsingular
+            & np.all(np.abs(values[:, count:]) <= tolerance, axis=1)
+            & np.all(basic_values >= lower[basic] - tolerance, axis=1)
+            & np.all(basic_values <= upper[basic] + tolerance, axis=1)
+        )
+
+        # Dual feasibility: no nonbasic variable could improve the objective by moving away from its bound. The duals
+        # price every basic column at its cost, which is 0 for the slacks.
+        basic_costs = np.concatenate((cost[basic], np.zeros((len(batch), num_rows - count))), axis=1)
+        duals = np.linalg.solve(np.transpose(basis_matrices, (0, 2, 1)), basic_costs[..., np.newaxis])[..., 0]
+        reduced_costs = cost - np.einsum("brc,br->bc", matrices[batch], duals)
+        all_reduced_costs[batch] = reduced_costs
+        dual_feasible = np.all(
+            ((status[batch] >= 0) | (reduced_costs >= -tolerance))  # At the lower bound, increasing can't help
+            & ((status[batch] <= 0) | (reduced_costs <= tolerance)),  # At the upper bound, decreasing can't help
+            axis=1
+        )
+
+        optimal[batch] = feasible & dual_feasible
+
+    return solutions, all_reduced_costs, optimal
+
+
+def incremental_sweep(thrusters: t.List[Thruster3D], directions: np.ndarray, previous_bases: np.ndarray,
+                      previous_row_bases: np.ndarray, max_current: int = DEFAULT_MAX_CURRENT, jobs: int = 1,
+                      solver: str = "auto", use_symmetry=False, return_allocations=False, return_bases=False,
+                      return_reused=False, envelope: str = "thrust"):
+    """
+    Calculate the maximum zero-torque thrust in each of a batch of directions, reusing the results of an earlier sweep
+    of the same directions with slightly different thrusters (e.g. after changing the angle of one of them).
+
+    Changing a thruster only changes its column of the LPs. For most directions the previous optimal basis of both
+    LPs is still feasible and optimal with the new column, and then the new solution follows from a small linear
+    solve. The directions where it isn't are solved again, with HiGHS starting from their previous bases.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param directions: An (M, 3) array of vectors in the target directions
+    :param previous_bases: The (M, N, 3) array of bases sweep_directions returned for the same directions before
+    :param previous_row_bases: The (M, 2, 6) array of their row statuses sweep_directions returned along with them.
+    Both have to be from the same solver.
+    :param use_symmetry: Whether to use the symmetries of the thrusters for the directions solved again, which only
+    linprog does. HiGHS starts each direction from its own previous basis instead.
+    :param return_reused: Whether to also return an (M,) array of which directions were reused rather than solved
+    :param envelope: "thrust" or "torque", see sweep_directions. The previous bases have to be from the same one.
+    :return: The same as sweep_directions, plus the reused directions if return_reused is set
+    """
+    directions = np.asarray(directions, dtype=float)
+    directions = directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Make every direction a unit vector
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    num_directions, num_thrusters = len(directions), len(thrusters)
+    wrenches = thrusters.envelope_wrenches(envelope)  # 6xN
+
+    if solver == "auto":
+        solver = "highs" if _import_highspy() is not None else "linprog"
+
+    # Each thruster split into a forward and a reverse half-thruster, for the min current LP
+    half_wrenches = thrusters.half_thruster_wrenches(envelope)
+    half_thrust_costs, half_thrust_upper = thrusters.half_thrusters()
+    half_thrust_status = previous_bases[:, :, 1:].reshape(num_directions, 2 * num_thrusters)
+    t_status = np.zeros((num_directions, 1), dtype=np.int8)  # t is always basic
+
+    # The max thrust LP, set up the same way as in HighsThrustSolver: maximize t so that (force, torque) = (t * d, 0)
+    max_thrust_solutions, _, max_thrust_optimal = _reuse_bases(
+        _max_thrust_matrix(wrenches, directions),
+        np.zeros((num_directions, 6)),
+        cost=np.array([0.] * num_thrusters + [-1.]),
+        lower=np.append(thrusters.bounds[:, 0], -np.inf),
+        upper=np.append(thrusters.bounds[:, 1], np.inf),
+        status=np.concatenate((previous_bases[:, :, 0], t_status), axis=1),
+        row_status=previous_row_bases[:, 0]
+    )
+    max_thrust = .999 * max_thrust_solutions[:, num_thrusters]  # Same margin as get_max_thrust
+
+    min_current_solutions, min_current_reduced_costs, min_current_optimal = _reuse_bases(
+        half_wrenches,
+        np.concatenate((max_thrust[:, np.newaxis] * directions, np.zeros((num_directions, 3))), axis=1),
+        cost=half_thrust_costs,
+        lower=np.zeros(2 * num_thrusters),
+        upper=half_thrust_upper,
+        status=half_thrust_status,
+        row_status=previous_row_bases[:, 1]
+    )
+    reused = max_thrust_optimal & min_current_optimal
+
+    rho = np.empty(num_directions)
+    allocations = np.empty((num_directions, num_thrusters))
+    bases = np.array(previous_bases, dtype=np.int8)
+    row_bases = np.array(previous_row_bases, dtype=np.int8)
+
+    half_thrusts = _least_current_allocation_batch(min_current_solutions[reused], half_wrenches, half_thrust_costs,
+                                                   half_thrust_upper, *thrusters.half_thruster_current(),
+                                                   min_current_reduced_costs[reused])
+    allocations[reused] = half_thrusts[:, 0::2] - half_thrusts[:, 1::2]
+    rho[reused] = max_thrust[reused]
+    if thrusters.max_current_draw() > max_current:  # See get_max_thrust
+        for i in np.flatnonzero(reused):
+            thrust_multiplier = _current_limit_multiplier(allocations[i], max_current, thrusters.fwd_current,
+                                                          thrusters.rev_current)
+            rho[i] *= thrust_multiplier
+            allocations[i] *= thrust_multiplier
+
+    if not np.all(reused):
+        if solver == "highs":
+            # The previous basis of a direction is usually only a few pivots from its new optimum, a much better
+            # start than the optimum of the direction solved before it
+            results = sweep_directions(thrusters, directions[~reused], max_current, jobs, solver,
+                                       return_allocations=True, return_bases=True, envelope=envelope,
+                                       start_bases=(bases[~reused], row_bases[~reused]))
+        else:
+            results = sweep_directions(thrusters, directions[~reused], max_current, jobs, solver, use_symmetry,
+                                       return_allocations=True, return_bases=True, envelope=envelope)
+        rho[~reused], allocations[~reused], bases[~reused], row_bases[~reused] = results
+
+    results = [rho]
+    if return_allocations:
+        results.append(allocations)
+    if return_bases:
+        results += [bases, row_bases]
+    if return_reused:
+        results.append(reused)
+    return results[0] if len(results) == 1 else tuple(results)
+
+
+def icosphere(subdivisions: int = 0):
+    """
+    Create a triangle mesh of the unit sphere by repeatedly subdividing an icosahedron
+    :param subdivisions: How many times to split every triangle into four
+    :return: A (V, 3) array of unit vectors for the vertices, and a (T, 3) array of vertex indices for the triangles
+    """
+    golden = (1 + np.sqrt(5)) / 2
+    vertices = [
+        (-1, golden, 0), (1, golden, 0), (-1, -golden, 0), (1, -golden, 0),
+        (0, -1, golden), (0, 1, golden), (0, -1, -golden), (0, 1, -golden),
+        (golden, 0, -1), (golden, 0, 1), (-golden, 0, -1), (-golden, 0, 1),
+    ]
+    vertices = [np.array(vertex) / np.linalg.norm(vertex) for vertex in vertices]
+    triangles = [
+        (0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11),
+        (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+        (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9),
+        (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1),
     ]
 
-    min_current_result = linprog(c=objective_mincurrent, A_ub=None, b_ub=None, A_eq=left_of_equality_mincurrent,
-                                 b_eq=right_of_equality_mincurrent, bounds=bounds_mincurrent, method="highs")
+    for _ in range(subdivisions):
+        midpoints = {}  # Maps each edge to the index of its midpoint, so neighbouring triangles share it
+
+        def midpoint(a, b):
+            edge = (min(a, b), max(a, b))
+            if edge not in midpoints:
+                vertex = vertices[a] + vertices[b]
+                vertices.append(vertex / np.linalg.norm(vertex))
+                midpoints[edge] = len(vertices) - 1
+            return midpoints[edge]
+
+        new_triangles = []
+        for a, b, c in triangles:
+            ab, bc, ca = midpoint(a, b), midpoint(b, c), midpoint(c, a)
+            new_triangles += [(a, ab, ca), (b, bc, ab), (c, ca, bc), (ab, bc, ca)]
+        triangles = new_triangles
+
+    return np.array(vertices), np.array(triangles)
+
+
+def fibonacci_sphere(count: int):
+    """
+    Spread points nearly evenly over the unit sphere along a Fibonacci spiral, and triangulate them
+    :param count: The number of points
+    :return: A (count, 3) array of unit vectors for the points, and a (T, 3) array of point indices for the triangles
+    """
+    golden_angle = np.pi * (3 - np.sqrt(5))
+    heights = 1 - (2 * np.arange(count) + 1) / count  # Evenly spaced heights, never exactly at the poles
+    radii = np.sqrt(1 - heights ** 2)
+    angles = golden_angle * np.arange(count)
+    directions = np.stack((radii * np.cos(angles), radii * np.sin(angles), heights), axis=-1)
+
+    from scipy.spatial import ConvexHull
+
+    # Every point is on the convex hull of a sphere, so its facets are a triangulation of the points
+    return directions, ConvexHull(directions).simplices
+
 
-    min_current_duplicated_array = min_current_result.x
+def sphere_directions(sphere: str, resolution: int):
+    """
+    Create the set of directions to calculate the thrust in
+    :param sphere: "latlong" for a latitude/longitude grid, "fibonacci" for a Fibonacci spiral, or "icosphere" for a
+    subdivided icosahedron
+    :param resolution: The number of samples around the equator of the latitude/longitude grid. The other kinds of
+    sphere get about the same spacing between directions, which takes roughly a third fewer of them.
+    :return: An array of unit vectors, and a (T, 3) array of their indices for each triangle. For "latlong", the
+    directions are an (A, B, 3) grid instead and there are no triangles.
+    """
+    if sphere == "latlong":
+        # I have no idea what np.meshgrid does
+        u, v = np.mgrid[0:2 * np.pi:resolution * 1j, 0:np.pi: resolution / 2 * 1j]
 
-    min_current_true_array = []
-    for i in range(0, len(min_current_duplicated_array) - 1, 2):
-        min_current_true_array.append(min_current_duplicated_array[i] - min_current_duplicated_array[
-            i + 1])  # combine half-thrusters into full thrusters
+        # Convert each vertex of the sphere into a direction vector
+        return np.stack((
+            np.cos(v),  # x
+            np.sin(u) * np.sin(v),  # y
+            np.cos(u) * np.sin(v)  # z
+        ), axis=-1), None
 
-    current_quadratic = [0] * 3
+    # Samples spaced 2pi / resolution apart cover the sphere's 4pi of solid angle with resolution^2 / pi of them,
+    # instead of the resolution^2 / 2 of the grid that bunches up at the poles
+    count = max(12, round(resolution ** 2 / np.pi))
 
-    for thrust in min_current_true_array:
-        if thrust >= 0:  # use the forward thrust coefficients
-            # TODO: Use customized thruster specs
-            current_quadratic[0] += DEFAULT_FWD_CURRENT[0] * thrust ** 2  # a * t^2
-            current_quadratic[1] += DEFAULT_FWD_CURRENT[1] * thrust  # b * t
-            current_quadratic[2] += DEFAULT_FWD_CURRENT[2]  # c
-        else:  # use the reverse thrust coefficients
-            # TODO: Use customized thruster specs
-            current_quadratic[0] += DEFAULT_REV_CURRENT[0] * (-thrust) ** 2
-            current_quadratic[1] += DEFAULT_REV_CURRENT[1] * (-thrust)
-            current_quadratic[2] += DEFAULT_REV_CURRENT[2]
+    if sphere == "fibonacci":
+        return fibonacci_sphere(count)
+    if sphere == "icosphere":
+        # Each subdivision roughly quadruples the 12 vertices of the icosahedron, pick the closest to count
+        subdivisions = max(0, round(np.log(count / 10) / np.log(4)))
+        return icosphere(subdivisions)
 
-    current_quadratic[2] -= max_current  # ax^2 + bx + c = I -> ax^2 + bx + (c-I) = 0
+    raise ValueError(f"unknown sphere {sphere!r}")
 
-    # solve quadratic, take the proper point, and clamp it to a maximum of 1.0
-    thrust_multiplier = min(1., max(np.roots(current_quadratic)))
 
-    thrust_value = 0
-    for i in range(0, len(min_current_true_array)):
-        thrust_value += min_current_true_array[i] * transformed_orientations[i][
-            0]  # get total thrust in target direction
+def _cube_map_cells(directions: np.ndarray, size: int):
+    """
+    Find the cell each direction falls into when the sphere is projected onto a cube, with every face of the cube split
+    into a size by size grid
+    :param directions: An (M, 3) array of nonzero directions
+    :return: An (M,) array of cell indices, from 0 to 6 * size^2 - 1
+    """
+    axes = np.abs(directions).argmax(axis=1)
+    depth = np.take_along_axis(directions, axes[:, np.newaxis], axis=1)[:, 0]
+    faces = 2 * axes + (depth < 0)
+    # The two other axes of each face, in increasing order
+    across = np.array(((1, 2), (0, 2), (0, 1)))[axes]
+    projected = np.take_along_axis(directions, across, axis=1) / np.abs(depth)[:, np.newaxis]
+    cells = np.floor((projected + 1) / 2 * size).clip(0, size - 1).astype(int)
+    return (faces * size + cells[:, 0]) * size + cells[:, 1]
 
-    return thrust_value * thrust_multiplier
+
+def coarse_to_fine_order(directions: np.ndarray, coarsest: int = 1):
+    """
+    Order directions so that the first few are spread over the whole sphere, and each of the next batches fills in the
+    gaps between the ones before, for sweeps whose partial results should already look like the whole envelope.
+
+    The sphere is split into cells like a cube map, starting with the coarsest grid and doubling the number of rows
+    and columns each level. At every level, each cell that doesn't hold any of the directions picked so far gets its
+    first direction picked. Once the cells are about as small as the spacing of the directions, the rest follow in
+    their original order, which keeps neighbouring directions together for the solvers that warm start from the
+    previous one.
+    :param directions: An (M, 3) array of nonzero directions
+    :param coarsest: The number of rows and columns of each face of the first level
+    :return: An (M,) array of indices into directions
+    """
+    directions = np.asarray(directions, dtype=float)
+    picked = np.zeros(len(directions), dtype=bool)
+    order = []
+
+    size = coarsest
+    while 6 * size ** 2 <= len(directions) / 4:
+        cells = _cube_map_cells(directions, size)
+        candidates = np.flatnonzero(~picked & ~np.isin(cells, cells[picked]))
+        _, first = np.unique(cells[candidates], return_index=True)
+        order.append(candidates[first])
+        picked[candidates[first]] = True
+        size *= 2
+
+    order.append(np.flatnonzero(~picked))
+    return np.concatenate(order)
+
+
+def adaptive_sweep(thrusters: t.List[Thruster3D], max_current: int = DEFAULT_MAX_CURRENT, tolerance: float = .05,
+                   max_depth: int = 5, initial_subdivisions: int = 1, jobs: int = 1, solver: str = "auto",
+                   use_symmetry=False, envelope: str = "thrust"):
+    """
+    Calculate the maximum zero-torque thrust over the whole sphere, only refining the mesh where it is inaccurate.
+
+    Starting from a coarse icosphere, the midpoint of every edge is solved and compared against the average of the two
+    ends. Edges where those differ by more than the tolerance are split at the midpoint, and every triangle is split
+    according to how many of its edges were, so the mesh stays free of cracks. This repeats on the new edges until they
+    are all accurate enough or max_depth levels deep, so flat facets of the envelope stay coarse while sharp edges
+    get refined.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param tolerance: The largest acceptable difference between the interpolated and true thrust in kgf
+    :param max_depth: The maximum number of times any edge of the initial mesh is split
+    :param initial_subdivisions: How many times to subdivide the icosahedron the mesh starts from
+    :param jobs: The number of processes to split each batch of directions between, or 0 to use every CPU core
+    :param solver: The LP solver to use, see sweep_directions
+    :param use_symmetry: Whether to skip directions made equivalent by the symmetries of the thrusters
+    :param envelope: "thrust" or "torque", see sweep_directions. The tolerance is in the same unit as the envelope.
+    :return: A (V, 3) array of unit vectors for the vertices of the mesh, a (V,) array of the maximum thrust in each
+    of them in kgf, and a (T, 3) array of vertex indices for the triangles
+    """
+    directions, triangles = icosphere(initial_subdivisions)
+    directions = list(directions)
+    rho = list(sweep_directions(thrusters, np.array(directions), max_current, jobs, solver, use_symmetry,
+                                envelope=envelope))
+    triangles = [tuple(triangle) for triangle in triangles]
+
+    depths = {}  # How many times the edge (a, b), a < b, was split from an edge of the initial mesh
+    tested = set()  # Edges that have already been found accurate enough
+
+    while True:
+        # Every edge that hasn't been checked yet, with its endpoints in order so shared edges only appear once
+        edges = sorted({
+            (min(a, b), max(a, b))
+            for triangle in triangles
+            for a, b in ((triangle[0], triangle[1]), (triangle[1], triangle[2]), (triangle[2], triangle[0]))
+        } - tested)
+        edges = [edge for edge in edges if depths.get(edge, 0) < max_depth]
+        if not edges:
+            break
+
+        # Solve all of the midpoints in one batch
+        midpoints = np.array([directions[a] + directions[b] for a, b in edges])
+        midpoints /= np.linalg.norm(midpoints, axis=1)[:, np.newaxis]
+        midpoint_rho = sweep_directions(thrusters, midpoints, max_current, jobs, solver, use_symmetry,
+                                        envelope=envelope)
+
+        split = {}  # Maps each edge that needs splitting to the index of its new midpoint vertex
+        num_old_directions = len(directions)
+        for edge, midpoint, value in zip(edges, midpoints, midpoint_rho):
+            if abs(value - (rho[edge[0]] + rho[edge[1]]) / 2) <= tolerance:
+                tested.add(edge)
+                continue
+
+            directions.append(midpoint)
+            rho.append(value)
+            split[edge] = len(directions) - 1
+
+            # Both halves are one level deeper than the edge they came from
+            depth = depths.get(edge, 0) + 1
+            depths[(min(edge[0], split[edge]), max(edge[0], split[edge]))] = depth
+            depths[(min(edge[1], split[edge]), max(edge[1], split[edge]))] = depth
+
+        if not split:
+            break
+
+        new_triangles = []
+        for triangle in triangles:
+            # Rotate the triangle so that its split edges come first, keeping the winding order
+            for _ in range(3):
+                a, b, c = triangle
+                if (min(a, b), max(a, b)) in split and not (
+                        (min(c, a), max(c, a)) in split and (min(b, c), max(b, c)) not in split):
+                    break
+                triangle = (b, c, a)
+            a, b, c = triangle
+            ab = split.get((min(a, b), max(a, b)))
+            bc = split.get((min(b, c), max(b, c)))
+            ca = split.get((min(c, a), max(c, a)))
+
+            if ab is None:  # No split edges
+                children = [(a, b, c)]
+            elif bc is None and ca is None:  # Only ab is split, cut the triangle in two
+                children = [(a, ab, c), (ab, b, c)]
+            elif ca is None:  # ab and bc are split, cut off the corner at b and split what's left in two
+                children = [(ab, b, bc), (a, ab, bc), (a, bc, c)]
+            else:  # Every edge is split, cut the triangle in four
+                children = [(a, ab, ca), (b, bc, ab), (c, ca, bc), (ab, bc, ca)]
+
+            # The new edges inside the old triangle are one level deeper than the deepest edge they were cut from
+            depth = max(depths.get((min(p, q), max(p, q)), 0) for p, q in ((a, b), (b, c), (c, a))) + 1
+            for child in children:
+                for p, q in ((child[0], child[1]), (child[1], child[2]), (child[2], child[0])):
+                    if max(p, q) >= num_old_directions:
+                        depths.setdefault((min(p, q), max(p, q)), depth)
+            new_triangles += children
+        triangles = new_triangles
+
+    return np.array(directions), np.array(rho), np.array(triangles)
+
+
+class ZeroTorquePolytope:
+    """
+    The exact set of forces the thrusters can produce with zero torque, ignoring the current limit.
+
+    Every thrust allocation within the thruster bounds forms a box, and the allocations that produce zero torque are
+    a slice of that box. The slice is a convex polytope, so its image under the thruster orientations (the forces) is
+    too. The vertices of the slice are found by enumeration: at each one, all but (rank of the torque matrix)
+    thrusters are at one of their bounds, and the rest are whatever cancels out their torque. The convex hull of the
+    forces those vertices produce is the polytope.
+
+    Once that is computed, the max thrust in any direction is just the distance to the first facet hit by a ray from
+    the origin in that direction, no LP required. Enumeration is exponential in the number of thrusters though, so
+    this is only practical up to around 20 of them.
+    """
+
+    # Refuse to enumerate more candidate vertices than this, since it would take forever and run out of memory
+    MAX_CANDIDATES = 2 ** 24
+
+    def __init__(self, thrusters: t.List[Thruster3D]):
+        thrusters = ThrusterSet.from_thrusters(thrusters)
+        orientations = thrusters.orientations.transpose()  # 3xN
+        torques = thrusters.torques.transpose()  # 3xN
+        bounds = thrusters.bounds  # Nx2, (reverse, forward)
+        num_thrusters = len(thrusters)
+
+        # Only the independent torque constraints matter. Rotate them into an orthonormal basis of the torque space,
+        # so that a rank deficient torque matrix (e.g. every thruster in one plane) doesn't need special handling
+        left, singular_values, _ = np.linalg.svd(torques)
+        rank = int(np.sum(singular_values > 1e-9 * max(1., singular_values.max(initial=0))))
+        torques = left[:, :rank].transpose().dot(torques)  # rank x N
+
+        num_candidates = math.comb(num_thrusters, rank) * 2 ** (num_thrusters - rank)
+        if num_candidates > self.MAX_CANDIDATES:
+            raise ValueError(f"too many thrusters ({num_thrusters}) to enumerate the thrust polytope, "
+                             f"use the LP sweep instead")
+
+        forces = [np.zeros((1, 3))]  # Zero thrust is always achievable, so include it in case nothing else is
+        for free in itertools.combinations(range(num_thrusters), rank):
+            free = list(free)
+            fixed = [i for i in range(num_thrusters) if i not in free]
+
+            free_torques = torques[:, free]
+            if rank and abs(np.linalg.det(free_torques)) < 1e-12:
+                continue  # These thrusters can't cancel out arbitrary torque, so they can't make a vertex
+
+            # Every combination of the fixed thrusters being at their reverse or forward bound, as a 2^(N-rank)x(N-rank)
+            # array of thrusts
+            corners = np.array(list(itertools.product((0, 1), repeat=len(fixed))), dtype=int).reshape(-1, len(fixed))
+            allocations = np.empty((len(corners), num_thrusters))
+            allocations[:, fixed] = bounds[fixed, corners]
+
+            # Solve for the free thrusters that cancel the torque of the fixed ones, and keep the ones within bounds
+            if rank:
+                allocations[:, free] = -np.linalg.solve(free_torques, torques[:, fixed].dot(allocations[:, fixed].T)).T
+            feasible = np.all(
+                (allocations[:, free] >= bounds[free, 0] - 1e-9) & (allocations[:, free] <= bounds[free, 1] + 1e-9),
+                axis=1
+            )
+
+            forces.append(allocations[feasible].dot(orientations.transpose()))
+
+        from scipy.spatial import ConvexHull, QhullError
+
+        try:
+            hull = ConvexHull(np.concatenate(forces))
+        except QhullError as e:
+            raise ValueError("the zero-torque thrust polytope is flat, "
+                             "the thrusters can't push in every direction") from e
+
+        # Only keep the points on the hull, and renumber the triangles to match
+        self.vertices = hull.points[hull.vertices]
+        index_map = np.empty(len(hull.points), dtype=int)
+        index_map[hull.vertices] = np.arange(len(hull.vertices))
+        self.triangles = index_map[hull.simplices]
+
+        # Facet half-spaces in the form normal . force <= offset. The zero force is always inside, so offset >= 0
+        self.normals = hull.equations[:, :3]
+        self.offsets = -hull.equations[:, 3]
+
+    def max_thrust(self, directions: np.ndarray):
+        """
+        Calculate the maximum zero-torque thrust in each of a batch of directions
+        :param directions: An (M, 3) array of vectors in the target directions
+        :return: An (M,) array of the maximum thrust force in each direction in kgf
+        """
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        directions = directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Make them unit vectors
+
+        # A ray t * direction crosses the plane of each facet it is heading towards at t = offset / (normal . direction)
+        # and the closest of those crossings is where it leaves the polytope
+        approach = directions.dot(self.normals.transpose())  # MxF
+        with np.errstate(divide="ignore"):
+            distances = np.where(approach > 1e-12, self.offsets / approach, np.inf)
+
+        return np.maximum(distances.min(axis=1), 0)
+
+
+class WrenchZonotope:
+    """
+    The set of every wrench (x, y, z force then x, y, z torque) the thrusters can produce, ignoring the current limit.
+
+    Every thrust allocation within the thruster bounds forms a box, and the wrench matrix maps it onto a zonotope: a
+    sum of line segments, one per thruster, around the wrench of the box's center. It's symmetric around that center,
+    so each facet has an opposite twin and both are described by one normal and one support distance. Every facet of a
+    6-D zonotope is parallel to 5 of the segments, so its normal is perpendicular to those 5, and its distance from
+    the center is how far the other segments reach along the normal. Going through every 5 thrusters gives every facet
+    without a convex hull.
+
+    Once the facets are known, checking a wrench or finding how far it can go in some direction (e.g. the max surge
+    while holding some yaw torque) is a product with the facet normals, no LP required. There is a pair of facets per
+    5 thrusters though, so this is only practical up to around 40 of them.
+    """
+
+    # Refuse to go through more subsets of thrusters than this, since it would take forever and run out of memory
+    MAX_SUBSETS = 2 ** 21
+    # How many subsets to find the normals of at once, to keep the stacked arrays small
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, thrusters: t.List[Thruster3D]):
+        thrusters = ThrusterSet.from_thrusters(thrusters)
+        bounds = thrusters.bounds  # Nx2, (reverse, forward)
+        num_thrusters = len(thrusters)
+
+        self.center = thrusters.wrenches.dot(bounds.mean(axis=1))  # 6
+        generators = thrusters.wrenches * (bounds[:, 1] - bounds[:, 0]) / 2  # 6xN, half of each thruster's segment
+
+        # A layout that can't produce every wrench (e.g. every thruster in one plane) makes a flat zonotope. Work in an
+        # orthonormal basis of the wrenches it can reach, and require the part of a wrench outside of that to be 0.
+        left, singular_values, _ = np.linalg.svd(generators)
+        rank = int(np.sum(singular_values > 1e-9 * max(1., singular_values.max(initial=0))))
+        self.complement = left[:, rank:].transpose()  # (6 - rank) x 6
+        reduced_generators = left[:, :rank].transpose().dot(generators)  # rank x N
+
+        if rank < 2:
+            normals = np.eye(rank)  # A segment (or a point) only has its two ends
+        else:
+            num_subsets = math.comb(num_thrusters, rank - 1)
+            if num_subsets > self.MAX_SUBSETS:
+                raise ValueError(f"too many thrusters ({num_thrusters}) to enumerate the wrench zonotope")
+
+            subsets = np.array(list(itertools.combinations(range(num_thrusters), rank - 1)), dtype=int)
+            normals = []
+            for start in range(0, num_subsets, self.CHUNK_SIZE):
+                # The normal of the facet parallel to each subset of segments is the right singular vector they have
+                # no component along. Subsets that don't span a hyperplane don't make a facet.
+                subset_generators = reduced_generators.transpose()[subsets[start:start + self.CHUNK_SIZE]]
+                _, subset_singular_values, right = np.linalg.svd(subset_generators)
+                spanning = subset_singular_values[:, -1] > 1e-9 * max(1., singular_values.max())
+                normals.append(right[spanning, -1])
+            normals = np.concatenate(normals)
+
+            # Parallel segments give the same facet more than once, so only keep one of each, pointing either way
+            first_nonzero = normals[np.arange(len(normals)), np.argmax(np.abs(normals) > 1e-9, axis=1)]
+            normals *= np.where(first_nonzero < 0, -1, 1)[:, np.newaxis]
+            _, unique = np.unique(np.round(normals, 9), axis=0, return_index=True)
+            normals = normals[np.sort(unique)]
+
+        # Facet pairs in the form |normal . (wrench - center)| <= support, with the normals back in wrench coordinates
+        self.normals = normals.dot(left[:, :rank].transpose()).reshape(-1, 6)  # Fx6
+        self.support = np.abs(normals.dot(reduced_generators)).sum(axis=1)  # F
+
+        # The parts of a wrench outside of a flat zonotope act like facet pairs with a support of 0, so both kinds of
+        # constraint can be checked with one product
+        self._constraints = np.concatenate((self.normals, self.complement))
+        self._limits = np.concatenate((self.support, np.zeros(len(self.complement))))
+
+    def contains(self, wrenches: np.ndarray, tolerance: float = 1e-9):
+        """
+        Check whether the thrusters can produce each of a batch of wrenches
+        :param wrenches: A 6d wrench, or an (M, 6) array of them
+        :param tolerance: How far outside of the zonotope a wrench may be, to allow for rounding errors
+        :return: Whether each wrench can be produced, as a bool or an (M,) array
+        """
+        positions = (np.asarray(wrenches, dtype=float) - self.center).dot(self._constraints.transpose())
+        return np.all(np.abs(positions) <= self._limits + tolerance, axis=-1)
+
+    def max_along(self, directions: np.ndarray, base: np.ndarray = None, tolerance: float = 1e-9,
+                  return_facets=False):
+        """
+        Calculate how far each of a batch of wrenches can be pushed in a direction. For example, the max surge while
+        holding 2 units of yaw torque is max_along((1, 0, 0, 0, 0, 0), base=(0, 0, 0, 0, 0, 2)), and how far a
+        wrench w can be scaled up or has to be scaled down is max_along(w).
+        :param directions: A 6d direction, or an (M, 6) array of them. They aren't normalized, so the result is in
+        multiples of them.
+        :param base: The 6d wrench, or (M, 6) array of them, to start from. Zero if not given.
+        :param tolerance: How far outside of the zonotope a wrench may be, to allow for rounding errors
+        :param return_facets: Whether to also return which facet each wrench leaves through
+        :return: The largest t for which base + t * direction can be produced, as a float or an (M,) array. NaN where
+        the base can't be produced. If return_facets is set, also the index into normals of the facet pair each wrench
+        leaves through (-1 if it leaves a flat zonotope or never leaves) and which of the pair: 1 for the one normal
+        points out of, -1 for its twin.
+        """
+        base = np.zeros(6) if base is None else np.asarray(base, dtype=float)
+        positions = (base - self.center).dot(self._constraints.transpose())  # ...xF
+        approach = np.asarray(directions, dtype=float).dot(self._constraints.transpose())  # ...xF
+
+        # Each facet pair limits t to where base + t * direction reaches the facet it's heading towards. A direction
+        # out of a flat zonotope heads straight into one with a support of 0, so it can't go anywhere.
+        moving = np.abs(approach) > 1e-12
+        limits = np.divide(self._limits - np.sign(approach) * positions, np.abs(approach),
+                           out=np.full(np.shape(moving), np.inf), where=moving)
+        distances = np.maximum(limits.min(axis=-1), 0)
+
+        feasible = np.all(np.abs(positions) <= self._limits + tolerance, axis=-1)
+        distances = np.where(feasible, distances, np.nan)[()]  # [()] unwraps a single result into a float
+        if not return_facets:
+            return distances
+
+        facets = np.argmin(limits, axis=-1)
+        sides = np.sign(np.take_along_axis(approach, facets[..., np.newaxis], axis=-1)[..., 0]).astype(int)
+        facets = np.where((facets < len(self.normals)) & np.isfinite(limits.min(axis=-1)), facets, -1)
+        return distances, facets[()], sides[()]
 
 
 #####################################
-# Yaw, pitch, roll code
+# Result caching code
 #####################################
-def calc_max_yaw_pitch_roll(thrusters, torque_constraints):
-    torque_x = []
-    torque_y = []
-    torque_z = []
-    orientation = []
-    constraint3 = []
-    constraint4 = []
-    constraint5 = []
-    right_equalities = [0, 0, 0, 0, 0]
-    bounds = []
-
-    for i in range(len(torque_constraints)):
-        torque_x.append(torque_constraints[i][0])
-        torque_y.append(torque_constraints[i][1])
-        torque_z.append(torque_constraints[i][2])
-        thruster = thrusters[i]
-        orientation.append(thruster.orientation)
-        constraint3.append(thruster.orientation[0])
-        constraint4.append(thruster.orientation[1])
-        constraint5.append(thruster.orientation[2])
-        torques = [torque_x, torque_y, torque_z]
-        bounds.append(DEFAULT_MAX_THRUSTS)  # TODO: Use customized thruster specs
-
-    for i in range(len(torques)): #?????
-        torques = [torque_x, torque_y, torque_z]
-        objective = [torques[i]]
-
-        torques.pop(i)
-        constraint1 = torques[0]
-        constraint2 = torques[1]
-
-        left_equalities = [constraint1, constraint2, constraint3, constraint4, constraint5]
-
-        res = linprog(c=objective, A_ub=None, b_ub=None, A_eq=left_equalities, b_eq=right_equalities,
-                      bounds=bounds, method="highs")
-
-        print(res)
+class SweepCache:
+    """
+    An on-disk store of sweep results, addressed by a hash of everything that determines them: the thruster layout,
+    the solver settings and the directions. Entries are compressed .npz files, and once the directory grows past its
+    size limit the least recently used ones are deleted.
 
+    Allocations and bases are stored with the thrusters in canonical order (see canonical_layout), so layouts that
+    only differ in the order their thrusters are listed share an entry. Entries that aren't tied to one layout, like
+    the previous run of --incremental, pass None as the thrusters and are stored as given.
+    """
 
-# The main entry point of the program
-# All the Click decorators define various options that can be passed in on the command line
-@click.command()
-@click.option("--thrusters", "-t", default="thrusters.json", help="file containing thruster specifications")
-@click.option("--resolution", "-r",
-              default=DEFAULT_RESOLUTION,
-              help="resolution of the thrust calculation, runtime is O(n^2) with respect to this!"
-)
-@click.option("--max-current", "-c", default=DEFAULT_MAX_CURRENT, help="maximum thruster current draw in amps")
-def main(thrusters, resolution: int, max_current: int):
-    # This doc comment becomes the description text for the --help menu
+    # Bump this whenever a change to the solvers changes their results, so old entries aren't used anymore
+    VERSION = 5
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def key(cls, thrusters: t.List[Thruster3D], settings: dict, directions: np.ndarray = None):
+        """
+        Calculate the cache key of a sweep
+        :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters, or None
+        :param settings: Every other setting that affects the results, must be JSON serializable
+        :param directions: The directions the sweep solves, if they aren't already determined by the settings
+        :return: The key as a hex string
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"version": cls.VERSION, **settings}, sort_keys=True).encode())
+        if thrusters is not None:
+            digest.update(canonical_layout(thrusters).tobytes())
+        if directions is not None:
+            digest.update(np.ascontiguousarray(directions, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _canonical_order(thrusters: t.List[Thruster3D]):
+        thrusters = ThrusterSet.from_thrusters(thrusters)
+        _, order, signs = _canonical_rows(thrusters.positions, thrusters.orientations, thrusters, 6)
+        return order, signs
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key: str, thrusters: t.List[Thruster3D]):
+        """
+        Load a cached result
+        :return: A dict of the stored arrays, or None if there is no entry for the key
+        """
+        try:
+            with np.load(self._path(key)) as entry:
+                arrays = dict(entry)
+        except (OSError, ValueError):  # Missing, or half-written by a process that crashed
+            return None
+
+        os.utime(self._path(key))  # Mark the entry as recently used
+        if thrusters is None:
+            return arrays
+
+        # Put the thrusters back into the order they were given in
+        order, signs = self._canonical_order(thrusters)
+        inverse_order = np.argsort(order)
+        if "allocations" in arrays:
+            arrays["allocations"] = _permute_thrusters(inverse_order, signs, allocations=arrays["allocations"])
+        if "bases" in arrays:
+            arrays["bases"] = _permute_thrusters(inverse_order, signs, bases=arrays["bases"])
+
+        return arrays
+
+    def store(self, key: str, thrusters: t.List[Thruster3D], **arrays):
+        """
+        Store a result, evicting old entries if the cache is too big
+        :param arrays: The arrays to store. Ones called allocations and bases are per thruster, as returned by
+        sweep_directions, and get put into canonical order unless thrusters is None
+        """
+        if thrusters is not None:
+            order, signs = self._canonical_order(thrusters)
+            if "allocations" in arrays:
+                arrays["allocations"] = _permute_thrusters(order, signs[order], allocations=arrays["allocations"])
+            if "bases" in arrays:
+                arrays["bases"] = _permute_thrusters(order, signs[order], bases=arrays["bases"])
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first and move it into place, so other processes never see half an entry
+        temporary_path = self._path(key) + f".{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary_path, self._path(key))
+
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits within its size limit
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:  # Another process got to it first
+                pass
+            total -= size
+
+
+class SweepStore:
     """
-    tau - the thruster arrangement utility
+    The results of one sweep in a file that is memory mapped rather than read, for sweeps too big to keep in memory.
+    Sweeps write into it one chunk of directions at a time, and viewers (in the same process or any other) only read
+    the parts of it they use.
+
+    The file starts with a fixed size header, followed by a completion flag for every chunk and then a column for each
+    result: the directions, rho and allocations in single or double precision, and the bases and their row statuses as
+    int8. A chunk's flag is only set once its rows have been flushed to disk, so after a crash every flagged chunk is
+    intact and the rest can be solved again.
+
+    Several processes can open the same store and write different rows of it, like the workers of a sweep, as long as
+    only one of them keeps track of which chunks are complete (see mark_written).
     """
 
-    # Read the thruster transforms input JSON file
-    # Wrap this in a try-except FileNotFoundError block to print a nicer error message
-    with open(thrusters) as f:  # `with` blocks allow you to open files safely without risking corrupting them on crash
-        thrusters_raw = json.load(f)
+    MAGIC = b"TAUSTORE"
+    VERSION = 2
+    # Magic, version, bytes per float, number of directions, number of thrusters, chunk size and the sweep's key
+    HEADER = struct.Struct("<8sIIQQQ64s")
+    HEADER_SIZE = 4096
+    # Every column starts at a multiple of this many bytes
+    ALIGNMENT = 64
+    DEFAULT_CHUNK_SIZE = 4096
+
+    def __init__(self, path: str, writable: bool = False):
+        """
+        Open an existing store
+        :param path: The file
+        :param writable: Whether results will be written into it, otherwise it's opened read-only
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(self.HEADER.size)
+        if len(header) < self.HEADER.size:
+            raise ValueError(f"{path} is not a sweep store")
+        magic, version, itemsize, count, num_thrusters, chunk_size, key = self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a sweep store")
+        if version != self.VERSION:
+            raise ValueError(f"{path} is a version {version} sweep store, expected version {self.VERSION}")
+
+        self.dtype = np.dtype(np.float32 if itemsize == 4 else np.float64)
+        self.count = count
+        self.num_thrusters = num_thrusters
+        self.chunk_size = chunk_size
+        self.key = key.rstrip(b"\0").decode()
+        self.num_chunks = -(-count // chunk_size)
+
+        self._file = np.memmap(path, dtype=np.uint8, mode="r+" if writable else "r")
+        offsets = self._offsets(self.dtype, count, num_thrusters, self.num_chunks)
+        self.chunk_flags = self._column(offsets["chunk_flags"], np.uint8, (self.num_chunks,))
+        self.directions = self._column(offsets["directions"], self.dtype, (count, 3))
+        self.rho = self._column(offsets["rho"], self.dtype, (count,))
+        self.allocations = self._column(offsets["allocations"], self.dtype, (count, num_thrusters))
+        self.bases = self._column(offsets["bases"], np.int8, (count, num_thrusters, 3))
+        self.row_bases = self._column(offsets["row_bases"], np.int8, (count, 2, 6))
+
+        # How many rows of each chunk have been written since it was opened, to tell when a chunk is complete
+        self._written = np.zeros(self.num_chunks, dtype=np.int64)
+
+    @classmethod
+    def _offsets(cls, dtype: np.dtype, count: int, num_thrusters: int, num_chunks: int):
+        """
+        Find where each column starts in the file
+        :return: A dict mapping each column to its offset in bytes, plus "end" to the size of the file
+        """
+        offsets = {}
+        offset = cls.HEADER_SIZE
+        for column, size in (("chunk_flags", num_chunks), ("directions", count * 3 * dtype.itemsize),
+                             ("rho", count * dtype.itemsize), ("allocations", count * num_thrusters * dtype.itemsize),
+                             ("bases", count * num_thrusters * 3), ("row_bases", count * 2 * 6), ("end", 0)):
+            offsets[column] = offset
+            offset += -(-size // cls.ALIGNMENT) * cls.ALIGNMENT
+        return offsets
+
+    def _column(self, offset: int, dtype, shape: t.Tuple[int, ...]):
+        size = math.prod(shape) * np.dtype(dtype).itemsize
+        return self._file[offset:offset + size].view(dtype).reshape(shape)
+
+    @classmethod
+    def create(cls, path: str, directions: np.ndarray, num_thrusters: int, key: str = "", dtype=np.float32,
+               chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Create an empty store for a sweep, replacing the file if it exists
+        :param path: The file
+        :param directions: An (M, 3) array of the unit vectors the sweep solves
+        :param num_thrusters: The number of thrusters, for the size of the allocations and bases
+        :param key: Anything identifying the sweep, like its SweepCache.key, for telling which sweep a store is of
+        :param dtype: np.float32 or np.float64, the precision of the directions, rho and allocations
+        :param chunk_size: The number of directions in each chunk
+        :return: The store, opened for writing
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise ValueError(f"stores hold float32 or float64, not {dtype}")
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        num_chunks = -(-len(directions) // chunk_size)
+        offsets = cls._offsets(dtype, len(directions), num_thrusters, num_chunks)
+
+        # Write to a temporary file first and move it into place, so there's never half a header
+        temporary_path = path + f".{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, dtype.itemsize, len(directions), num_thrusters,
+                                    chunk_size, key.encode()))
+            f.truncate(offsets["end"])  # Everything else starts out as zeros, including the flags
+            f.seek(offsets["directions"])
+            f.write(np.ascontiguousarray(directions, dtype=dtype))  # Straight from the array, without a bytes copy
+        os.replace(temporary_path, path)
+
+        return cls(path, writable=True)
+
+    def completed(self):
+        """
+        :return: An (M,) bool array of which directions are in a complete chunk
+        """
+        return np.repeat(self.chunk_flags.astype(bool), self.chunk_size)[:self.count]
+
+    def write(self, indices: np.ndarray, rho: np.ndarray, allocations: np.ndarray, bases: np.ndarray,
+              row_bases: np.ndarray):
+        """
+        Write the results of some directions, and flag every chunk that this completes
+        :param indices: The (K,) indices of the directions, each of which is only written once
+        :param rho: The (K,) max thrust in each direction
+        :param allocations: The (K, N) thrust of each thruster in each direction
+        :param bases: The (K, N, 3) optimal bases of each direction
+        :param row_bases: The (K, 2, 6) row statuses of those bases
+        """
+        self.rho[indices] = rho
+        self.allocations[indices] = allocations
+        self.bases[indices] = bases
+        self.row_bases[indices] = row_bases
+        self.mark_written(indices)
+
+    def mark_written(self, indices: np.ndarray):
+        """
+        Count the results of some directions as written, e.g. by another process straight into the columns, and flag
+        every chunk that this completes
+        :param indices: The (K,) indices of the directions, each of which is only written once
+        """
+        chunks = indices // self.chunk_size
+        self._written += np.bincount(chunks, minlength=self.num_chunks)
+        sizes = np.minimum(self.chunk_size, self.count - np.arange(self.num_chunks) * self.chunk_size)
+        finished = np.flatnonzero((self._written >= sizes) & (self.chunk_flags == 0))
+        if len(finished):
+            self._file.flush()  # The results have to be on disk before their flags are
+            self.chunk_flags[finished] = 1
+            self._file.flush()
+
+    def flush(self):
+        """
+        Write everything written into the columns so far to disk
+        """
+        self._file.flush()
+
+    def close(self):
+        """
+        Let go of the file, e.g. before deleting it. It's unmapped as soon as no arrays taken from the columns point
+        into it anymore. The store can't be used afterwards.
+        """
+        del self.chunk_flags, self.directions, self.rho, self.allocations, self.bases, self.row_bases, self._file
+
+
+def _spread_order(count: int):
+    """
+    Order the numbers 0 to count - 1 so that every prefix of the order is spread evenly over the range, by reversing
+    the bits of each one: 0, count / 2, count / 4, 3 count / 4 and so on
+    """
+    bits = max(1, (count - 1).bit_length())
+    return sorted(range(count), key=lambda i: int(format(i, f"0{bits}b")[::-1], 2))
 
-    # Convert loaded JSON data into Thruster3D objects
-    thrusters: t.List[Thruster3D] = [
-        Thruster3D(
-            thruster_raw['x'],
-            thruster_raw['y'],
-            thruster_raw['z'],
-            thruster_raw['theta'],
-            thruster_raw['phi'],
-            # Optional thruster parameters: dict.get is used to provide a default value if the key doesn't exist
-            # TODO: Use customized thruster specs in the calculations
-            thruster_raw.get("max_thrusts", DEFAULT_MAX_THRUSTS),
-            thruster_raw.get("fwd_current", DEFAULT_FWD_CURRENT),
-            thruster_raw.get("rev_current", DEFAULT_REV_CURRENT)
-        )
-        for thruster_raw in thrusters_raw
-    ]
 
-    # Calculate the torque constrains which will apply to every iteration
-    torque_constraints = [thruster.torque() for thruster in thrusters]
-
-    # get_max_thrust(thrusters, np.array([1, 0, 0]), torque_constraints)
-
-    # I have no idea what np.meshgrid does
-    u, v = np.mgrid[0:2 * np.pi:resolution * 1j, 0:np.pi: resolution / 2 * 1j]
-    np.empty(np.shape(u))
-    mesh_x = np.empty(np.shape(u))
-    mesh_y = np.empty(np.shape(u))
-    mesh_z = np.empty(np.shape(u))
-
-    # Iterate over each vertex and calculate the max thrust in that direction
-    # Note: Should probably be its own function, then it can be optimized more (i.e. Numba)
-    max_rho = 0
-    for i in range(np.shape(u)[0]):
-        for j in range(np.shape(u)[1]):
-            z = np.cos(u[i][j]) * np.sin(v[i][j])
-            y = np.sin(u[i][j]) * np.sin(v[i][j])
-            x = np.cos(v[i][j])
-            transformed_orientations = transform_orientations(thrusters, np.array([x, y, z]))
-            # TODO: Need some way to carry over the customized thruster specs with the transformed orientations
-            rho = get_max_thrust(transformed_orientations, torque_constraints, max_current)
-            mesh_x[i][j] = x * rho
-            mesh_y[i][j] = y * rho
-            mesh_z[i][j] = z * rho
-            max_rho = max(max_rho, rho)
-
-    max_rho = np.ceil(max_rho)
-
-    color_index = np.sqrt(mesh_x**2 + mesh_y**2 + mesh_z**2)
+def sweep_to_store(store: SweepStore, thrusters: t.List[Thruster3D], max_current: int = DEFAULT_MAX_CURRENT,
+                   jobs: int = 1, solver: str = "auto", use_symmetry=False, envelope: str = "thrust",
+                   coarse_to_fine=False):
+    """
+    Solve every direction of a store that isn't in a complete chunk yet, the same way as iter_sweep, writing the
+    results into the store as they come in. Stopping the iteration early keeps every chunk that was completed.
+
+    The chunks of the store are solved one after another, so they're complete as soon as possible, but in an order
+    spread over all of them, which spreads the directions over the sphere when each chunk is a band of it (like the
+    columns of a latitude/longitude grid).
+    :param store: The store, opened for writing
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param jobs: The number of processes to split the directions between, or 0 to use every CPU core
+    :param solver: The LP solver to use, see sweep_directions
+    :param use_symmetry: Whether to skip directions made equivalent by the symmetries of the thrusters
+    :param envelope: "thrust" or "torque", see sweep_directions
+    :param coarse_to_fine: Whether to solve all of the remaining directions in coarse_to_fine_order instead, for a
+    better preview while they're solved. Then no chunk is complete until nearly all of them are.
+    :return: A generator of SweepChunk tuples like iter_sweep, with indices into the directions of the store. The
+    chunks of the store that were already complete come first.
+    """
+    completed = store.completed()
+    for chunk in np.flatnonzero(store.chunk_flags):
+        indices = np.arange(chunk * store.chunk_size, min((chunk + 1) * store.chunk_size, store.count))
+        yield SweepChunk(indices, store.directions[indices].astype(float), store.rho[indices].astype(float),
+                         store.allocations[indices].astype(float), np.array(store.bases[indices]),
+                         np.array(store.row_bases[indices]))
 
-    norm = matplotlib.colors.Normalize(vmin=color_index.min(), vmax=color_index.max())
+    chunk_starts = np.arange(store.num_chunks)[_spread_order(store.num_chunks)] * store.chunk_size
+    remaining = np.concatenate([np.arange(start, min(start + store.chunk_size, store.count))
+                                for start in chunk_starts] + [np.zeros(0, dtype=int)])
+    remaining = remaining[~completed[remaining]]
 
-    # Start plotting results
-    matplotlib.use('TkAgg')
-    fig = plt.figure()
+    yield from _sweep_into_store(store, remaining, ThrusterSet.from_thrusters(thrusters), max_current, jobs, solver,
+                                 use_symmetry, envelope, coarse_to_fine, first_chunk=32)
+
+
+#####################################
+# Batch evaluation code
+#####################################
+# The directions of the summary metrics, along each of the vehicle's axes
+AXIS_DIRECTIONS = {
+    "surge": [1, 0, 0], "reverse_surge": [-1, 0, 0],
+    "sway": [0, 1, 0], "reverse_sway": [0, -1, 0],
+    "heave": [0, 0, 1], "reverse_heave": [0, 0, -1],
+}
+
+
+def read_layouts(path: str):
+    """
+    Read the thruster layouts of a batch, one at a time so that huge files don't have to fit in memory
+
+    A .jsonl file has one layout per line, either as a list of thrusters in the same format as thrusters.json or as
+    an object with a "thrusters" list and an optional "id". A .npz file has a "layouts" array of shape (L, N, 5)
+    holding the x, y, z, theta and phi of each thruster of each layout, and an optional (L,) "ids" array.
+    :param path: The file to read
+    :return: An iterator of (id, layout) tuples, where the layout is in the same format as thrusters.json. Layouts
+    without an id are numbered by their position in the file. A line that isn't valid JSON gives a ValueError naming
+    the line instead of a layout, which batch_evaluate reports as that layout's error.
+    """
+    if os.path.splitext(path)[1].lower() == ".npz":
+        with np.load(path) as batch:
+            layouts = batch["layouts"]
+            ids = batch["ids"].tolist() if "ids" in batch else range(len(layouts))
+
+        for layout_id, layout in zip(ids, layouts.tolist()):
+            yield layout_id, [dict(zip(("x", "y", "z", "theta", "phi"), thruster)) for thruster in layout]
+        return
+
+    with open(path) as f:
+        index = 0
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                layout = json.loads(line)
+            except json.JSONDecodeError as e:  # A malformed line shouldn't stop the rest of the batch
+                yield index, ValueError(f"line {line_number} is not valid JSON: {e.msg} at column {e.colno}")
+            else:
+                if isinstance(layout, dict):
+                    yield layout.get("id", index), layout["thrusters"]
+                else:
+                    yield index, layout
+            index += 1
+
+
+def evaluate_layout(thrusters: t.List[Thruster3D], directions: np.ndarray, max_current: int = DEFAULT_MAX_CURRENT,
+                    solver: str = "auto", use_symmetry=False, cache: SweepCache = None):
+    """
+    Calculate the thrust envelope of a layout and its summary metrics
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param directions: An array of unit vectors to calculate the envelope in, as returned by sphere_directions
+    :param cache: A SweepCache to look up and store the envelope in, shared with single runs of the same settings
+    :return: An array of the maximum thrust in each of the directions, and a dict of the summary metrics: the minimum
+    and maximum thrust over the envelope and the thrust along each of AXIS_DIRECTIONS
+    """
+    key = SweepCache.key(thrusters, {"mode": "sweep", "envelope": "thrust", "max_current": max_current,
+                                     "solver": solver, "use_symmetry": use_symmetry}, directions)
+    cached = None if cache is None else cache.load(key, thrusters)
+    if cached is not None:
+        rho = cached["rho"]
+    else:
+        rho, allocations, bases, row_bases = sweep_directions(thrusters, directions.reshape(-1, 3), max_current, 1,
+                                                              solver, use_symmetry, return_allocations=True,
+                                                              return_bases=True)
+        rho = rho.reshape(directions.shape[:-1])
+        if cache is not None:
+            cache.store(key, thrusters, rho=rho, bases=bases.reshape(directions.shape[:-1] + (len(thrusters), 3)),
+                        row_bases=row_bases.reshape(directions.shape[:-1] + (2, 6)),
+                        allocations=allocations.reshape(directions.shape[:-1] + (len(thrusters),)))
+
+    axis_rho = sweep_directions(thrusters, np.array(list(AXIS_DIRECTIONS.values())), max_current, 1, solver)
+
+    metrics = {"min_thrust": float(rho.min()), "max_thrust": float(rho.max())}
+    metrics.update(zip(AXIS_DIRECTIONS, axis_rho.tolist()))
+    return rho, metrics
+
+
+def _init_batch_worker(directions, max_current, solver, use_symmetry, cache_dir, include_envelope,
+                       collect_stats=None):
+    _worker_state.update(directions=directions, max_current=max_current, solver=solver, use_symmetry=use_symmetry,
+                         cache=None if cache_dir is None else SweepCache(cache_dir), include_envelope=include_envelope,
+                         return_stats=bool(collect_stats))
+    if collect_stats is not None:  # Only in pool workers, when evaluating in this process the stats are already here
+        enable_stats(collect_stats)
+
+
+def _evaluate_batch_layout(layout: t.Tuple[int, t.Any, t.List[dict]]):
+    index, layout_id, thrusters_raw = layout
+    result = {"index": index, "id": layout_id}
+    try:
+        if isinstance(thrusters_raw, Exception):  # A line read_layouts couldn't parse
+            raise thrusters_raw
+        thrusters = load_thrusters(thrusters_raw)
+        rho, metrics = evaluate_layout(thrusters, _worker_state["directions"], _worker_state["max_current"],
+                                       _worker_state["solver"], _worker_state["use_symmetry"], _worker_state["cache"])
+    except (KeyError, TypeError, ValueError) as e:  # A malformed layout shouldn't stop the rest of the batch
+        result["error"] = f"{type(e).__name__}: {e}"
+    else:
+        result.update(metrics)
+        if _worker_state["include_envelope"]:
+            result["rho"] = rho.tolist()
+
+    if _worker_state["return_stats"]:
+        result["_stats"] = _take_stats()  # Taken back out by batch_evaluate
+    return result
+
+
+def batch_evaluate(layouts: t.Iterable[t.Tuple[t.Any, t.List[dict]]], directions: np.ndarray,
+                   max_current: int = DEFAULT_MAX_CURRENT, jobs: int = 1, solver: str = "auto", use_symmetry=False,
+                   cache_dir: str = None, include_envelope=False):
+    """
+    Evaluate many thruster layouts with one process pool, yielding the results as they finish
+
+    Each worker process imports everything and starts up once for the whole batch, and evaluates whole layouts at a
+    time, so there's no per-layout startup cost and no inter-process traffic within a layout.
+    :param layouts: An iterable of (id, layout) tuples, as returned by read_layouts
+    :param directions: An array of unit vectors to calculate each envelope in, as returned by sphere_directions
+    :param jobs: The number of worker processes, 0 for one per CPU core, or 1 to evaluate in this process
+    :param cache_dir: A SweepCache directory to look up and store the envelopes in, or None to not cache them
+    :param include_envelope: Whether to include the thrust in each direction in the results, as "rho"
+    :return: An iterator of dicts with the index of the layout in the batch, its id, and either its metrics (see
+    evaluate_layout) or an "error" message. They're in the order they finish in, not the order of the batch.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    tasks = ((index, layout_id, thrusters_raw) for index, (layout_id, thrusters_raw) in enumerate(layouts))
+    worker_args = (directions, max_current, solver, use_symmetry, cache_dir, include_envelope)
+
+    if jobs == 1:
+        _init_batch_worker(*worker_args)
+        yield from map(_evaluate_batch_layout, tasks)
+        return
+
+    with multiprocessing.Pool(jobs, initializer=_init_batch_worker,
+                              initargs=worker_args + (_stats is not None,)) as pool:
+        for result in pool.imap_unordered(_evaluate_batch_layout, tasks):
+            _merge_stats(result.pop("_stats", None))
+            yield result
+
+
+#####################################
+# Layout optimization code
+#####################################
+OBJECTIVES = ("min", "volume", "axes")
+
+
+def envelope_volume(points: np.ndarray, triangles: np.ndarray):
+    """
+    Calculate the volume enclosed by a triangulated envelope, which has to contain the origin
+    :param points: A (P, 3) array of points on the surface of the envelope
+    :param triangles: A (T, 3) array of indices into points for each triangle of the surface
+    :return: The volume in kgf^3
+    """
+    # Sum the tetrahedra between the origin and each triangle. Their orientation doesn't matter since the origin is
+    # inside, so every one of them counts positively.
+    return np.abs(np.linalg.det(points[triangles])).sum() / 6
+
+
+def envelope_objective(thrusters: t.List[Thruster3D], objective: str, directions: np.ndarray, triangles: np.ndarray,
+                       weights: t.Sequence[float] = (1, 1, 1), max_current: int = DEFAULT_MAX_CURRENT,
+                       solver: str = "auto"):
+    """
+    Score the thrust envelope of a layout, higher is better
+    :param objective: "min" for the minimum thrust over the sphere, "volume" for the volume of the envelope, or "axes"
+    for a weighted sum of the surge, sway and heave thrust (each the average of both ways along the axis)
+    :param directions: A (P, 3) array of unit vectors to calculate the envelope in
+    :param triangles: A (T, 3) array of indices into directions for each triangle of the sphere
+    :param weights: The weights of surge, sway and heave for the "axes" objective
+    :return: The score
+    """
+    rho, metrics = evaluate_layout(thrusters, directions, max_current, solver)
 
+    if objective == "min":
+        return metrics["min_thrust"]
+    if objective == "volume":
+        return envelope_volume(directions * rho[:, np.newaxis], triangles)
+    if objective == "axes":
+        return sum(weight * (metrics[axis] + metrics["reverse_" + axis]) / 2
+                   for weight, axis in zip(weights, ("surge", "sway", "heave")))
+
+    raise ValueError(f"unknown objective {objective!r}")
+
+
+def _layout_from_parameters(thrusters_raw: t.List[dict], parameters: np.ndarray, optimize_positions: bool):
+    """
+    Apply an optimizer's parameter vector to a layout: theta and phi of each thruster, then x, y and z of each thruster
+    if positions are being optimized too. Anything else about the thrusters is kept as it was.
+    """
+    num_thrusters = len(thrusters_raw)
+    angles = parameters[:2 * num_thrusters].reshape(num_thrusters, 2)
+    positions = parameters[2 * num_thrusters:].reshape(num_thrusters, 3) if optimize_positions else None
+
+    layout = []
+    for i, thruster_raw in enumerate(thrusters_raw):
+        thruster_raw = dict(thruster_raw, theta=float(angles[i, 0]), phi=float(angles[i, 1]))
+        if optimize_positions:
+            thruster_raw.update(x=float(positions[i, 0]), y=float(positions[i, 1]), z=float(positions[i, 2]))
+        layout.append(thruster_raw)
+    return layout
+
+
+def _init_optimize_worker(thrusters_raw, objective, weights, optimize_positions, position_bounds, max_current, solver):
+    _worker_state.update(thrusters_raw=thrusters_raw, objective=objective, weights=weights,
+                         optimize_positions=optimize_positions, position_bounds=position_bounds,
+                         max_current=max_current, solver=solver)
+
+
+def _optimize_from(task: t.Tuple[np.ndarray, int, int]):
+    """
+    Run one Nelder-Mead search in a pool worker
+    :param task: The starting parameter vector, the resolution to evaluate the envelope at, and the maximum number
+    of envelope evaluations
+    :return: The best parameter vector found and its score
+    """
+    from scipy.optimize import minimize
+
+    start, resolution, max_evaluations = task
+    state = _worker_state
+    num_thrusters = len(state["thrusters_raw"])
+    directions, triangles = sphere_directions("fibonacci", resolution)
+
+    def loss(parameters):
+        layout = _layout_from_parameters(state["thrusters_raw"], parameters, state["optimize_positions"])
+        return -envelope_objective(load_thrusters(layout), state["objective"], directions, triangles,
+                                   state["weights"], state["max_current"], state["solver"])
+
+    # The default initial simplex only moves each parameter by 5%, which is nothing for an angle near 0. Step the
+    # angles by 15 degrees and the positions by a quarter of their range instead.
+    steps = [15.] * (2 * num_thrusters)
+    bounds = [(None, None)] * (2 * num_thrusters)  # Angles wrap around, so they don't need bounds
+    if state["optimize_positions"]:
+        position_bounds = np.asarray(state["position_bounds"]).reshape(-1, 2)
+        steps += ((position_bounds[:, 1] - position_bounds[:, 0]) / 4).tolist()
+        bounds += [tuple(bound) for bound in position_bounds]
+    initial_simplex = np.vstack((start, start + np.diag(steps)))
+    if state["optimize_positions"]:  # Step the other way if a vertex would start outside of its bounds
+        upper = np.array([np.inf] * (2 * num_thrusters) + [bound[1] for bound in bounds[2 * num_thrusters:]])
+        initial_simplex[1:] = np.where(initial_simplex[1:] > upper, start - np.diag(steps), initial_simplex[1:])
+
+    result = minimize(loss, start, method="Nelder-Mead", bounds=bounds if state["optimize_positions"] else None,
+                      options={"initial_simplex": initial_simplex, "maxfev": max_evaluations, "fatol": 1e-4})
+    return result.x, -result.fun
+
+
+def optimize_layout(thrusters_raw: t.List[dict], objective: str = "min", weights: t.Sequence[float] = (1, 1, 1),
+                    optimize_positions=False, position_range: float = .5, restarts: int = 8, refine: int = 2,
+                    coarse_resolution: int = 12, resolution: int = 30, max_evaluations: int = 1000,
+                    refine_evaluations: int = 200, max_current: int = DEFAULT_MAX_CURRENT, jobs: int = 1,
+                    solver: str = "auto", seed: int = None):
+    """
+    Search for the thruster orientations (and optionally positions) that maximize an envelope objective
+
+    Several Nelder-Mead searches are started, one from the given layout and the rest from random orientations, and run
+    in parallel on a coarse sphere where each evaluation is cheap. Only the best few results get polished with a
+    second search on the finer sphere, and the best of those is returned.
+    :param thrusters_raw: The starting layout, in the same format as thrusters.json
+    :param objective: What to maximize, see envelope_objective
+    :param weights: The weights of surge, sway and heave for the "axes" objective
+    :param optimize_positions: Whether to move the thrusters as well as turning them
+    :param position_range: How far each thruster may move from its starting position along each axis
+    :param restarts: The number of coarse searches
+    :param refine: The number of coarse results to polish on the fine sphere
+    :param coarse_resolution: The resolution of the sphere the coarse searches evaluate on, see sphere_directions
+    :param resolution: The resolution of the sphere the best results are polished on
+    :param max_evaluations: The maximum number of envelope evaluations of each coarse search
+    :param refine_evaluations: The maximum number of envelope evaluations of each polishing search, which are a lot
+    more expensive
+    :param jobs: The number of processes to run searches in, 0 for one per CPU core
+    :param seed: The seed of the random starting layouts
+    :return: The optimized layout in the same format as thrusters.json, and its score on the fine sphere
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"unknown objective {objective!r}")
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    num_thrusters = len(thrusters_raw)
+    positions = np.array([[thruster['x'], thruster['y'], thruster['z']] for thruster in thrusters_raw], dtype=float)
+    position_bounds = np.stack((positions - position_range, positions + position_range), axis=-1)  # Nx3x2
+
+    # The given layout is always one of the starting points, the rest are orientations spread evenly over the sphere
+    # and positions anywhere within range
+    random = np.random.default_rng(seed)
+    starts = []
+    for restart in range(restarts):
+        if restart == 0:
+            angles = [[thruster['theta'], thruster['phi']] for thruster in thrusters_raw]
+            start_positions = positions
+        else:
+            angles = np.stack((random.uniform(-180, 180, num_thrusters),
+                               np.degrees(np.arccos(random.uniform(-1, 1, num_thrusters)))), axis=-1)
+            start_positions = random.uniform(position_bounds[..., 0], position_bounds[..., 1])
+        start = np.ravel(angles).astype(float)
+        if optimize_positions:
+            start = np.concatenate((start, np.ravel(start_positions)))
+        starts.append(start)
+
+    worker_args = (thrusters_raw, objective, weights, optimize_positions, position_bounds, max_current, solver)
+
+    def run(tasks):
+        if jobs == 1:
+            _init_optimize_worker(*worker_args)
+            return list(map(_optimize_from, tasks))
+        with multiprocessing.Pool(min(jobs, len(tasks)), initializer=_init_optimize_worker,
+                                  initargs=worker_args) as pool:
+            return pool.map(_optimize_from, tasks, chunksize=1)
+
+    coarse_results = run([(start, coarse_resolution, max_evaluations) for start in starts])
+    coarse_results.sort(key=lambda result: result[1], reverse=True)
+
+    fine_results = run([(parameters, resolution, refine_evaluations) for parameters, _ in coarse_results[:refine]])
+    parameters, score = max(fine_results, key=lambda result: result[1])
+
+    layout = _layout_from_parameters(thrusters_raw, parameters, optimize_positions)
+    for thruster in layout:  # Put the angles back into their usual ranges
+        thruster["theta"] = (thruster["theta"] + 180) % 360 - 180
+        thruster["phi"] = thruster["phi"] % 360
+        if thruster["phi"] > 180:  # The same direction with phi in [0, 180]
+            thruster["phi"] = 360 - thruster["phi"]
+            thruster["theta"] = (thruster["theta"] + 360) % 360 - 180
+    return layout, score
+
+
+#####################################
+# Control allocation code
+#####################################
+class ThrustAllocator:
+    """
+    Turns a desired wrench (x, y, z force then x, y, z torque) into a thrust for each thruster, fast and with a
+    predictable latency, for running inside a vehicle's control loop.
+
+    Each allocation is a redistributed pseudo-inverse: the least squares thrusts that produce the wrench, weighted by
+    each thruster's quadratic current coefficient so that, like the min current LP, thrusters that draw more current
+    are used less. Thrusters that end up past their bounds are clamped there, and the rest of the wrench is
+    redistributed between the others, until every thrust is within bounds. The weighted pseudo-inverse of every subset
+    of thrusters that can be left free depends only on the layout, so they're precomputed. Layouts with more than
+    PRECOMPUTE_THRUSTERS thrusters have too many subsets for that, so only the ones every redistribution starts from
+    are, and the rest are computed on first use and kept, up to MAX_PSEUDO_INVERSES of them.
+
+    A wrench the thrusters can't produce is scaled down towards zero until they can, using a WrenchZonotope, so it
+    keeps its direction instead of the saturated thrusters distorting it. (Any part of it that no thrust can produce,
+    like pitch for a layout in one plane, is dropped first.) The redistribution can also fall short of wrenches that
+    are within reach but close to the edge. Either way, the wrench where its direction leaves the zonotope is
+    allocated from the facet it leaves through instead: every thruster that isn't parallel to the facet has to be at
+    the bound that pushes furthest out through it, which leaves only the parallel ones to solve for. Scaling those
+    thrusts down gives the wrench itself if it's within reach, since the bounds of every thruster include 0. The
+    thrusts are then scaled down to the current limit the same way as in get_max_thrust.
+    """
+
+    # Precompute the pseudo-inverses of every subset of up to this many thrusters, rather than on first use
+    PRECOMPUTE_THRUSTERS = 12
+    # Keep at most this many pseudo-inverses, dropping the least recently used ones. Enough for every subset of
+    # PRECOMPUTE_THRUSTERS thrusters, so precomputed ones are never dropped.
+    MAX_PSEUDO_INVERSES = 2 ** PRECOMPUTE_THRUSTERS
+    # How many times to halve the range of scales searched for a saturated wrench the redistribution can't reach
+    SCALE_SEARCH_STEPS = 10
+
+    def __init__(self, thrusters: t.List[Thruster3D], max_current: int = DEFAULT_MAX_CURRENT):
+        """
+        :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+        :param max_current: The maximum total current draw of all thrusters in amps
+        """
+        thrusters = ThrusterSet.from_thrusters(thrusters)
+        self.thrusters = thrusters
+        self.max_current = max_current
+        self.num_thrusters = len(thrusters)
+        self.current_limit_can_bind = thrusters.max_current_draw() > max_current
+
+        self.wrenches = thrusters.wrenches  # 6xN
+        self.lower, self.upper = thrusters.bounds.transpose().copy()
+
+        # Minimizing sum(weight * thrust^2) is minimizing the weighted norm of the thrusts, which becomes the plain
+        # norm after scaling each thruster's column by 1 / sqrt(weight)
+        weights = (thrusters.fwd_current[:, 0] + thrusters.rev_current[:, 0]) / 2
+        self.column_scales = 1 / np.sqrt(np.where(weights > 0, weights, 1.))
+
+        try:
+            self.zonotope = WrenchZonotope(thrusters)
+        except ValueError:  # Too many thrusters, so saturated wrenches just get clamped
+            self.zonotope = None
+        else:
+            # Which bound each thruster is at on each facet: 1 forward, -1 reverse or 0 parallel to it and free
+            facet_reach = self.zonotope.normals.dot(self.wrenches) * (self.upper - self.lower)  # FxN
+            self.facet_bounds = np.where(np.abs(facet_reach) > 1e-9 * max(1., np.abs(facet_reach).max(initial=0)),
+                                         np.sign(facet_reach), 0).astype(np.int8)
+
+        # Maps the bytes of each mask of free thrusters to its Nx6 pseudo-inverse, least recently used first
+        self.pseudo_inverses = collections.OrderedDict()
+        if self.num_thrusters <= self.PRECOMPUTE_THRUSTERS:
+            free_sets = itertools.product((False, True), repeat=self.num_thrusters)
+        else:
+            # Every thruster free, and every one but one, which is as far as most redistributions get
+            free_sets = ~np.eye(self.num_thrusters + 1, self.num_thrusters, -1, dtype=bool)
+        for free in free_sets:
+            self._pseudo_inverse(np.array(free))
+
+        # Latency of every call to allocate
+        self.calls = 0
+        self.total_latency = 0.
+        self.worst_latency = 0.
+
+    def _pseudo_inverse(self, free: np.ndarray):
+        """
+        Get the weighted pseudo-inverse that maps a wrench onto thrusts of only the free thrusters
+        :param free: An (N,) bool array of which thrusters are free
+        :return: An Nx6 array, with rows of 0 for the thrusters that aren't free
+        """
+        key = free.tobytes()
+        pseudo_inverse = self.pseudo_inverses.get(key)
+        if pseudo_inverse is None:
+            pseudo_inverse = np.zeros((self.num_thrusters, 6))
+            scales = self.column_scales[free]
+            pseudo_inverse[free] = scales[:, np.newaxis] * np.linalg.pinv(self.wrenches[:, free] * scales)
+            self.pseudo_inverses[key] = pseudo_inverse
+            if len(self.pseudo_inverses) > self.MAX_PSEUDO_INVERSES:
+                self.pseudo_inverses.popitem(last=False)
+        else:
+            self.pseudo_inverses.move_to_end(key)
+        return pseudo_inverse
+
+    def allocate(self, wrench: np.ndarray, return_wrench=False):
+        """
+        Calculate the thrust of each thruster that produces a wrench, or the closest to it the thrusters can manage
+        :param wrench: The desired 6d wrench, in kgf and kgf times the unit of the thruster positions
+        :param return_wrench: Whether to also return the wrench the thrusts actually produce
+        :return: An (N,) array of the thrust of each thruster in kgf, plus the produced wrench if requested
+        """
+        start = time.perf_counter()
+        wrench = np.asarray(wrench, dtype=float)
+
+        thrusts = self._redistribute(wrench)
+        # Only check whether the wrench is within reach when it wasn't reached, since that's the slow part with many
+        # thrusters. If it's out of reach, aim for the furthest wrench in the same direction instead.
+        if self.zonotope is not None and not self._reached(thrusts, wrench):
+            wrench = wrench - self.zonotope.complement.transpose().dot(self.zonotope.complement.dot(wrench))
+            scale, facet, side = self.zonotope.max_along(wrench, return_facets=True)
+            edge = None
+            if facet >= 0:
+                bounds = side * self.facet_bounds[facet]
+                edge = self._redistribute(scale * wrench, np.where(bounds > 0, self.upper, self.lower), bounds == 0)
+
+            if edge is not None and self._reached(edge, scale * wrench):
+                thrusts = edge / max(scale, 1.)
+            elif np.isfinite(scale):
+                # The last resort if that still falls short: look for the largest scale the redistribution does
+                # reach, to keep the direction. A fixed number of halvings keeps the worst case latency bounded.
+                low, high = 0., min(scale, 1.)
+                thrusts = np.zeros(self.num_thrusters)
+                for _ in range(self.SCALE_SEARCH_STEPS):
+                    middle = (low + high) / 2
+                    candidate = self._redistribute(wrench * middle)
+                    if self._reached(candidate, wrench * middle):
+                        low, thrusts = middle, candidate
+                    else:
+                        high = middle
+
+        if self.current_limit_can_bind:
+            thrusts *= _current_limit_multiplier(thrusts, self.max_current, self.thrusters.fwd_current,
+                                                 self.thrusters.rev_current)
+
+        latency = time.perf_counter() - start
+        self.calls += 1
+        self.total_latency += latency
+        self.worst_latency = max(self.worst_latency, latency)
+
+        if return_wrench:
+            return thrusts, self.wrenches.dot(thrusts)
+        return thrusts
+
+    def _redistribute(self, wrench: np.ndarray, thrusts: np.ndarray = None, free: np.ndarray = None):
+        """
+        Find thrusts within bounds that produce a wrench with a redistributed pseudo-inverse: clamp the thrusters that
+        overshoot and share what's left of the wrench between the others
+        :param thrusts: The thrusts of the thrusters that start out fixed, if any
+        :param free: Which thrusters start out free, all of them if not given
+        """
+        thrusts = np.zeros(self.num_thrusters) if thrusts is None else thrusts
+        free = np.ones(self.num_thrusters, dtype=bool) if free is None else free.copy()
+        for _ in range(self.num_thrusters):
+            fixed_thrusts = np.where(free, 0., thrusts)
+            thrusts = fixed_thrusts + self._pseudo_inverse(free).dot(wrench - self.wrenches.dot(fixed_thrusts))
+            overshot = (thrusts < self.lower - 1e-9) | (thrusts > self.upper + 1e-9)
+            if not overshot.any():
+                break
+            thrusts = np.clip(thrusts, self.lower, self.upper)
+            free &= ~overshot
+        return np.clip(thrusts, self.lower, self.upper)
+
+    def _reached(self, thrusts: np.ndarray, wrench: np.ndarray):
+        return np.all(np.abs(self.wrenches.dot(thrusts) - wrench) <= 1e-9 * max(1., np.abs(wrench).max()))
+
+    def latency(self):
+        """
+        Report the latency of allocate so far
+        :return: A dict of the number of calls, and the mean and worst latency in microseconds
+        """
+        return {"calls": self.calls, "mean_us": 1e6 * self.total_latency / max(1, self.calls),
+                "worst_us": 1e6 * self.worst_latency}
+
+
+#####################################
+# Lookup table code
+#####################################
+def grid_triangles(shape: t.Tuple[int, int]):
+    """
+    Triangulate a grid of points, like the latitude/longitude directions of sphere_directions
+    :param shape: The (A, B) shape of the grid
+    :return: A (T, 3) array of indices into the flattened grid for each triangle, two per square of the grid
+    """
+    rows, columns = shape
+    corners = np.arange(rows * columns).reshape(rows, columns)[:-1, :-1].ravel()  # Top left corner of each square
+    below, right = corners + columns, corners + 1
+    return np.concatenate((np.stack((corners, below, below + 1), axis=-1),
+                           np.stack((corners, below + 1, right), axis=-1)))
+
+
+class EnvelopeTable:
+    """
+    A precomputed thrust or torque envelope, for looking up the max thrust and the allocation that produces it in any
+    direction without solving an LP.
+
+    The table is the result of a sweep: the max thrust and the thrust of each thruster at every direction of a
+    triangle mesh of the sphere. A query finds the triangle of the mesh its direction passes through and blends the
+    values at its corners with barycentric weights, which are the coefficients that make the direction out of the
+    three corner directions, scaled to add up to 1.
+
+    To find the triangle quickly, the sphere is split into buckets by projecting it onto a cube (like a cube map) and
+    splitting each face into a grid. A projection from the center of the sphere keeps the edges of the triangles
+    straight, so every triangle goes into the buckets its bounding box on each face overlaps, and a query only has to
+    try the few triangles in its bucket. Only numpy is needed, so tools that just query the table don't pay for
+    importing scipy or matplotlib.
+    """
+
+    # How many of the triangles in each bucket to try at once
+    CANDIDATES_PER_STEP = 8
+    # How far outside of a triangle a direction can be and still count as inside, so directions on edges are found
+    TOLERANCE = 1e-9
+
+    def __init__(self, directions: np.ndarray, triangles: np.ndarray, rho: np.ndarray, allocations: np.ndarray = None,
+                 envelope: str = "thrust"):
+        """
+        :param directions: Either an (A, B, 3) grid of unit vectors, or a (P, 3) array of them
+        :param triangles: A (T, 3) array of indices into directions for each triangle of the mesh, or None to
+        triangulate a grid
+        :param rho: The max thrust in each direction, in the shape of directions without the last axis
+        :param allocations: The thrust of each thruster in each direction, in the shape of rho plus an axis of N
+        thrusters, if they should be looked up too
+        :param envelope: "thrust" or "torque", which envelope the table holds
+        """
+        if triangles is None:
+            triangles = grid_triangles(directions.shape[:2])
+        self.directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        self.rho = np.asarray(rho).reshape(-1)
+        self.allocations = None if allocations is None else np.asarray(allocations).reshape(len(self.rho), -1)
+        self.envelope = envelope
+
+        # Grid points that coincide, like the poles of a latitude/longitude grid, leave triangles with no area
+        corners = self.directions[self.triangles].transpose(0, 2, 1)  # Tx3x3, with the corner directions as columns
+        self.triangles = self.triangles[np.abs(np.linalg.det(corners)) > 1e-12]
+        # Multiplying a direction by these gives the coefficients that make it out of the corners of each triangle
+        self.inverses = np.linalg.inv(self.directions[self.triangles].transpose(0, 2, 1))
+
+        self._build_buckets()
+
+    def _build_buckets(self):
+        """
+        Sort the triangles into the buckets of the cube map, which are numbered the same way as by _cube_map_cells
+        """
+        triangle_count = len(self.triangles)
+        # Enough buckets that each one only overlaps a few triangles
+        self.bucket_size = size = int(np.clip(np.sqrt(triangle_count / 12), 1, 256))
+
+        buckets = []
+        triangles = []
+        corners = self.directions[self.triangles]  # Tx3x3
+
+        # A cap around each triangle, for telling which faces the triangles that cross the plane of a face can reach
+        centers = corners.sum(axis=1)
+        centers /= np.linalg.norm(centers, axis=-1, keepdims=True)
+        radii = np.arccos(np.einsum("tij,tj->ti", corners, centers).min(axis=1).clip(-1, 1))
+
+        for face in range(6):
+            axis, sign = face // 2, 1 - 2 * (face % 2)
+            across = [i for i in range(3) if i != axis]
+            depth = sign * corners[..., axis]  # Tx3, how far each corner is along the face's axis
+
+            # The face only covers directions within 54.7 degrees of its axis, and triangles that are entirely in
+            # front of it project onto it as triangles, so their bounding box in the grid can be used
+            in_front = (depth > 0).all(axis=1)
+            projected = corners[in_front][..., across] / depth[in_front][..., np.newaxis]  # Tx3x2
+            low = np.floor((projected.min(axis=1) + 1) / 2 * size).clip(0, size - 1).astype(int)
+            high = np.floor((projected.max(axis=1) + 1) / 2 * size).clip(0, size - 1).astype(int)
+            on_face = (projected.max(axis=1) >= -1).all(axis=1) & (projected.min(axis=1) <= 1).all(axis=1)
+            face_triangles = np.flatnonzero(in_front)[on_face]
+            low, high = low[on_face], high[on_face]
+
+            # Triangles that cross the plane of the face are large enough to cover all of it, for the few meshes
+            # where they can reach it at all
+            reaches = np.arccos((sign * centers[:, axis]).clip(-1, 1)) - radii <= np.arctan(np.sqrt(2)) + 1e-9
+            crossing = np.flatnonzero(~in_front & reaches)
+            face_triangles = np.concatenate((face_triangles, crossing))
+            low = np.concatenate((low, np.zeros((len(crossing), 2), dtype=int)))
+            high = np.concatenate((high, np.full((len(crossing), 2), size - 1)))
+
+            # Every bucket in each triangle's range of rows and columns
+            counts = high - low + 1
+            repeats = counts.prod(axis=1)
+            offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+            rows = np.repeat(low[:, 0], repeats) + offsets // np.repeat(counts[:, 1], repeats)
+            columns = np.repeat(low[:, 1], repeats) + offsets % np.repeat(counts[:, 1], repeats)
+            buckets.append((face * size + rows) * size + columns)
+            triangles.append(np.repeat(face_triangles, repeats))
+
+        # Store the triangles of each bucket one after another, with where each bucket starts
+        buckets, triangles = np.concatenate(buckets), np.concatenate(triangles)
+        order = np.argsort(buckets, kind="stable")
+        self.bucket_triangles = triangles[order]
+        self.bucket_starts = np.searchsorted(buckets[order], np.arange(6 * size * size + 1))
+
+    def _locate(self, directions: np.ndarray):
+        """
+        Find the triangle each direction passes through, and its barycentric weights in it
+        :param directions: An (M, 3) array of nonzero directions
+        :return: An (M,) array of triangle indices, and an (M, 3) array of the weight of each corner
+        """
+        buckets = _cube_map_cells(directions, self.bucket_size)
+        starts = self.bucket_starts[buckets]
+        counts = self.bucket_starts[buckets + 1] - starts
+
+        # The best triangle so far is the one the direction is furthest inside of, by its smallest coefficient
+        found = np.zeros(len(directions), dtype=np.int64)
+        best = np.full(len(directions), -np.inf)
+        coefficients = np.zeros((len(directions), 3))
+
+        active = np.arange(len(directions))
+        step = self.CANDIDATES_PER_STEP
+        for first in range(0, counts.max(initial=0), step):
+            # Only keep trying for directions with triangles left in their bucket that haven't been found yet
+            active = active[(counts[active] > first) & (best[active] < -self.TOLERANCE)]
+            if len(active) == 0:
+                break
+
+            # Try the next few triangles of each bucket, repeating the last one where there are fewer left
+            candidate = first + np.minimum(np.arange(step), counts[active, np.newaxis] - first - 1)  # Mx8
+            candidates = self.bucket_triangles[starts[active, np.newaxis] + candidate]
+            candidate_coefficients = np.einsum("mcij,mj->mci", self.inverses[candidates], directions[active])
+
+            smallest = candidate_coefficients.min(axis=2)
+            pick = smallest.argmax(axis=1)
+            picked = smallest[np.arange(len(active)), pick]
+            better = picked > best[active]
+            improved = active[better]
+            found[improved] = candidates[better, pick[better]]
+            best[improved] = picked[better]
+            coefficients[improved] = candidate_coefficients[better, pick[better]]
+
+        # Directions just outside of every triangle due to rounding get the closest point of the nearest one, and any
+        # outside of the mesh entirely get NaN
+        weights = coefficients.clip(0)
+        with np.errstate(invalid="ignore"):
+            return found, weights / weights.sum(axis=1, keepdims=True)
+
+    def query(self, directions: np.ndarray, return_allocations: bool = False):
+        """
+        Look up the max thrust in some directions, interpolating between the directions in the table
+        :param directions: A direction as an (x, y, z) vector, or an (..., 3) array of them. They don't have to be
+        unit vectors, and ones of length 0 give NaN.
+        :param return_allocations: Whether to also return the thrust of each thruster
+        :return: The max thrust in each direction, as a float or an array in the shape of directions without the last
+        axis, and (if requested) the thrust of each thruster in the same shape plus an axis of N thrusters
+        """
+        if return_allocations and self.allocations is None:
+            raise ValueError("the table has no allocations")
+
+        directions = np.asarray(directions, dtype=float)
+        if directions.ndim == 1:
+            return self._query_one(directions, return_allocations)
+        shape = directions.shape[:-1]
+        directions = directions.reshape(-1, 3)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+        valid = np.isfinite(directions).all(axis=1)
+
+        triangles, weights = self._locate(directions[valid])
+        corners = self.triangles[triangles]  # Mx3
+
+        rho = np.full(len(directions), np.nan)
+        rho[valid] = np.einsum("mi,mi->m", weights, self.rho[corners])
+        rho = rho.reshape(shape)[()]  # [()] turns the 0-d array of a single direction into a float
+        if not return_allocations:
+            return rho
+
+        allocations = np.full((len(directions), self.allocations.shape[1]), np.nan)
+        allocations[valid] = np.einsum("mi,min->mn", weights, self.allocations[corners])
+        return rho, allocations.reshape(shape + (-1,))
+
+    def _query_one(self, direction: np.ndarray, return_allocations: bool):
+        """
+        The query of a single direction, which skips most of the bookkeeping of a batch since those are usually
+        made one at a time in a loop
+        """
+        if not np.any(direction):
+            rho = np.nan
+            return (rho, np.full(self.allocations.shape[1], np.nan)) if return_allocations else rho
+
+        # The same as _cube_map_cells, but plain Python is a lot quicker than numpy for a single direction
+        x = direction.tolist()
+        axis = max(range(3), key=lambda i: abs(x[i]))
+        cells = [min(max(math.floor((x[i] / abs(x[axis]) + 1) / 2 * self.bucket_size), 0), self.bucket_size - 1)
+                 for i in range(3) if i != axis]
+        bucket = ((2 * axis + (x[axis] < 0)) * self.bucket_size + cells[0]) * self.bucket_size + cells[1]
+
+        # Trying every triangle in the bucket at once is quick for one direction, and coefficients scale with the
+        # length of the direction, so it doesn't even have to be normalized for picking the triangle
+        candidates = self.bucket_triangles[self.bucket_starts[bucket]:self.bucket_starts[bucket + 1]]
+        coefficients = self.inverses[candidates].dot(direction)  # Cx3
+        pick = coefficients.min(axis=1).argmax()
+        weights = coefficients[pick].clip(0)
+        weights /= weights.sum()
+        corners = self.triangles[candidates[pick]]
+
+        rho = float(weights.dot(self.rho[corners]))
+        if not return_allocations:
+            return rho
+        return rho, weights.dot(self.allocations[corners])
+
+    def save(self, path: str):
+        """
+        Save the table to a .npz file, which load reads back
+        :param path: The file to save to
+        """
+        # Single precision is plenty for the values, and halves the size of the file
+        arrays = {"rho": self.rho.astype(np.float32), "envelope": np.array(self.envelope)}
+        if self.allocations is not None:
+            arrays["allocations"] = self.allocations.astype(np.float32)
+        np.savez_compressed(path, directions=self.directions, triangles=self.triangles.astype(np.int32), **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a table saved by save
+        :param path: The file to load
+        :return: The EnvelopeTable
+        """
+        with np.load(path) as arrays:
+            return cls(arrays["directions"], arrays["triangles"], arrays["rho"].astype(float),
+                       arrays["allocations"].astype(float) if "allocations" in arrays else None,
+                       str(arrays["envelope"]))
+
+
+#####################################
+# Yaw, pitch, roll code
+#####################################
+# The axes of the vehicle the torque maxima are reported around, in both directions
+TORQUE_AXIS_DIRECTIONS = {
+    "roll": [1, 0, 0], "reverse_roll": [-1, 0, 0],
+    "pitch": [0, 1, 0], "reverse_pitch": [0, -1, 0],
+    "yaw": [0, 0, 1], "reverse_yaw": [0, 0, -1],
+}
+
+
+def calc_max_yaw_pitch_roll(thrusters: t.List[Thruster3D], max_current: int = DEFAULT_MAX_CURRENT,
+                            solver: str = "auto"):
+    """
+    Calculate the maximum roll, pitch and yaw torque at zero net force, each way around each axis. These are six
+    directions of the torque envelope, solved the same way as a torque sweep.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param max_current: The maximum total current draw of all thrusters in amps
+    :param solver: The LP solver to use, see sweep_directions
+    :return: A dict mapping each of TORQUE_AXIS_DIRECTIONS to the maximum torque around it, in kgf times the unit of
+    the thruster positions
+    """
+    rho = sweep_directions(thrusters, np.array(list(TORQUE_AXIS_DIRECTIONS.values())), max_current, 1, solver,
+                           envelope="torque")
+    return dict(zip(TORQUE_AXIS_DIRECTIONS, (rho + 0.).tolist()))  # Adding 0 turns -0.0 into 0.0
+
+
+#####################################
+# Plotting code
+#####################################
+def _envelope_axes(fig, thrusters: t.List[Thruster3D], max_rho: float, envelope: str):
+    """
+    Add the axes for plotting an envelope to a figure, with the thrusters drawn in
+    :param fig: The matplotlib figure
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param max_rho: How far the axes go from the origin in each direction
+    :param envelope: "thrust" or "torque", which the axes are labelled for
+    :return: The axes
+    """
     # Set up plot: 3d orthographic plot with ROV axis orientation
     ax = fig.add_subplot(111, projection='3d', proj_type='ortho')
 
@@ -341,9 +3325,14 @@ def main(thrusters, resolution: int, max_current: int):
     ax.set_ylim((-max_rho, max_rho))
     ax.set_zlim((max_rho, -max_rho))  # Invert y axis
 
-    ax.set_xlabel('X (Surge)')
-    ax.set_ylabel('Y (Sway)')
-    ax.set_zlabel('Z (Heave)')
+    if envelope == "torque":
+        ax.set_xlabel('X (Roll)')
+        ax.set_ylabel('Y (Pitch)')
+        ax.set_zlabel('Z (Yaw)')
+    else:
+        ax.set_xlabel('X (Surge)')
+        ax.set_ylabel('Y (Sway)')
+        ax.set_zlabel('Z (Heave)')
 
     # Draw some "axes" so it's clear where (0, 0, 0) is
     ax.plot((-max_rho, max_rho), (0, 0), (0, 0), c="black")
@@ -351,28 +3340,66 @@ def main(thrusters, resolution: int, max_current: int):
     ax.plot((0, 0), (0, 0), (-max_rho, max_rho), c="black")
 
     # Plot the locations and orientations of the thrusters
-    # NOTE: Consider merging this all into the function call below to avoid creating all these unwieldy variable names?
-    thrusterloc_x = [2 * thruster.pos[0] for thruster in thrusters]
-    thrusterloc_y = [2 * thruster.pos[1] for thruster in thrusters]
-    thrusterloc_z = [2 * thruster.pos[2] for thruster in thrusters]
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    ax.quiver(*(2 * thrusters.positions.transpose()), *(2 * thrusters.orientations.transpose()), color="black")
+    return ax
+
+
+def plot_envelope(thrusters: t.List[Thruster3D], points: np.ndarray, triangles: np.ndarray = None, output: str = None,
+                  envelope: str = "thrust", figure=None):
+    """
+    Plot a thrust or torque envelope along with the thrusters that produce it
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param points: Either an (A, B, 3) grid of points on the surface of the envelope, or a (P, 3) array of them
+    :param triangles: A (T, 3) array of indices into points for each triangle of the surface, if points isn't a grid
+    :param output: An image file to save the plot to instead of showing it in a window, the format is picked by the
+    file extension
+    :param envelope: "thrust" or "torque", which the axes are labelled for
+    :param figure: The window of plot_sweep_progress to plot in instead of a new one, when there's no output
+    """
+    import matplotlib
+    from matplotlib import cm
+    from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+
+    color_index = np.linalg.norm(points, axis=-1)  # Color the surface by the thrust at each point
 
-    thrusterdir_x = [2 * thruster.orientation[0] for thruster in thrusters]
-    thrusterdir_y = [2 * thruster.orientation[1] for thruster in thrusters]
-    thrusterdir_z = [2 * thruster.orientation[2] for thruster in thrusters]
+    max_rho = np.ceil(color_index.max())
 
-    ax.quiver(thrusterloc_x, thrusterloc_y, thrusterloc_z, thrusterdir_x, thrusterdir_y, thrusterdir_z, color="black")
+    norm = matplotlib.colors.Normalize(vmin=color_index.min(), vmax=color_index.max())
+
+    # Start plotting results
+    if output is None:
+        import matplotlib.pyplot as plt
+        matplotlib.use('TkAgg')
+        if figure is None:
+            fig = plt.figure()
+        else:
+            fig = figure
+            fig.clear()
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure()  # Not managed by pyplot, so no GUI backend gets set up and it works without a display
+
+    ax = _envelope_axes(fig, thrusters, max_rho, envelope)
 
     # Plot the zero-torque maximum thrust in each direction
     color_index_modified = (color_index - color_index.min()) / (color_index.max() - color_index.min())
-    ax.plot_surface(
-        mesh_x, mesh_y, mesh_z,
-        alpha=0.6, facecolors=cm.jet(color_index_modified), edgecolors='w', linewidth=0
-    )
+    if triangles is None:
+        ax.plot_surface(
+            points[..., 0], points[..., 1], points[..., 2],
+            alpha=0.6, facecolors=cm.jet(color_index_modified), linewidth=0
+        )
+    else:
+        # Each triangle gets the average color of its corners
+        ax.add_collection3d(Poly3DCollection(
+            points[triangles],
+            alpha=0.6, facecolors=cm.jet(color_index_modified[triangles].mean(axis=1)), edgecolors='w', linewidth=0
+        ))
 
     # Create a legend mapping the colors of the thrust plot to thrust values
     color_range = color_index.max() - color_index.min()
-    m = cm.ScalarMappable(cmap=plt.cm.jet, norm=norm)
-    plt.colorbar(m, ticks=[
+    m = cm.ScalarMappable(cmap=cm.jet, norm=norm)
+    fig.colorbar(m, ax=ax, ticks=[
         color_index.min(),
         color_index.min() + color_range/4,
         color_index.min() + color_range/2,
@@ -380,11 +3407,355 @@ def main(thrusters, resolution: int, max_current: int):
         color_index.max()
     ])
 
-    # Show plot
-    plt.show()
+    # Show or save plot
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output)
+
+
+def plot_sweep_progress(thrusters: t.List[Thruster3D], chunks: t.Iterator[SweepChunk], store: SweepStore,
+                        envelope: str = "thrust", max_preview: int = 4096):
+    """
+    Show a sweep in a window while it runs. The surface is redrawn from the directions solved so far every time their
+    number doubles, which with the coarse to fine order of iter_sweep starts as a rough outline of the whole envelope
+    and fills in from there. Closing the window stops the sweep.
+    :param thrusters: A ThrusterSet or list of Thruster3D objects representing the available thrusters
+    :param chunks: The results of sweep_to_store as they come in
+    :param store: The store they're written into, which the surface is drawn from
+    :param envelope: "thrust" or "torque", which the axes are labelled for
+    :param max_preview: Stop redrawing the surface past this many directions, since every redraw gets slower, and only
+    keep the count of solved directions in the title up to date
+    :return: The window to show the finished envelope in with plot_envelope, once every result is in the store. None
+    if the window was closed before the sweep was done.
+    """
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    from matplotlib import cm
+    from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+    from scipy.spatial import ConvexHull, QhullError
+
+    thrusters = ThrusterSet.from_thrusters(thrusters)
+    # Only the indices of the directions that can still make it into a preview are kept, the results stay in the store
+    solved = []
+
+    fig = plt.figure()
+    plt.show(block=False)
+    ax = None
+    count = 0
+    drawn = 0
+    for chunk in chunks:
+        count += len(chunk.indices)
+        if count == store.count:
+            break  # plot_envelope draws the finished envelope
+
+        triangles = None
+        if drawn < max_preview:
+            solved.append(chunk.indices)
+            if count >= max(4, 2 * drawn):
+                # Every direction is on the unit sphere, so the faces of the convex hull of the solved ones are a
+                # mesh of them, the same as for fibonacci_sphere. Until they're spread over more than one plane, like
+                # when the first ones are all in one column of a grid, there's nothing to draw yet.
+                indices = np.sort(np.concatenate(solved))
+                directions, rho = store.directions[indices].astype(float), store.rho[indices].astype(float)
+                try:
+                    triangles = ConvexHull(directions).simplices
+                except QhullError:
+                    pass
+
+        if triangles is not None:
+            fig.clear()
+            ax = _envelope_axes(fig, thrusters, np.ceil(rho.max()), envelope)
+            colors = (rho - rho.min()) / (np.ptp(rho) or 1)
+            ax.add_collection3d(Poly3DCollection(
+                directions[triangles] * rho[triangles][..., np.newaxis],
+                alpha=0.6, facecolors=cm.jet(colors[triangles].mean(axis=1)), edgecolors='w', linewidth=0
+            ))
+            drawn = count
+
+        if ax is not None:
+            ax.set_title(f"{count} of {store.count} directions")
+        plt.pause(.001)  # Let the window redraw and handle its events
+        if not plt.fignum_exists(fig.number):  # The user closed it, stop the sweep
+            chunks.close()
+            return None
+
+    return fig
+
+
+def save_envelope(output: str, points: np.ndarray, triangles: np.ndarray = None, **arrays):
+    """
+    Save a thrust or torque envelope to a .npz file for processing elsewhere
+    :param output: The file to save to
+    :param points: Either an (A, B, 3) grid of points on the surface of the envelope, or a (P, 3) array of them
+    :param triangles: A (T, 3) array of indices into points for each triangle of the surface, if points isn't a grid
+    :param arrays: Any other arrays to include, e.g. the directions and the thrust in each of them
+    """
+    if triangles is not None:
+        arrays["triangles"] = triangles
+    np.savez_compressed(output, points=points, **arrays)
+
+
+# The main entry point of the program
+# All the Click decorators define various options that can be passed in on the command line
+@click.command()
+@click.option("--thrusters", "-t", default="thrusters.json", help="file containing thruster specifications")
+@click.option("--resolution", "-r",
+              default=DEFAULT_RESOLUTION,
+              help="resolution of the thrust calculation, runtime is O(n^2) with respect to this!"
+)
+@click.option("--sphere", type=click.Choice(["latlong", "fibonacci", "icosphere"]), default="latlong",
+              help="how to spread the directions over the sphere, fibonacci and icosphere are near-uniform")
+@click.option("--max-current", "-c", default=DEFAULT_MAX_CURRENT, help="maximum thruster current draw in amps")
+@click.option("--jobs", "-j", default=1, help="number of processes to split the calculation between, 0 for all cores")
+@click.option("--solver", type=click.Choice(["auto", "highs", "linprog"]), default="auto",
+              help="LP solver to use, auto picks persistent HiGHS models when highspy is installed")
+@click.option("--symmetry/--no-symmetry", default=False,
+              help="only solve the directions that the symmetries of the thruster layout don't make redundant")
+@click.option("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory to cache results in for repeated runs")
+@click.option("--no-cache", is_flag=True, help="always recalculate, and don't store the results either")
+@click.option("--exact", is_flag=True,
+              help="plot the exact zero-torque thrust polytope instead of sampling it, ignores the current limit")
+@click.option("--adaptive", is_flag=True,
+              help="only refine the sphere where the surface is inaccurate, instead of sampling it uniformly")
+@click.option("--tolerance", default=.05, help="largest acceptable thrust error in kgf for --adaptive")
+@click.option("--incremental", is_flag=True,
+              help="start from the previous run of the same thrusters file, only re-solving directions that changed")
+@click.option("--output", "-o", type=click.Path(dir_okay=False),
+              help="write the envelope to a .npz, .png or .svg file instead of showing it in a window")
+@click.option("--no-plot", is_flag=True, help="don't render the envelope at all, for compute-only runs")
+@click.option("--batch", type=click.Path(exists=True, dir_okay=False),
+              help="evaluate every layout in a .jsonl or .npz file, writing one JSON line of metrics per layout to "
+                   "stdout or a .jsonl --output")
+@click.option("--envelopes", is_flag=True, help="include the thrust in every direction in the --batch results")
+@click.option("--optimize", type=click.Choice(OBJECTIVES),
+              help="search for the thruster orientations that maximize the minimum thrust, the envelope volume or "
+                   "the weighted surge, sway and heave thrust, and write them to stdout or a .json --output")
+@click.option("--weights", default="1,1,1", help="surge, sway and heave weights for --optimize axes")
+@click.option("--move-thrusters", type=float,
+              help="let --optimize also move each thruster up to this far from where it is along each axis")
+@click.option("--restarts", default=8, help="number of coarse --optimize searches, one per process")
+@click.option("--seed", type=int, help="random seed of the --optimize starting points")
+@click.option("--stats", is_flag=True, help="print timings of each phase and LP solver counters to stderr at the end")
+@click.option("--torque", is_flag=True,
+              help="plot the max roll, pitch and yaw torque at zero net force instead of the max thrust at zero torque")
+@click.option("--table", type=click.Path(dir_okay=False),
+              help="also save the envelope and the thrust of each thruster as a .npz lookup table, for querying with "
+                   "EnvelopeTable without solving LPs")
+@click.option("--store", type=click.Path(dir_okay=False),
+              help="write the sweep into a memory-mapped file chunk by chunk as it runs, and resume it from there if "
+                   "it was stopped, for sweeps too big for memory")
+@click.option("--store-dtype", type=click.Choice(["float32", "float64"]), default="float32",
+              help="precision of a new --store")
+def main(thrusters, resolution: int, sphere: str, max_current: int, jobs: int, solver: str, symmetry: bool,
+         cache_dir: str, no_cache: bool, exact: bool, adaptive: bool, tolerance: float, incremental: bool,
+         output: str, no_plot: bool, batch: str, envelopes: bool, optimize: str, weights: str, move_thrusters: float,
+         restarts: int, seed: int, stats: bool, torque: bool, table: str, store: str, store_dtype: str):
+    # This doc comment becomes the description text for the --help menu
+    """
+    tau - the thruster arrangement utility
+    """
+    if stats:
+        enable_stats()
+        started = time.perf_counter()
+
+        # Print the stats however main returns
+        def print_stats():
+            click.echo(format_stats(get_stats()), err=True)
+            click.echo(f"Total: {time.perf_counter() - started:.3f} s", err=True)
+        click.get_current_context().call_on_close(print_stats)
+
+    # Check the output format before spending any time on the calculation
+    output_format = None if output is None else os.path.splitext(output)[1].lower()
+    if optimize is not None:
+        if output_format not in (None, ".json"):
+            raise click.BadParameter("must be a .json file with --optimize", param_hint="--output")
+        try:
+            weights = [float(weight) for weight in weights.split(",")]
+        except ValueError:
+            raise click.BadParameter("must be three comma separated numbers", param_hint="--weights")
+        if len(weights) != 3:
+            raise click.BadParameter("must be three comma separated numbers", param_hint="--weights")
+    elif batch is not None:
+        if output_format not in (None, ".jsonl"):
+            raise click.BadParameter("must be a .jsonl file with --batch", param_hint="--output")
+        if exact or adaptive or incremental:
+            raise click.UsageError("--batch can't be used with --exact, --adaptive or --incremental")
+    elif output_format not in (None, ".npz", ".png", ".svg"):
+        raise click.BadParameter("must be a .npz, .png or .svg file", param_hint="--output")
+    if no_plot and output_format in (".png", ".svg"):
+        raise click.UsageError("--no-plot can't be used with an image --output")
+    if torque and (exact or batch is not None or optimize is not None):
+        raise click.UsageError("--torque can't be used with --exact, --batch or --optimize")
+    if table is not None:
+        if exact or adaptive or batch is not None or optimize is not None:
+            raise click.UsageError("--table can't be used with --exact, --adaptive, --batch or --optimize")
+        if os.path.splitext(table)[1].lower() != ".npz":
+            raise click.BadParameter("must be a .npz file", param_hint="--table")
+    if store is not None and (exact or adaptive or incremental or batch is not None or optimize is not None):
+        raise click.UsageError("--store can't be used with --exact, --adaptive, --incremental, --batch or --optimize")
+    envelope = "torque" if torque else "thrust"
+
+    if batch is not None:
+        directions, _ = sphere_directions(sphere, resolution)
+        results = batch_evaluate(read_layouts(batch), directions, max_current, jobs, solver, symmetry,
+                                 None if no_cache else cache_dir, envelopes)
+
+        # Write each result as soon as it's done, so they can be consumed while the rest of the batch is running
+        with click.open_file(output or "-", "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+        return
+
+    # Read the thruster transforms input JSON file
+    # Wrap this in a try-except FileNotFoundError block to print a nicer error message
+    thrusters_path = os.path.abspath(thrusters)
+    with open(thrusters) as f:  # `with` blocks allow you to open files safely without risking corrupting them on crash
+        thrusters_raw = json.load(f)
+
+    if optimize is not None:
+        layout, score = optimize_layout(thrusters_raw, optimize, weights, move_thrusters is not None,
+                                        move_thrusters or 0, restarts, resolution=resolution,
+                                        max_current=max_current, jobs=jobs, solver=solver, seed=seed)
+        click.echo(f"Best {optimize} score: {score:.4f}", err=True)
+        with click.open_file(output or "-", "w") as f:
+            json.dump(layout, f, indent=2)
+            f.write("\n")
+        return
+
+    # Convert loaded JSON data into a ThrusterSet
+    thrusters = load_thrusters(thrusters_raw)
+
+    cache = SweepCache(cache_dir)
+    figure = None  # The window a sweep was shown in while it ran
+
+    if exact:
+        # Compute the polytope once and plot its facets directly, rather than sampling it
+        try:
+            polytope = ZeroTorquePolytope(thrusters)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        points, triangles, arrays = polytope.vertices, polytope.triangles, {}
+    elif adaptive:
+        key = SweepCache.key(thrusters, {"mode": "adaptive", "envelope": envelope, "max_current": max_current,
+                                         "solver": solver, "use_symmetry": symmetry, "tolerance": tolerance})
+        cached = None if no_cache else cache.load(key, thrusters)
+        if cached is not None:
+            directions, rho, triangles = cached["directions"], cached["rho"], cached["triangles"]
+        else:
+            directions, rho, triangles = adaptive_sweep(thrusters, max_current, tolerance, jobs=jobs, solver=solver,
+                                                        use_symmetry=symmetry, envelope=envelope)
+            if not no_cache:
+                cache.store(key, thrusters, directions=directions, rho=rho, triangles=triangles)
+
+        points, arrays = directions * rho[:, np.newaxis], {"directions": directions, "rho": rho}
+    elif store is not None:
+        directions, triangles = sphere_directions(sphere, resolution)
+
+        # The store takes the place of the cache, so it's keyed the same way to tell whether it can be resumed
+        key = SweepCache.key(thrusters, {"mode": "store", "envelope": envelope, "max_current": max_current,
+                                         "solver": solver, "use_symmetry": symmetry}, directions)
+        if os.path.exists(store):
+            try:
+                results = SweepStore(store, writable=True)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+            if results.key != key:
+                raise click.ClickException(f"{store} holds a different sweep, delete it or use another file")
+        else:
+            results = SweepStore.create(store, directions.reshape(-1, 3), len(thrusters), key, store_dtype)
+
+        chunks = sweep_to_store(results, thrusters, max_current, jobs, solver, symmetry, envelope)
+        if output is None and not no_plot:
+            figure = plot_sweep_progress(thrusters, chunks, results, envelope)
+            if figure is None:
+                click.echo(f"Sweep stopped, {np.count_nonzero(results.chunk_flags)} of {results.num_chunks} chunks "
+                           f"are saved in {store}", err=True)
+                return
+        else:
+            for _ in chunks:
+                pass
+
+        # Straight from the file, so the allocations are only read if there's a table to write
+        rho = results.rho.astype(float).reshape(directions.shape[:-1])
+        if table is not None:
+            EnvelopeTable(directions, triangles, rho, results.allocations, envelope).save(table)
+
+        points, arrays = directions * rho[..., np.newaxis], {"directions": directions, "rho": rho}
+    else:
+        directions, triangles = sphere_directions(sphere, resolution)
+
+        # Calculate the max thrust in all of the directions at once, unless an earlier run already did
+        key = SweepCache.key(thrusters, {"mode": "sweep", "envelope": envelope, "max_current": max_current,
+                                         "solver": solver, "use_symmetry": symmetry}, directions)
+        # The previous run of this thruster file is remembered separately from the layout it had, so that after
+        # editing a thruster the next sweep can start from the old optimal bases
+        previous_key = SweepCache.key(None, {"mode": "previous", "thrusters": thrusters_path, "envelope": envelope,
+                                             "max_current": max_current, "solver": solver, "use_symmetry": symmetry},
+                                      directions)
+        cached = None if no_cache else cache.load(key, thrusters)
+        if cached is not None:
+            rho, bases, row_bases = cached["rho"], cached["bases"], cached["row_bases"]
+            allocations = cached["allocations"]
+        else:
+            previous = cache.load(previous_key, None) if incremental and not no_cache else None
+            if previous is not None and previous["bases"].shape == directions.shape[:-1] + (len(thrusters), 3):
+                rho, allocations, bases, row_bases, reused = incremental_sweep(
+                    thrusters, directions.reshape(-1, 3), previous["bases"].reshape(-1, len(thrusters), 3),
+                    previous["row_bases"].reshape(-1, 2, 6), max_current, jobs, solver, symmetry,
+                    return_allocations=True, return_bases=True, return_reused=True, envelope=envelope
+                )
+                click.echo(f"Reused {np.count_nonzero(reused)} of {reused.size} directions from the previous run",
+                           err=True)
+            elif output is None and not no_plot:
+                # Show the envelope filling in while the sweep runs, rather than nothing until it's done. The window
+                # draws from a temporary store the results go into, like with --store.
+                with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+                    results = SweepStore.create(os.path.join(directory, "sweep.taustore"),
+                                                directions.reshape(-1, 3), len(thrusters), dtype=np.float64)
+                    chunks = sweep_to_store(results, thrusters, max_current, jobs, solver, symmetry, envelope,
+                                            coarse_to_fine=True)
+                    figure = plot_sweep_progress(thrusters, chunks, results, envelope)
+                    if figure is not None:
+                        rho, allocations = np.array(results.rho), np.array(results.allocations)
+                        bases, row_bases = np.array(results.bases), np.array(results.row_bases)
+                    results.close()
+                if figure is None:
+                    click.echo("Sweep stopped", err=True)
+                    return
+            else:
+                rho, allocations, bases, row_bases = sweep_directions(
+                    thrusters, directions.reshape(-1, 3), max_current, jobs, solver, symmetry,
+                    return_allocations=True, return_bases=True, envelope=envelope
+                )
+            rho = rho.reshape(directions.shape[:-1])
+            bases = bases.reshape(directions.shape[:-1] + (len(thrusters), 3))
+            row_bases = row_bases.reshape(directions.shape[:-1] + (2, 6))
+            allocations = allocations.reshape(directions.shape[:-1] + (len(thrusters),))
+            if not no_cache:
+                cache.store(key, thrusters, rho=rho, bases=bases, row_bases=row_bases, allocations=allocations)
+
+        if incremental and not no_cache:
+            cache.store(previous_key, None, bases=bases, row_bases=row_bases)
+
+        if table is not None:
+            EnvelopeTable(directions, triangles, rho, allocations, envelope).save(table)
+
+        points, arrays = directions * rho[..., np.newaxis], {"directions": directions, "rho": rho}
+
+    if output_format == ".npz":
+        save_envelope(output, points, triangles, **arrays)
+    elif not no_plot:
+        timer = _start_timer()
+        plot_envelope(thrusters, points, triangles, output, envelope, figure)
+        _stop_timer("plot", timer)  # Includes the time the window was open for when there's no --output
 
     # Print max yaw, pitch, and roll
-    calc_max_yaw_pitch_roll(thrusters, torque_constraints)
+    torques = calc_max_yaw_pitch_roll(thrusters, max_current, solver)
+    for axis in ("roll", "pitch", "yaw"):
+        print(f"Max {axis}: {torques[axis]:.4f}, reverse: {torques['reverse_' + axis]:.4f}")
 
 
 if __name__ == "__main__":  # Only run the main function the program is being run directly, not imported
@@ -0,0 +1,37 @@
+"""
+Shared setup of the tau tests. The thruster layouts are the benchmark ones, see benchmarks/layouts.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TEST_DIR))
+
+import tau  # noqa: E402 (tau lives in the directory above)
+
+LAYOUT_DIR = os.path.join(os.path.dirname(TEST_DIR), "benchmarks", "layouts")
+
+
+def load_layout(name: str):
+    with open(os.path.join(LAYOUT_DIR, name + ".json")) as f:
+        return tau.ThrusterSet.from_thrusters(tau.load_thrusters(json.load(f)))
+
+
+@pytest.fixture(params=["8_vectored", "12_cube"])
+def thrusters(request):
+    """
+    The layouts with many equally good allocations, where tie breaking matters most
+    """
+    return load_layout(request.param)
+
+
+@pytest.fixture(scope="session")
+def directions():
+    return tau.icosphere(2)[0]
+
+
+def needs_highspy():
+    return pytest.mark.skipif(tau._import_highspy() is None, reason="highspy isn't installed")
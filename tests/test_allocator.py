@@ -0,0 +1,107 @@
+"""
+ThrustAllocator has to reach every wrench the thrusters can produce, scale the ones they can't down without turning
+them, and keep within the bounds and the current limit of the thrusters.
+"""
+import numpy as np
+import pytest
+
+import tau
+from conftest import load_layout
+
+TOLERANCE = 1e-8
+# High enough that the current limit never binds
+NO_CURRENT_LIMIT = 1e6
+
+
+def random_bounds(thrusters: tau.ThrusterSet, generator: np.random.Generator):
+    """
+    Give every thruster its own forward and reverse thrust limits
+    """
+    return tau.ThrusterSet(thrusters.positions, thrusters.orientations,
+                           thrusters.bounds * generator.uniform(.5, 1.5, thrusters.bounds.shape),
+                           thrusters.fwd_current, thrusters.rev_current)
+
+
+def current_draw(thrusters: tau.ThrusterSet, thrusts: np.ndarray):
+    """
+    The total current of some thrusts, with no current for thrusters that aren't thrusting
+    """
+    coefficients = np.where((thrusts >= 0)[:, np.newaxis], thrusters.fwd_current, thrusters.rev_current)
+    magnitudes = np.abs(thrusts)
+    powers = np.stack((magnitudes ** 2, magnitudes, np.ones(len(thrusts))), axis=1)
+    return np.sum(np.where(magnitudes > 0, np.einsum("nk,nk->n", coefficients, powers), 0))
+
+
+def test_reaches_producible_wrenches(thrusters):
+    generator = np.random.default_rng(0)
+    thrusters = random_bounds(thrusters, generator)
+    allocator = tau.ThrustAllocator(thrusters, NO_CURRENT_LIMIT)
+
+    # Wrenches of thrusts within bounds, some of them right at the edge of what the thrusters can do
+    allocations = generator.uniform(thrusters.bounds[:, 0], thrusters.bounds[:, 1], (50, len(thrusters)))
+    allocations[:10] = np.where(generator.random((10, len(thrusters))) < .5, *thrusters.bounds.transpose())
+    for wrench in allocations.dot(thrusters.wrenches.transpose()):
+        thrusts, produced = allocator.allocate(wrench, return_wrench=True)
+        np.testing.assert_allclose(produced, wrench, rtol=0, atol=TOLERANCE * max(1, np.abs(wrench).max()))
+        assert np.all(thrusts >= thrusters.bounds[:, 0] - TOLERANCE)
+        assert np.all(thrusts <= thrusters.bounds[:, 1] + TOLERANCE)
+
+
+def test_scales_down_unreachable_wrenches(thrusters):
+    generator = np.random.default_rng(1)
+    thrusters = random_bounds(thrusters, generator)
+    allocator = tau.ThrustAllocator(thrusters, NO_CURRENT_LIMIT)
+
+    fractions = []
+    for direction in generator.normal(size=(50, 6)):
+        scale = allocator.zonotope.max_along(direction)
+        wrench = 2 * scale * direction
+        thrusts, produced = allocator.allocate(wrench, return_wrench=True)
+        assert np.all(thrusts >= thrusters.bounds[:, 0] - TOLERANCE)
+        assert np.all(thrusts <= thrusters.bounds[:, 1] + TOLERANCE)
+
+        # The produced wrench points the same way, and is at most as far out as the edge of the zonotope. Falling a
+        # little short of it is allowed, see ThrustAllocator.
+        fraction = produced.dot(wrench) / wrench.dot(wrench)
+        np.testing.assert_allclose(produced, fraction * wrench, rtol=0, atol=TOLERANCE * np.abs(wrench).max())
+        fractions.append(2 * fraction)
+    assert np.all(np.array(fractions) <= 1 + TOLERANCE)
+    assert np.min(fractions) > .99 and np.mean(np.array(fractions) > 1 - TOLERANCE) > .5
+
+
+@pytest.mark.parametrize("max_current", [10, 20])
+def test_current_limit(thrusters, max_current):
+    generator = np.random.default_rng(2)
+    unlimited = tau.ThrustAllocator(thrusters, NO_CURRENT_LIMIT)
+    allocator = tau.ThrustAllocator(thrusters, max_current)
+
+    for wrench in generator.normal(size=(50, 6)):
+        unlimited_thrusts = unlimited.allocate(wrench)
+        thrusts = allocator.allocate(wrench)
+        # Every thrust is scaled down by the same amount, just far enough to be within the limit
+        multiplier = tau._current_limit_multiplier(unlimited_thrusts, max_current, thrusters.fwd_current,
+                                                   thrusters.rev_current)
+        np.testing.assert_allclose(thrusts, multiplier * unlimited_thrusts, rtol=0, atol=TOLERANCE)
+        if multiplier < 1:
+            assert current_draw(thrusters, thrusts) == pytest.approx(max_current, abs=1e-6)
+        else:
+            assert current_draw(thrusters, thrusts) <= max_current + 1e-6
+
+
+def test_pseudo_inverse_limit(monkeypatch):
+    # Pretend 8 thrusters are too many to precompute, so the pseudo-inverses are computed as they're used
+    thrusters = load_layout("8_vectored")
+    generator = np.random.default_rng(3)
+    wrenches = generator.normal(size=(200, 6)) * 10
+    expected = np.array([tau.ThrustAllocator(thrusters).allocate(wrench) for wrench in wrenches])
+
+    monkeypatch.setattr(tau.ThrustAllocator, "PRECOMPUTE_THRUSTERS", 4)
+    monkeypatch.setattr(tau.ThrustAllocator, "MAX_PSEUDO_INVERSES", 16)
+    allocator = tau.ThrustAllocator(thrusters)
+    assert len(allocator.pseudo_inverses) == len(thrusters) + 1  # All free, and all but one
+
+    thrusts = []
+    for wrench in wrenches:
+        thrusts.append(allocator.allocate(wrench))
+        assert len(allocator.pseudo_inverses) <= 16
+    np.testing.assert_allclose(thrusts, expected, rtol=0, atol=TOLERANCE)
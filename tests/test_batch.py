@@ -0,0 +1,23 @@
+"""
+A malformed layout in a batch has to be reported as that layout's error without stopping the rest of the batch.
+"""
+import json
+import os
+
+import tau
+from conftest import LAYOUT_DIR
+
+
+def test_malformed_line(tmp_path, directions):
+    with open(os.path.join(LAYOUT_DIR, "6_default.json")) as f:
+        layout = json.load(f)
+    path = tmp_path / "batch.jsonl"
+    path.write_text("\n".join([json.dumps(layout), '[{"x": 0,', "", json.dumps({"id": "last", "thrusters": layout})]))
+
+    layouts = list(tau.read_layouts(str(path)))
+    assert [layout_id for layout_id, _ in layouts] == [0, 1, "last"]
+    assert isinstance(layouts[1][1], ValueError) and "line 2" in str(layouts[1][1])
+
+    results = sorted(tau.batch_evaluate(layouts, directions), key=lambda result: result["index"])
+    assert results[1]["error"].startswith("ValueError: line 2 is not valid JSON")
+    assert "error" not in results[0] and results[2]["min_thrust"] == results[0]["min_thrust"]
@@ -0,0 +1,40 @@
+"""
+Layouts that only differ in the order their thrusters are listed in, or in which way round reversible thrusters are
+specified, share a SweepCache entry, which has to give the same results as sweeping them.
+"""
+import numpy as np
+
+import tau
+from test_symmetry import reverse_thrusters
+
+TOLERANCE = 1e-8
+SETTINGS = {"mode": "sweep", "max_current": tau.DEFAULT_MAX_CURRENT}
+
+
+def test_equivalent_layouts_share_entries(thrusters, directions, tmp_path):
+    cache = tau.SweepCache(str(tmp_path))
+    rho, allocations, bases, row_bases = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                              return_allocations=True, return_bases=True)
+    key = tau.SweepCache.key(thrusters, SETTINGS)
+    cache.store(key, thrusters, rho=rho, allocations=allocations, bases=bases, row_bases=row_bases)
+
+    reversed_thrusters = reverse_thrusters(thrusters, [0, 3])
+    equivalent = tau.ThrusterSet.from_thrusters([reversed_thrusters[i] for i in np.roll(range(len(thrusters)), 3)])
+    assert tau.SweepCache.key(equivalent, SETTINGS) == key
+    cached = cache.load(key, equivalent)
+
+    expected_rho, expected_allocations = tau.sweep_directions(equivalent, directions, tau.DEFAULT_MAX_CURRENT,
+                                                              return_allocations=True)
+    np.testing.assert_allclose(cached["rho"], expected_rho, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(cached["allocations"], expected_allocations, rtol=0, atol=TOLERANCE)
+    # The bases have to be renumbered and flipped along with the thrusters to still be optimal
+    _, reused = tau.incremental_sweep(equivalent, directions, cached["bases"], cached["row_bases"],
+                                      tau.DEFAULT_MAX_CURRENT, return_reused=True)
+    assert np.all(reused)
+
+
+def test_different_current_misses(thrusters):
+    # A thruster turned round without swapping its specs is a different thruster
+    reversed_only = tau.ThrusterSet(thrusters.positions, -thrusters.orientations, thrusters.bounds,
+                                    thrusters.fwd_current, thrusters.rev_current)
+    assert tau.SweepCache.key(reversed_only, SETTINGS) != tau.SweepCache.key(thrusters, SETTINGS)
@@ -0,0 +1,74 @@
+"""
+The results of a sweep have to depend only on the thrusters and the direction, not on the order the directions are
+solved in or on the solver, even where the min current LP has many equally good allocations.
+"""
+import numpy as np
+import pytest
+
+import tau
+from conftest import needs_highspy
+
+TOLERANCE = 1e-8
+
+
+@needs_highspy()
+def test_solve_order(thrusters, directions):
+    forward, forward_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                        solver="highs", return_allocations=True)
+    backward, backward_allocations = tau.sweep_directions(thrusters, directions[::-1], tau.DEFAULT_MAX_CURRENT,
+                                                          solver="highs", return_allocations=True)
+    np.testing.assert_allclose(backward[::-1], forward, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(backward_allocations[::-1], forward_allocations, rtol=0, atol=TOLERANCE)
+
+
+@needs_highspy()
+def test_solvers_agree(thrusters, directions):
+    highs, highs_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                    solver="highs", return_allocations=True)
+    linprog, linprog_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                        solver="linprog", return_allocations=True)
+    np.testing.assert_allclose(linprog, highs, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(linprog_allocations, highs_allocations, rtol=0, atol=TOLERANCE)
+
+
+@needs_highspy()
+@pytest.mark.parametrize("quadratic", [0, -.1])
+def test_linear_current(thrusters, directions, quadratic):
+    # Thrusters whose current draw isn't strictly convex in their thrust still have one least current allocation
+    current = [quadratic, 2.5, 0]
+    thrusters = tau.ThrusterSet(thrusters.positions, thrusters.orientations, thrusters.bounds, current, current)
+
+    highs, highs_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                    solver="highs", return_allocations=True)
+    backward, backward_allocations = tau.sweep_directions(thrusters, directions[::-1], tau.DEFAULT_MAX_CURRENT,
+                                                          solver="highs", return_allocations=True)
+    linprog, linprog_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                        solver="linprog", return_allocations=True)
+    assert np.all(highs > 0)
+    for rho, allocations in ((backward[::-1], backward_allocations[::-1]), (linprog, linprog_allocations)):
+        np.testing.assert_allclose(rho, highs, rtol=0, atol=TOLERANCE)
+        np.testing.assert_allclose(allocations, highs_allocations, rtol=0, atol=TOLERANCE)
+
+
+def test_least_current_allocation():
+    # Two identical thrusters in the same place: any split of the thrust between them is as good for the LP, but an
+    # even split draws the least current
+    thrusters = tau.ThrusterSet(np.array([[0., 0., .1], [0., 0., .1]]), np.array([[1., 0., 0.], [1., 0., 0.]]))
+    half_wrenches = np.empty((6, 4))
+    half_wrenches[:, 0::2] = thrusters.wrenches
+    half_wrenches[:, 1::2] = -thrusters.wrenches
+    costs, upper = thrusters.half_thrusters()
+
+    starts = np.array([[3., 0., 1., 0.], [1., 0., 3., 0.]])
+    for start in starts:
+        half_thrusts = tau._least_current_allocation(start, half_wrenches, costs, upper,
+                                                     *thrusters.half_thruster_current())
+        np.testing.assert_allclose(half_thrusts, [2., 0., 2., 0.], atol=1e-12)
+
+    # The same for both at once, starting from the LP's optimal vertices and knowing that only the forward
+    # half-thrusters are tied
+    starts = np.array([[3.71, 0., .29, 0.], [.29, 0., 3.71, 0.]])
+    half_thrusts = tau._least_current_allocation_batch(starts, half_wrenches, costs, upper,
+                                                       *thrusters.half_thruster_current(),
+                                                       np.tile([0., 1., 0., 1.], (2, 1)))
+    np.testing.assert_allclose(half_thrusts, [[2., 0., 2., 0.]] * 2, atol=1e-12)
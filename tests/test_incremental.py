@@ -0,0 +1,57 @@
+"""
+Reusing the bases of an earlier sweep after a thruster has changed has to give the same results as sweeping the new
+layout from scratch.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+import tau
+from conftest import LAYOUT_DIR, load_layout, needs_highspy
+
+TOLERANCE = 1e-8
+
+SOLVERS = ["linprog", pytest.param("highs", marks=needs_highspy())]
+
+
+def load_turned_layout(name: str, degrees: float):
+    """
+    Load a layout with its first thruster turned a little, as if it was being edited
+    """
+    with open(os.path.join(LAYOUT_DIR, name + ".json")) as f:
+        layout = json.load(f)
+    layout[0]["theta"] += degrees
+    return tau.ThrusterSet.from_thrusters(tau.load_thrusters(layout))
+
+
+@pytest.mark.parametrize("solver", SOLVERS)
+@pytest.mark.parametrize("name", ["8_vectored", "12_cube"])
+def test_incremental_matches_full_sweep(name, directions, solver):
+    _, _, bases, row_bases = tau.sweep_directions(load_layout(name), directions, tau.DEFAULT_MAX_CURRENT,
+                                                  solver=solver, return_allocations=True, return_bases=True)
+
+    thrusters = load_turned_layout(name, 2)
+    rho, allocations, reused = tau.incremental_sweep(thrusters, directions, bases, row_bases,
+                                                     tau.DEFAULT_MAX_CURRENT, solver=solver,
+                                                     return_allocations=True, return_reused=True)
+    full_rho, full_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT, solver=solver,
+                                                      return_allocations=True)
+
+    assert np.any(reused)
+    np.testing.assert_allclose(rho, full_rho, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(allocations, full_allocations, rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize("solver", SOLVERS)
+def test_unchanged_layout_reuses_every_basis(thrusters, directions, solver):
+    # The bases of the directions filled in from symmetric ones have to be renumbered correctly to still be optimal
+    rho, _, bases, row_bases = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT, solver=solver,
+                                                    use_symmetry=True, return_allocations=True, return_bases=True)
+
+    incremental_rho, reused = tau.incremental_sweep(thrusters, directions, bases, row_bases,
+                                                    tau.DEFAULT_MAX_CURRENT, solver=solver, return_reused=True)
+
+    assert np.all(reused)
+    np.testing.assert_allclose(incremental_rho, rho, rtol=0, atol=TOLERANCE)
@@ -0,0 +1,41 @@
+"""
+A sweep into a SweepStore that was stopped part of the way through has to carry on where it left off, and end up with
+the same results as sweeping every direction in one go.
+"""
+import numpy as np
+import pytest
+
+import tau
+
+TOLERANCE = 1e-8
+CHUNK_SIZE = 40
+
+
+@pytest.mark.parametrize("use_symmetry", [False, True])
+def test_resume(thrusters, directions, tmp_path, use_symmetry):
+    path = str(tmp_path / "sweep.taustore")
+    store = tau.SweepStore.create(path, directions, len(thrusters), dtype=np.float64, chunk_size=CHUNK_SIZE)
+    chunks = tau.sweep_to_store(store, thrusters, tau.DEFAULT_MAX_CURRENT)
+    for _ in chunks:
+        if np.count_nonzero(store.chunk_flags) >= 2:
+            break
+    chunks.close()
+    store.close()
+
+    store = tau.SweepStore(path, writable=True)
+    completed = store.completed()
+    assert 0 < np.count_nonzero(store.chunk_flags) < store.num_chunks
+
+    # The complete chunks come back first as they are, and only the rest is solved again, using the symmetries of the
+    # thrusters within the rest if asked to
+    chunks = list(tau.sweep_to_store(store, thrusters, tau.DEFAULT_MAX_CURRENT, use_symmetry=use_symmetry))
+    num_complete = np.count_nonzero(completed[::CHUNK_SIZE])
+    assert np.all(completed[np.concatenate([chunk.indices for chunk in chunks[:num_complete]])])
+    resolved = np.concatenate([chunk.indices for chunk in chunks[num_complete:]])
+    np.testing.assert_array_equal(np.sort(resolved), np.flatnonzero(~completed))
+    assert np.all(store.chunk_flags)
+
+    rho, allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT, return_allocations=True)
+    np.testing.assert_allclose(store.rho, rho, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(store.allocations, allocations, rtol=0, atol=TOLERANCE)
+    store.close()
@@ -0,0 +1,62 @@
+"""
+Sweeping only one direction of each set the symmetries of the thrusters make equivalent has to give the same results
+as sweeping every direction.
+"""
+import numpy as np
+import pytest
+
+import tau
+
+TOLERANCE = 1e-8
+
+
+@pytest.mark.parametrize("envelope", tau.ENVELOPES)
+def test_symmetry_matches_plain_sweep(thrusters, directions, envelope):
+    assert len(tau.find_symmetries(thrusters)) > 1  # Otherwise there's nothing to test
+
+    plain = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT, return_allocations=True,
+                                 envelope=envelope)
+    symmetric = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT, use_symmetry=True,
+                                     return_allocations=True, envelope=envelope)
+    for plain_result, symmetric_result in zip(plain, symmetric):
+        np.testing.assert_allclose(symmetric_result, plain_result, rtol=0, atol=TOLERANCE)
+
+
+def test_symmetric_iter_sweep(thrusters, directions):
+    plain_rho, plain_allocations = tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT,
+                                                        return_allocations=True)
+    rho = np.full(len(directions), np.nan)
+    allocations = np.full(plain_allocations.shape, np.nan)
+    for chunk in tau.iter_sweep(thrusters, directions, tau.DEFAULT_MAX_CURRENT, use_symmetry=True):
+        rho[chunk.indices] = chunk.rho
+        allocations[chunk.indices] = chunk.allocations
+
+    np.testing.assert_allclose(rho, plain_rho, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(allocations, plain_allocations, rtol=0, atol=TOLERANCE)
+
+
+def reverse_thrusters(thrusters: tau.ThrusterSet, indices):
+    """
+    Turn some thrusters round and swap their forward and reverse specs, which leaves them the same thrusters
+    """
+    reverse = np.isin(np.arange(len(thrusters)), indices)[:, np.newaxis]
+    return tau.ThrusterSet(thrusters.positions, np.where(reverse, -thrusters.orientations, thrusters.orientations),
+                           np.where(reverse, -thrusters.bounds[:, ::-1], thrusters.bounds),
+                           np.where(reverse, thrusters.rev_current, thrusters.fwd_current),
+                           np.where(reverse, thrusters.fwd_current, thrusters.rev_current))
+
+
+def test_reversed_thrusters(thrusters, directions):
+    # The symmetries map the reversed thrusters onto ones that aren't, which only works if they draw the same current
+    reversed_thrusters = reverse_thrusters(thrusters, [0, 3])
+    assert any(np.any(symmetry.signs < 0) for symmetry in tau.find_symmetries(reversed_thrusters))
+
+    plain = tau.sweep_directions(reversed_thrusters, directions, tau.DEFAULT_MAX_CURRENT, return_allocations=True)
+    symmetric = tau.sweep_directions(reversed_thrusters, directions, tau.DEFAULT_MAX_CURRENT, use_symmetry=True,
+                                     return_allocations=True)
+    for plain_result, symmetric_result in zip(plain, symmetric):
+        np.testing.assert_allclose(symmetric_result, plain_result, rtol=0, atol=TOLERANCE)
+
+    # And they're the same thrusters as before, so they can reach just as far
+    np.testing.assert_allclose(plain[0], tau.sweep_directions(thrusters, directions, tau.DEFAULT_MAX_CURRENT),
+                               rtol=0, atol=TOLERANCE)
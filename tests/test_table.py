@@ -0,0 +1,78 @@
+"""
+Looking directions up in an EnvelopeTable has to give the same blend as going through every triangle of its mesh.
+"""
+import numpy as np
+import pytest
+
+import tau
+
+TOLERANCE = 1e-9
+NUM_THRUSTERS = 4
+
+
+def make_table(sphere: str, resolution: int, generator: np.random.Generator):
+    """
+    Make a table of random values that only depend on the direction, like a sweep's, since some meshes (like the
+    poles and the seam of a latitude/longitude grid) have the same direction more than once
+    """
+    directions, triangles = tau.sphere_directions(sphere, resolution)
+    coefficients = generator.normal(size=(3, 3, NUM_THRUSTERS + 1))
+    values = np.einsum("...i,...j,ijk->...k", directions, directions, coefficients)
+    return tau.EnvelopeTable(directions, triangles, 2 + values[..., 0], values[..., 1:])
+
+
+def brute_force_query(table: tau.EnvelopeTable, directions: np.ndarray):
+    """
+    Blend the corners of the triangle each direction is furthest inside of, out of every triangle of the mesh
+    """
+    directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+    coefficients = np.einsum("tij,mj->mti", table.inverses, directions)  # MxTx3
+    triangles = coefficients.min(axis=2).argmax(axis=1)
+    weights = coefficients[np.arange(len(directions)), triangles]
+    weights /= weights.sum(axis=1, keepdims=True)
+    corners = table.triangles[triangles]
+    return (np.einsum("mi,mi->m", weights, table.rho[corners]),
+            np.einsum("mi,min->mn", weights, table.allocations[corners]))
+
+
+@pytest.mark.parametrize("sphere, resolution", [("latlong", 8), ("latlong", 40), ("icosphere", 20),
+                                                ("fibonacci", 40)])
+def test_table_matches_brute_force(sphere, resolution):
+    generator = np.random.default_rng(0)
+    table = make_table(sphere, resolution, generator)
+
+    queries = generator.normal(size=(500, 3))
+    queries = np.concatenate((queries, table.directions, np.eye(3), -np.eye(3)))  # Corners and axes too
+    rho, allocations = table.query(queries, return_allocations=True)
+    expected_rho, expected_allocations = brute_force_query(table, queries)
+
+    np.testing.assert_allclose(rho, expected_rho, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(allocations, expected_allocations, rtol=0, atol=TOLERANCE)
+    # The corners are in the table exactly
+    np.testing.assert_allclose(table.query(table.directions), table.rho, rtol=0, atol=TOLERANCE)
+
+
+def test_single_query_matches_batch():
+    generator = np.random.default_rng(1)
+    table = make_table("icosphere", 20, generator)
+    queries = generator.normal(size=(50, 3))
+
+    rho, allocations = table.query(queries, return_allocations=True)
+    for query, expected_rho, expected_allocations in zip(queries, rho, allocations):
+        single_rho, single_allocations = table.query(query, return_allocations=True)
+        assert single_rho == pytest.approx(expected_rho, abs=TOLERANCE)
+        np.testing.assert_allclose(single_allocations, expected_allocations, rtol=0, atol=TOLERANCE)
+
+    assert np.isnan(table.query((0, 0, 0)))
+    assert np.isnan(table.query(np.zeros((2, 3)))).all()
+
+
+def test_save_and_load(tmp_path):
+    generator = np.random.default_rng(2)
+    table = make_table("latlong", 20, generator)
+    path = str(tmp_path / "table.npz")
+    table.save(path)
+
+    queries = generator.normal(size=(100, 3))
+    # The values are saved in single precision
+    np.testing.assert_allclose(tau.EnvelopeTable.load(path).query(queries), table.query(queries), rtol=1e-6)
@@ -0,0 +1,24 @@
+"""
+A ThrusterSet has to behave like the list of Thruster3D objects it replaces.
+"""
+import numpy as np
+
+import tau
+from conftest import load_layout
+
+
+def test_slice():
+    thrusters = load_layout("12_cube")
+    as_list = list(thrusters)
+
+    for index in (slice(4), slice(2, -3), slice(None, None, -2), slice(20, None)):
+        sliced = thrusters[index]
+        assert isinstance(sliced, tau.ThrusterSet)
+        assert len(sliced) == len(as_list[index])
+        for thruster, expected in zip(sliced, as_list[index]):
+            np.testing.assert_array_equal(thruster.pos, expected.pos)
+            np.testing.assert_array_equal(thruster.orientation, expected.orientation)
+            np.testing.assert_array_equal(thruster.max_thrusts, expected.max_thrusts)
+            np.testing.assert_array_equal(thruster.fwd_current, expected.fwd_current)
+            np.testing.assert_array_equal(thruster.rev_current, expected.rev_current)
+        np.testing.assert_array_equal(sliced.wrenches, thrusters.wrenches[:, index])
@@ -0,0 +1,66 @@
+"""
+The wrench zonotope has to agree with the LPs it replaces about how far every wrench can be pushed.
+"""
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+import tau
+from conftest import load_layout
+
+TOLERANCE = 1e-6
+# High enough that the current limit, which the zonotope ignores, never binds
+NO_CURRENT_LIMIT = 1e6
+
+
+def lp_max_along(thrusters, direction, base):
+    """
+    Solve for the largest t with base + t * direction within reach of the thrusters, the slow way
+    """
+    wrenches = thrusters.wrenches  # 6xN
+    result = linprog(
+        c=np.append(np.zeros(len(thrusters)), -1),  # Maximize t
+        A_eq=np.concatenate((wrenches, -np.asarray(direction)[:, np.newaxis]), axis=1),
+        b_eq=base,
+        bounds=[tuple(bounds) for bounds in thrusters.bounds] + [(None, None)],
+        method="highs"
+    )
+    return -result.fun if result.status == 0 else np.nan
+
+
+@pytest.mark.parametrize("envelope", tau.ENVELOPES)
+def test_zonotope_matches_sweep(thrusters, directions, envelope):
+    zonotope = tau.WrenchZonotope(thrusters)
+    rho = tau.sweep_directions(thrusters, directions, NO_CURRENT_LIMIT, envelope=envelope)
+
+    zero = np.zeros((len(directions), 3))
+    wrench_directions = np.concatenate((directions, zero) if envelope == "thrust" else (zero, directions), axis=1)
+    # The sweeps keep the same 0.1% margin as get_max_thrust
+    np.testing.assert_allclose(.999 * zonotope.max_along(wrench_directions), rho, rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize("name", ["8_vectored", "12_cube", "4_tetrahedron"])
+def test_zonotope_matches_lp(name):
+    # 4_tetrahedron can't produce every wrench, so its zonotope is flat
+    thrusters = load_layout(name)
+    zonotope = tau.WrenchZonotope(thrusters)
+    generator = np.random.default_rng(0)
+
+    # Bases the thrusters can produce and directions to push them in, plus a base that's out of reach
+    allocations = generator.uniform(thrusters.bounds[:, 0], thrusters.bounds[:, 1], (20, len(thrusters)))
+    bases = allocations.dot(thrusters.wrenches.transpose())
+    wrench_directions = generator.normal(size=(20, 6))
+    wrench_directions[:10] = bases[:10]  # How far producible wrenches can be scaled up
+    bases[:10] = 0
+    bases[-1] = zonotope.center + 2 * zonotope.support[0] * zonotope.normals[0]
+
+    expected = np.array([lp_max_along(thrusters, direction, base)
+                         for direction, base in zip(wrench_directions, bases)])
+    distances = zonotope.max_along(wrench_directions, bases)
+    assert np.isnan(distances[-1])
+    np.testing.assert_allclose(distances, expected, rtol=0, atol=TOLERANCE)
+
+    # The wrench where each direction leaves the zonotope is on its edge
+    edges = bases[:-1] + distances[:-1, np.newaxis] * wrench_directions[:-1]
+    assert np.all(zonotope.contains(edges, tolerance=TOLERANCE))
+    assert not np.any(zonotope.contains(edges + 1e-3 * wrench_directions[:-1]))